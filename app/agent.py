@@ -1,39 +1,44 @@
 from .orchestrator_adapter import execute_workflow
-from .trace import get_trace
+from datetime import datetime, timezone
+from .trace import get_trace, trace_context
+from .stage_metrics import QUERIES, current_intent, inc, intent_scope, timed
+from .otel import set_attributes
 from .config import settings
 from .schemas import QueryResponse, TraceItem
 
-def _compact_trace(nodes, last_n: int):
-    sl = nodes[-last_n:]
+def _compact_trace(nodes):
     compact = []
-    for n in sl:
+    for n in nodes:
         compact.append(TraceItem(
-            ts=n.get('ts'),
-            node_id=n.get('node_id'),
-            node_type=n.get('node_type'),
-            tool=n.get('tool'),
-            decision_rule=n.get('decision_rule'),
-            confidence=n.get('confidence'),
-        ).dict())
+            timestamp=datetime.fromtimestamp(n['timestamp'], timezone.utc).isoformat(),
+            step=f"{n['component']}:{n['event_type']}",
+            data={'actor': n.get('actor'), 'prompt_name': n.get('prompt_name'),
+                  'confidence': n.get('confidence')},
+        ).model_dump())
     return compact
 
 def handle_query(query: str, user_id: str = None):
-    res = execute_workflow(query, user_id)
+    # One trace per request: every record_prov below picks this id up
+    with trace_context() as trace_id, intent_scope(), timed('request', 'query') as timer:
+        set_attributes({'agent.trace_id': trace_id, 'agent.user_id': user_id})
+        res = execute_workflow(query, user_id)
+        status = res.get('status', 'done')
+        timer.status = 'error' if status == 'error' else 'ok'
+        inc(QUERIES, intent=current_intent(), status=status, cached=str(bool(res.get('cached'))).lower())
     # Build standardized response
-    status = res.get('status', 'done')
     summary = res.get('answer', '')
     data = res.get('data', {})
     # Attach a short inline trace to the response (configurable)
-    try:
-        trace = _compact_trace(get_trace(), last_n=settings.TRACE_COMPACT_LAST_N)
-    except Exception:
-        trace = res.get('trace', []) or []
+    trace = _compact_trace(get_trace(trace_id, last_n=settings.compact_trace_length)) or res.get('trace', []) or []
     return QueryResponse(
     session_id=user_id,               # or p.session_id if that’s your request model
     response=summary or "",           # whatever the main textual output is
     status=status,
     summary=summary,
     data=data,
-    trace=trace
+    trace=trace,
+    trace_id=trace_id,
+    cached=res.get('cached', False),
+    cache_age_seconds=res.get('cache_age_seconds'),
 ).model_dump()
 
@@ -0,0 +1,180 @@
+"""
+Answer Cache
+------------
+Post-routing cache of final workflow answers.
+
+Entries are keyed by (intent, canonical entities, prompt/model version) so that
+e.g. `metrics_lookup(payments, 5m)` is answered once per TTL for every user.
+TTLs are configured per intent; once an entry expires it is still served for a
+short stale window while a single background refresh recomputes it
+(stale-while-revalidate).
+"""
+
+import contextvars
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import settings
+
+
+@dataclass
+class CacheEntry:
+    value: Dict[str, Any]
+    stored_at: float
+    ttl: float
+
+
+def _canonical(value: Any) -> Any:
+    """Normalize entity values so equivalent requests share a key."""
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in sorted(value.items()) if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        # Order is meaningful for targets (diff = a - b), so keep it
+        return [_canonical(v) for v in value]
+    return value
+
+
+def model_version() -> str:
+    """Prompt + model identifier; answers from a different prompt/model never collide."""
+    model = os.path.basename(settings.ggml_model_path or "") or "fallback"
+    return f"{settings.prompt_version}:{model}"
+
+
+def make_key(intent: str, entities: Optional[Dict[str, Any]], query: Optional[str] = None) -> Hashable:
+    """Build the cache key for a routed request."""
+    ents = _canonical(entities or {})
+    if intent == "knowledge_lookup" and query:
+        # Knowledge answers depend on the full question, not just extracted entities
+        ents["query"] = " ".join(query.lower().split())
+    return (intent, json.dumps(ents, sort_keys=True, default=str), model_version())
+
+
+class AnswerCache:
+    """Thread-safe LRU answer cache with per-intent TTL and stale-while-revalidate."""
+
+    def __init__(self,
+                 ttls: Dict[str, float],
+                 stale_seconds: float = 0.0,
+                 max_entries: int = 1024,
+                 clock: Callable[[], float] = time.monotonic,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        self.ttls = dict(ttls)
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._executor = executor
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def ttl_for(self, intent: Optional[str]) -> float:
+        return float(self.ttls.get(intent or "", 0.0))
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[CacheEntry], Optional[str]]:
+        """Return (entry, state) where state is 'fresh', 'stale' or None on miss."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            age = now - entry.stored_at
+            if age < entry.ttl:
+                self._entries.move_to_end(key)
+                return entry, "fresh"
+            if age < entry.ttl + self.stale_seconds:
+                self._entries.move_to_end(key)
+                return entry, "stale"
+            del self._entries[key]
+            return None, None
+
+    def store(self, key: Hashable, intent: str, value: Dict[str, Any]) -> None:
+        ttl = self.ttl_for(intent)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = CacheEntry(copy.deepcopy(value), self._clock(), ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "stale_hits": self.stale_hits, "misses": self.misses}
+
+    def _revalidate(self, key: Hashable, intent: str, compute: Callable[[], Dict[str, Any]]) -> None:
+        try:
+            result = compute()
+            if result.get("status") == "done":
+                self.store(key, intent, result)
+        except Exception as e:
+            print(f"[AnswerCache] Revalidation failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: Hashable, intent: str, compute: Callable[[], Dict[str, Any]]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="answer-cache")
+        ctx = contextvars.copy_context()
+        self._executor.submit(ctx.run, self._revalidate, key, intent, compute)
+
+    def _serve(self, entry: CacheEntry) -> Dict[str, Any]:
+        value = copy.deepcopy(entry.value)
+        value["cached"] = True
+        value["cache_age_seconds"] = round(self._clock() - entry.stored_at, 3)
+        return value
+
+    def get_or_compute(self,
+                       intent: str,
+                       entities: Optional[Dict[str, Any]],
+                       query: Optional[str],
+                       compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Serve a cached answer for the routed request, computing it on a miss.
+
+        Only completed answers (status == 'done') are stored; clarifications and
+        errors always go through the full workflow.
+        """
+        if self.ttl_for(intent) <= 0:
+            return compute()
+        key = make_key(intent, entities, query)
+        entry, state = self.lookup(key)
+        if state == "fresh":
+            self.hits += 1
+            return self._serve(entry)
+        if state == "stale":
+            self.stale_hits += 1
+            self._schedule_refresh(key, intent, compute)
+            return self._serve(entry)
+        self.misses += 1
+        result = compute()
+        if isinstance(result, dict) and result.get("status") == "done":
+            self.store(key, intent, result)
+        return result
+
+
+answer_cache = AnswerCache(
+    ttls=settings.answer_cache_ttl_seconds,
+    stale_seconds=settings.answer_cache_stale_seconds,
+    max_entries=settings.answer_cache_max_entries,
+)
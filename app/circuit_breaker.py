@@ -0,0 +1,207 @@
+"""
+Circuit Breakers & Retry Budgets
+--------------------------------
+Per-tool failure isolation for outbound tool calls.
+
+Each tool in DEFAULT_TOOL_REGISTRY gets a circuit breaker
+(closed -> open -> half_open -> closed) and a token-bucket retry budget.
+Open breakers fail fast with CircuitOpenError so callers go straight to their
+fallback path, and retries are only spent while the budget has tokens, so an
+outage cannot multiply upstream load by the retry count.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .config import settings
+from .tools.registry import DEFAULT_TOOL_REGISTRY, ToolMeta
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BACKOFF_CAP_SECONDS = 5.0
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a tool whose breaker is open."""
+
+    def __init__(self, tool: str, retry_after: float):
+        super().__init__(f"circuit open for {tool}; retry after {retry_after:.1f}s")
+        self.tool = tool
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._half_open_in_flight = 0
+        self.total_opens = 0
+        self.rejected = 0
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            print(f"[CircuitBreaker] {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def retry_after(self) -> float:
+        if self.state != OPEN or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; moves open -> half_open once the reset timeout elapses."""
+        with self._lock:
+            if self.state == OPEN:
+                if self._clock() - (self.opened_at or 0.0) < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._transition(HALF_OPEN)
+                self._half_open_in_flight = 0
+            if self.state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self._half_open_in_flight += 1
+            return True
+
+    def release(self) -> None:
+        """Give back an admission whose outcome will never be recorded (e.g. a cancelled call)."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self._half_open_in_flight = 0
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.total_opens += 1
+                self._transition(OPEN)
+                self.opened_at = self._clock()
+                self._half_open_in_flight = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_after_seconds": round(self.retry_after(), 3),
+                "total_opens": self.total_opens,
+                "rejected": self.rejected,
+            }
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of traffic.
+
+    Every first attempt deposits `ratio` tokens and the bucket also refills at
+    `min_per_second`, so low-traffic tools can still retry; each retry spends
+    one token.
+    """
+
+    def __init__(self,
+                 ratio: float = 0.2,
+                 min_per_second: float = 1.0,
+                 capacity: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = capacity
+        self._last = clock()
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.min_per_second)
+        self._last = now
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.exhausted += 1
+            return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {"tokens": round(self._tokens, 3), "capacity": self.capacity, "exhausted": self.exhausted}
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: float = BACKOFF_CAP_SECONDS) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    base = settings.http_backoff_base if base is None else base
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_budgets: Dict[str, RetryBudget] = {}
+
+
+def get_breaker(tool_meta: ToolMeta) -> CircuitBreaker:
+    with _lock:
+        breaker = _breakers.get(tool_meta.key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                tool_meta.key,
+                failure_threshold=tool_meta.failure_threshold,
+                reset_timeout=tool_meta.reset_timeout_seconds,
+                half_open_max_calls=settings.breaker_half_open_max_calls,
+            )
+            _breakers[tool_meta.key] = breaker
+        return breaker
+
+
+def get_retry_budget(tool_meta: ToolMeta) -> RetryBudget:
+    with _lock:
+        budget = _budgets.get(tool_meta.key)
+        if budget is None:
+            budget = RetryBudget(
+                ratio=settings.retry_budget_ratio,
+                min_per_second=settings.retry_budget_min_per_second,
+                capacity=settings.retry_budget_capacity,
+            )
+            _budgets[tool_meta.key] = budget
+        return budget
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Breaker + retry budget state for every registered tool (for /breakers and alerting)."""
+    return {
+        key: {**get_breaker(meta).snapshot(), "retry_budget": get_retry_budget(meta).snapshot()}
+        for key, meta in DEFAULT_TOOL_REGISTRY.items()
+    }
@@ -9,7 +9,7 @@ Environment variables override defaults (via .env).
 
 from pydantic_settings import BaseSettings
 from pydantic import Field, AnyHttpUrl
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -51,6 +51,26 @@ class Settings(BaseSettings):
     metrics_mock_port: int = Field(9000, description="Local port for metrics mock service")
     docs_mock_port: int = Field(9010, description="Local port for docs mock service")
     agent_port: int = Field(8000, description="Port for main agent service")
+    metrics_mock_host: str = Field("localhost", description="Host of the metrics service")
+    docs_mock_host: str = Field("localhost", description="Host of the docs service")
+    docs_index_refresh_seconds: float = Field(
+        30.0, description="Docs service: how often /search re-checks seed docs for changes"
+    )
+    docs_search_max_limit: int = Field(50, description="Docs service: max /search page size")
+
+    # ----------------------------------------------------------------------
+    # Outbound HTTP (shared pooled clients in app/tool_broker.py)
+    http_timeout_seconds: float = Field(5.0, description="Default timeout when a call has no ToolMeta")
+    http_connect_timeout_seconds: float = Field(2.0, description="Upper bound on TCP/TLS connect time")
+    http_backoff_base: float = Field(0.3, description="Base delay in seconds for retry backoff")
+    http_max_connections_per_host: int = Field(20, description="Connection pool size per upstream host")
+    http_max_keepalive_connections: int = Field(10, description="Idle keep-alive connections kept per host")
+    http_keepalive_expiry_seconds: float = Field(30.0, description="Idle time before a pooled connection is closed")
+    http2_enabled: bool = Field(False, description="Negotiate HTTP/2 when the h2 package is installed")
+    breaker_half_open_max_calls: int = Field(1, description="Probe calls allowed while a breaker is half-open")
+    retry_budget_ratio: float = Field(0.2, description="Retry tokens earned per first attempt (retries as a share of traffic)")
+    retry_budget_min_per_second: float = Field(1.0, description="Retry tokens refilled per second regardless of traffic")
+    retry_budget_capacity: float = Field(10.0, description="Maximum retry tokens a tool can bank")
 
     # ----------------------------------------------------------------------
     # Agent / router thresholds
@@ -61,6 +81,18 @@ class Settings(BaseSettings):
     default_p95_threshold_ms: int = Field(500, description="Default p95 latency threshold for metrics")
     compact_trace_length: int = Field(3, description="Compact trace size for summarization")
 
+    # ----------------------------------------------------------------------
+    # Answer cache (post-routing)
+    answer_cache_enabled: bool = Field(True, description="Serve repeated routed requests from the answer cache")
+    answer_cache_ttl_seconds: Dict[str, float] = Field(
+        default_factory=lambda: {"metrics_lookup": 10.0, "knowledge_lookup": 6 * 3600.0, "calc_compare": 60.0},
+        description="Per-intent answer TTL in seconds (0 disables caching for that intent)"
+    )
+    answer_cache_stale_seconds: float = Field(
+        30.0, description="Grace period after expiry where stale answers are served while revalidating"
+    )
+    answer_cache_max_entries: int = Field(1024, description="Maximum number of cached answers")
+
     # ----------------------------------------------------------------------
     # External / API configuration
     service_catalog: str = Field(
@@ -72,6 +104,44 @@ class Settings(BaseSettings):
         description="Allowlisted outbound domains"
     )
 
+    # ----------------------------------------------------------------------
+    # Metrics store (app/tools/metrics_store.py)
+    metrics_source: str = Field(
+        "http", description="Where call_metrics reads from: 'http' (metrics service) or 'inprocess' (local store)"
+    )
+    metrics_rollup_resolutions: List[int] = Field(
+        default_factory=lambda: [60, 300, 3600, 86400],
+        description="Rollup bucket widths in seconds (1m, 5m, 1h, 1d); each a multiple of the previous"
+    )
+    metrics_rollup_retention_buckets: List[int] = Field(
+        default_factory=lambda: [1440, 2016, 720, 400],
+        description="Buckets kept per rollup tier (1d of 1m, 7d of 5m, 30d of 1h, ~13 months of 1d)"
+    )
+    metrics_sketch_relative_accuracy: float = Field(
+        0.02, description="Relative error bound of the latency quantile sketches"
+    )
+    metrics_ingest_queue_batches: int = Field(256, description="Bounded ingest queue size, in batches")
+    metrics_ingest_batch_rows: int = Field(5000, description="Rows grouped into one ingest batch")
+    metrics_ingest_put_timeout_seconds: float = Field(
+        1.0, description="How long ingest waits on a full queue before answering 429"
+    )
+    metrics_seed_synthetic: bool = Field(True, description="Backfill synthetic traffic when the metrics service starts")
+
+    # ----------------------------------------------------------------------
+    # Local SQLite (util_sql)
+    local_db_path: str = Field("local_agent.db", description="SQLite database used by the util_sql tool")
+    sqlite_pool_size: int = Field(4, description="Worker threads (each with its own connections) for async SQL")
+    sqlite_statement_cache_size: int = Field(256, description="Prepared statements kept per connection (LRU)")
+    sqlite_mmap_size_bytes: int = Field(256 * 1024 * 1024, description="PRAGMA mmap_size for pooled connections")
+    sqlite_cache_size_kib: int = Field(16 * 1024, description="PRAGMA cache_size (page cache) in KiB")
+    sql_cache_enabled: bool = Field(True, description="Cache read-only util_sql results until their tables change")
+    sql_cache_max_bytes: int = Field(8 * 1024 * 1024, description="Approximate byte bound of the SQL result cache")
+    sql_record_live_metrics: bool = Field(True, description="Record fetched p95/p99 into the service latency summary table")
+    sql_record_batch_rows: int = Field(64, description="Buffered live p95/p99 readings written to SQLite in one insert")
+    sql_record_flush_seconds: float = Field(
+        5.0, description="Write buffered live readings once the oldest has waited this long (also flushed on shutdown)"
+    )
+
     # ----------------------------------------------------------------------
     # Data and RAG configuration
     seed_data_path: str = Field(
@@ -79,8 +149,59 @@ class Settings(BaseSettings):
         description="Path to seed documents for vector embeddings"
     )
     embeddings_reindex_interval_hours: int = Field(
-        24, description="Reindexing interval for RAG vector store"
+        24, description="Reindexing interval for RAG vector store (0 disables the background reindexer)"
+    )
+    index_manifest_path: str = Field(
+        "data/index_manifest.json", description="Content hashes / point ids of the indexed docs"
+    )
+    qdrant_collection: str = Field("agent_docs", description="Qdrant collection holding the seeded docs")
+    qdrant_health_ttl_seconds: float = Field(10.0, description="How long a Qdrant health check result is reused")
+    qdrant_prefer_grpc: bool = Field(True, description="Search over gRPC when qdrant-client is installed (else REST)")
+    qdrant_grpc_port: int = Field(6334, description="Qdrant gRPC port")
+    qdrant_on_disk: bool = Field(False, description="Keep original vectors and HNSW graph on disk (mmap)")
+    qdrant_quantization: str = Field("none", description="none | scalar (int8) | product (x16) vector quantization")
+    qdrant_hnsw_m: int = Field(16, description="HNSW edges per node for new collections")
+    qdrant_hnsw_ef_construct: int = Field(100, description="HNSW build-time candidate list size")
+    qdrant_search_hnsw_ef: int = Field(0, description="HNSW search-time candidate list size (0 = server default)")
+    qdrant_search_oversampling: float = Field(
+        2.0, description="Candidates fetched per hit and rescored with full vectors when quantized"
+    )
+    embedding_model: str = Field("all-MiniLM-L6-v2", description="sentence-transformers model used for embeddings")
+    embedding_backend: str = Field(
+        "auto", description="auto | sentence_transformers | hashing (hashing needs no model download)"
+    )
+    embedding_dim: int = Field(384, description="Vector size of the hashing embedder")
+    embedding_cache_enabled: bool = Field(True, description="Reuse embeddings of previously seen texts from disk")
+    embedding_cache_path: str = Field(
+        "data/embedding_cache", description="Directory of the memory-mapped embedding cache (one subdir per model)"
+    )
+    embedding_cache_dtype: str = Field("float16", description="float16 | float32 storage for cached vectors")
+    embedding_cache_max_entries: int = Field(
+        1_000_000, description="Stop adding vectors to the embedding cache past this many (0 = unbounded)"
+    )
+    vector_index_path: str = Field(
+        "data/vector_index", description="Directory of the memory-mapped in-process ANN index"
     )
+    sparse_index_path: str = Field(
+        "data/sparse_index", description="Directory of the memory-mapped BM25 sparse inverted index"
+    )
+    vector_index_lists: int = Field(0, description="IVF lists for the local index (0 = sqrt(n_vectors))")
+    vector_index_nprobe: int = Field(4, description="IVF lists scanned per query")
+    hybrid_retrieval_enabled: bool = Field(True, description="Fuse BM25 and dense search results (RRF) for lookups")
+    hybrid_rrf_k: int = Field(60, description="Reciprocal rank fusion constant k")
+    hybrid_candidates: int = Field(20, description="Candidates taken from each of BM25 / dense before fusion")
+    hybrid_min_term_coverage: float = Field(
+        0.6, description="Share of non-stopword query terms the BM25 top hit must contain to be accepted on keywords"
+    )
+    content_store_path: str = Field(
+        "data/content_store", description="Full chunk texts, fetched by point id (payloads only carry snippets)"
+    )
+    snippet_chars: int = Field(300, description="Length of the snippet precomputed into search payloads")
+    chunk_max_tokens: int = Field(200, description="Max words per indexed chunk")
+    chunk_overlap_tokens: int = Field(40, description="Words shared by consecutive chunks of a document")
+    index_batch_size: int = Field(64, description="Chunks per embedding batch / Qdrant upsert")
+    index_embed_workers: int = Field(2, description="Batches embedded concurrently while indexing")
+    index_max_inflight_upserts: int = Field(4, description="Qdrant upserts outstanding at once while indexing")
 
     # ----------------------------------------------------------------------
     # Observability & telemetry
@@ -88,7 +209,32 @@ class Settings(BaseSettings):
     otel_exporter_url: Optional[AnyHttpUrl] = Field(
         None, description="Optional OpenTelemetry collector endpoint"
     )
+    otel_exporter: str = Field("file", description="Span exporter: file | console | otlp (uses otel_exporter_url)")
+    otel_file_path: str = Field("data/otel_spans.jsonl", description="JSONL span file for the file exporter")
+    otel_service_name: str = Field("intent-agent", description="service.name resource attribute")
+    otel_sample_ratio: float = Field(1.0, description="Fraction of new traces sampled (children follow their parent)")
+    otel_batch_max_queue_size: int = Field(2048, description="Spans queued for export before new ones are dropped")
+    otel_batch_max_export_batch_size: int = Field(512, description="Spans per export call")
+    otel_batch_schedule_delay_ms: int = Field(2000, description="Max delay before queued spans are exported")
     enable_langfuse: bool = Field(False, description="Enable Langfuse event tracing")
+    trace_max_entries: int = Field(10_000, description="Provenance entries kept in memory (oldest evicted first)")
+    trace_max_bytes: int = Field(16 * 1024 * 1024, description="Approximate byte cap of the provenance store")
+    trace_ttl_seconds: float = Field(3600.0, description="Drop a trace this long after its last event")
+    trace_max_field_bytes: int = Field(
+        2048, description="Larger provenance inputs/outputs are stored as a preview + sha256"
+    )
+    trace_export_enabled: bool = Field(False, description="Append provenance to JSONL segments on a writer thread")
+    trace_export_path: str = Field("data/traces", description="Directory of exported trace segments + index")
+    trace_export_queue_size: int = Field(10_000, description="Queued entries before new ones are dropped")
+    trace_export_batch_size: int = Field(256, description="Entries written per batch")
+    trace_export_flush_seconds: float = Field(1.0, description="Max delay before queued entries are written")
+    trace_export_max_file_bytes: int = Field(64 * 1024 * 1024, description="Rotate a segment past this size")
+    trace_export_max_files: int = Field(10, description="Segments kept (oldest deleted with their index refs)")
+    stage_metrics_enabled: bool = Field(True, description="Per-stage latency histograms served on /metrics")
+    stage_metrics_buckets: List[float] = Field(
+        default_factory=lambda: [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+        description="Histogram bucket upper bounds in seconds",
+    )
     enable_structured_logging: bool = Field(True, description="Use structured JSON logs")
     log_level: str = Field("INFO", description="Logging verbosity")
 
@@ -112,6 +258,14 @@ class Settings(BaseSettings):
         extra = "ignore"  # Allow unknown .env keys to prevent validation errors
         case_sensitive = False  # ✅ Allow UPPER_CASE env vars to populate lowercase fields
 
+    @property
+    def metrics_base_url(self) -> str:
+        return f"http://{self.metrics_mock_host}:{self.metrics_mock_port}"
+
+    @property
+    def docs_base_url(self) -> str:
+        return f"http://{self.docs_mock_host}:{self.docs_mock_port}"
+
 # --------------------------------------------------------------------------
 # Global settings instance (for imports across app modules)
 # --------------------------------------------------------------------------
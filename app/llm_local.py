@@ -1,6 +1,8 @@
 # app/llm_local.py
 from typing import Optional
 from .config import settings
+from .stage_metrics import timed
+from .otel import set_attributes
 import json, os
 
 # Try import llama-cpp-python (may not be present in all envs)
@@ -33,10 +35,13 @@ class LocalLLM:
         else:
             print("[LocalLLM] llama-cpp-python not available; running in fallback mode.")
 
+    @timed("llm", "generate")
     def generate(self, prompt: str, max_tokens: int = 256, temperature: float = 0.0) -> str:
         """
         Use llama-cpp to generate text if available; otherwise return deterministic fallback JSON.
         """
+        set_attributes({"llm.model": os.path.basename(self.model_path or ""), "llm.max_tokens": max_tokens,
+                        "llm.temperature": temperature, "llm.fallback": self.client is None})
         if self.client is None:
             # fallback deterministic JSON for router tests
             fallback = {"intent":"unknown","confidence":0.5,"entities":{},"reasoning":"no-local-llm"}
@@ -44,6 +49,9 @@ class LocalLLM:
         try:
             resp = self.client(prompt, max_tokens=max_tokens, temperature=temperature)
             if isinstance(resp, dict):
+                usage = resp.get('usage') or {}
+                set_attributes({"llm.prompt_tokens": usage.get('prompt_tokens'),
+                                "llm.generated_tokens": usage.get('completion_tokens')})
                 # Llama returns dict with 'choices' list
                 return resp.get('choices', [{}])[0].get('text', '')
             return str(resp)
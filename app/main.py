@@ -1,10 +1,57 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from .agent import handle_query
-from .trace import get_trace, clear_trace
+from .trace import load_trace, recent_entries, clear_trace, trace_stats
+from .trace_export import EXPORTER as trace_exporter
 from .schemas import QueryResponse
+from .tool_broker import http_clients
+from .circuit_breaker import breaker_states
+from .stage_metrics import render_prometheus
+from .otel import setup_tracing, shutdown_tracing
+from .tools.util_tool import close_connections, install_sql_cache_triggers, migrate_service_schema
+from .tools.metrics_client import flush_recorded_latencies
+from .tools.ann_index import get_local_index
+from .tools.indexer import reindex_scheduler
+from .tools.qdrant_store import close_async_client
+from .config import settings
 
-app = FastAPI(title='Intent Agent POC LangChain')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled HTTP clients live for the whole process and are closed on shutdown
+    http_clients.start()
+    setup_tracing()
+    # One-off conversion of a legacy `services` table and the SQL result cache's
+    # bump triggers (logged; never done on the read path)
+    try:
+        await asyncio.to_thread(migrate_service_schema)
+        await asyncio.to_thread(install_sql_cache_triggers)
+    except Exception as e:
+        print(f"[main] Service schema migration failed: {e}")
+    if not settings.use_qdrant:
+        # Map (or build) the local vector index before the first knowledge lookup
+        try:
+            await asyncio.to_thread(get_local_index)
+        except Exception as e:
+            print(f"[main] Local vector index unavailable: {e}")
+    if settings.trace_export_enabled:
+        trace_exporter.start()
+    # Periodic incremental reindex of seed docs (EMBEDDINGS_REINDEX_INTERVAL_HOURS)
+    reindex_scheduler.start()
+    try:
+        yield
+    finally:
+        await reindex_scheduler.stop()
+        await asyncio.to_thread(trace_exporter.stop)   # flushes queued provenance
+        await close_async_client()      # on its own (broker) loop, which aclose() shuts down
+        await http_clients.aclose()
+        await asyncio.to_thread(flush_recorded_latencies)
+        close_connections()
+        await asyncio.to_thread(shutdown_tracing)      # flushes the batch span processor
+
+app = FastAPI(title='Intent Agent POC LangChain', lifespan=lifespan)
 
 @app.get("/health")
 async def health_check():
@@ -23,9 +70,35 @@ def query_endpoint(p: QueryIn):
 def query_v1(p: QueryIn):
     return handle_query(p.query, p.user_id)
 
+@app.get('/breakers')
+def breakers():
+    """Circuit breaker + retry budget state per tool (for alerting)."""
+    return breaker_states()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics():
+    """Per-stage latency histograms and query counters (Prometheus text format)."""
+    return PlainTextResponse(render_prometheus(), media_type='text/plain; version=0.0.4')
+
+@app.get('/trace/stats')
+def trace_store_stats():
+    """Provenance store size and eviction counters."""
+    return trace_stats()
+
 @app.get('/trace')
-def trace():
-    return get_trace()
+def trace(limit: int = 100):
+    """Newest provenance entries across all traces."""
+    return recent_entries(limit)
+
+@app.get('/trace/{trace_id}')
+def trace_by_id(trace_id: str):
+    """All entries of one trace (the `traceId` returned by /query), from memory or the export."""
+    source, entries = load_trace(trace_id)
+    if not entries:
+        raise HTTPException(status_code=404, detail=f'unknown or expired trace {trace_id}')
+    summary = {'trace_id': trace_id, 'count': len(entries),
+               'first_ts': entries[0]['timestamp'], 'last_ts': entries[-1]['timestamp']}
+    return {'source': source, 'summary': summary, 'entries': entries}
 
 @app.post('/clear_trace')
 def clear():
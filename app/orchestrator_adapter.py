@@ -1,15 +1,20 @@
 # This orchestrator will use LangChain agent if USE_LANGCHAIN true, otherwise fallback to simple flow.
 from .config import settings
 from .router import classify_and_extract
-from .trace import record_prov, clear_trace, new_trace_id
-from .tools.metrics_client import call_metrics
-from .tools.vector_tool import call_vector
-from .tools.util_tool import run_sql, calc
+from .trace import record_prov, traced
+from .stage_metrics import set_intent, timed
+from .tools.metrics_client import call_metrics, call_metrics_batch
+from .schemas import MetricsQuery
+from .tools.vector_tool import call_vector, min_score as vector_min_score
+from .tools.util_tool import fetch_service_p95s, sql_cache, calc_batch
+from .tools.registry import DEFAULT_TOOL_REGISTRY
+from .tool_broker import execute_http_tool, run_sync
 from .langchain_integration import LocalLangChain, make_langchain_tools
 from .langchain_adapter import run_agent_with_tools, Tool as LocalTool
-import asyncio, time, httpx, json, os
+import asyncio, time, json, os
 from typing import List
 from .session_state import get_pending_clarify, set_pending_clarify, clear_pending_clarify
+from .answer_cache import answer_cache
 try:
     from .orchestrator_langgraph import run_langgraph as run_graph_engine  # full LangGraph
     _HAS_FULL_LG = True
@@ -17,20 +22,31 @@ except Exception:
     from .orchestrator_graph import run_graph as run_graph_engine          # minimal fallback
     _HAS_FULL_LG = False
 
+@traced   # every record_prov below lands in the request's trace
 def execute_workflow(query: str, user_id: str = None):
     print(f"[DEBUG] execute_workflow called with query: {query}")
-    trace_id = new_trace_id()   # create a unique trace ID for this workflow
-    clear_trace(trace_id)
-    
+
     # First, let's check the router's output
     try:
         print("[DEBUG] Calling classify_and_extract")
-        parsed = classify_and_extract(query)
+        with timed('router', 'classify_and_extract'):
+            parsed = classify_and_extract(query)
+            set_intent(parsed.get('intent'))
         print(f"[DEBUG] Router output: {parsed}")
     except Exception as e:
         print(f"[ERROR] Error in classify_and_extract: {str(e)}")
         parsed = {'intent': 'unknown', 'confidence': 0.0, 'reasoning': f'Error: {str(e)}'}
     
+    # Post-routing answer cache: identical (intent, entities) requests within the
+    # intent's TTL are answered without re-running tools or the agent
+    if settings.answer_cache_enabled and parsed.get('confidence', 0.0) >= 0.6:
+        return answer_cache.get_or_compute(
+            parsed.get('intent'), parsed.get('entities'), query,
+            lambda: _execute_routed(query, user_id, parsed),
+        )
+    return _execute_routed(query, user_id, parsed)
+
+def _execute_routed(query: str, user_id: str, parsed: dict):
     # If LangGraph is enabled, run the stateful graph orchestrator (full if available, else minimal) and return
     if getattr(settings, 'use_langgraph', False):
         try:
@@ -49,7 +65,6 @@ def execute_workflow(query: str, user_id: str = None):
                 print(f"[ERROR] Fallback graph failed: {str(fallback_error)}")
                 return {'answer': 'Error processing request', 'status': 'error', 'trace': []}
     
-    parsed = classify_and_extract(query)
     record_prov('intent','router','llm', {'query': query}, parsed, parsed.get('confidence',0.0), 'router_prompt', session_id=user_id)
     intent = parsed.get('intent')
     entities = parsed.get('entities', {})
@@ -117,7 +132,8 @@ def execute_workflow(query: str, user_id: str = None):
                 max_iterations=settings.agent_max_iterations,
                 verbose=False,
             )
-            result = executor.invoke({"input": query})
+            with timed('agent', 'react'):
+                result = executor.invoke({"input": query})
             out = result.get('output') if isinstance(result, dict) else result
             # If the agent bailed out due to parse/iteration limits, try guided single-steps per intent
             if isinstance(out, str) and 'Agent stopped' in out:
@@ -142,8 +158,8 @@ def execute_workflow(query: str, user_id: str = None):
                         # Record a successful agent step with the tool observation
                         record_prov('langchain_agent','agent','langchain', {'query':query}, {'output': tool_json}, 0.9, 'langchain_agent', session_id=user_id)
                         # Compose final answer similar to deterministic path
-                        data = tool_json.get('data', {})
-                        p95 = data.get('p95')
+                        data = tool_json.get('data') or {}
+                        p95 = data.get('p95_latency')
                         thr = settings.default_p95_threshold_ms
                         if isinstance(p95, (int, float)):
                             sign = '>' if p95 > thr else '<='
@@ -168,8 +184,8 @@ def execute_workflow(query: str, user_id: str = None):
                         data = tool_json.get('data', {})
                         top = data.get('top') or {}
                         title = (top.get('payload', {}) or {}).get('title') or top.get('title') or 'unknown'
-                        snippet = (top.get('payload', {}) or {}).get('text') or top.get('text') or ''
-                        if not top or (isinstance(top.get('score'), (int,float)) and top.get('score') < settings.KNOWLEDGE_SCORE_MIN_AGENT):
+                        snippet = (top.get('payload', {}) or {}).get('snippet') or top.get('snippet') or ''
+                        if not top or (isinstance(top.get('score'), (int,float)) and top.get('score') < vector_min_score()):
                             cq = "I couldn't find a strong match. Can you specify the topic or doc name?"
                             record_prov('clarify','control','orchestrator', {'query': query}, {'question': cq}, 0.5, 'clarify_question', session_id=user_id)
                             return {'answer': cq, 'status': 'clarify', 'trace': []}
@@ -178,24 +194,24 @@ def execute_workflow(query: str, user_id: str = None):
                         return {'answer': answer, 'status': 'done', 'trace': [], 'data': data_payload}
                 elif intent == 'calc_compare':
                     # Deterministic compute: run SQL to get p95 per service and compute diff
-                    sql_res = run_sql('SELECT * FROM services')
-                    record_prov('langchain_agent','agent','langchain', {'query':query}, {'output': sql_res.dict()}, 0.9, 'langchain_agent', session_id=user_id)
-                    rows = sql_res.data.get('rows', []) if hasattr(sql_res, 'data') else []
-                    d = {r[0]: r[1] for r in rows}
+                    # Only the requested services are read (indexed IN-list over the summary table)
+                    services = (entities.get('targets') or [])[:2]
+                    d = fetch_service_p95s(services)
+                    record_prov('langchain_agent','agent','langchain', {'query':query}, {'output': {'p95s': d}}, 0.9, 'langchain_agent', session_id=user_id)
                     # Also aggregate live metrics for the same services to demonstrate multi-tool aggregation
-                    # choose up to two services from SQL result for live metrics aggregation
-                    services = list(d.keys())[:2]
                     metrics_live = {}
-                    for s in services:
-                        try:
-                            m = asyncio.run(call_metrics(s, entities.get('window','15m')))
-                            record_prov('fetch_metrics','tool','metrics', {'service':s,'window':entities.get('window','15m')}, m.dict(), m.score, 'direct_api', session_id=user_id)
-                            if m.success:
-                                metrics_live[s] = m.data.get('p95')
-                        except Exception:
-                            pass
+                    # One batched round trip for all services instead of one call per service
+                    window = entities.get('window') or '15m'
+                    try:
+                        batch = run_sync(call_metrics_batch([MetricsQuery(service=s, window=window, metric='p95_latency') for s in services]))
+                        for s, m in zip(services, batch):
+                            record_prov('fetch_metrics','tool','metrics', {'service':s,'window':window}, m.model_dump(), m.score, 'direct_api', session_id=user_id)
+                            if m.success and m.data:
+                                metrics_live[s] = m.data.p95_latency
+                    except Exception:
+                        pass
                     if len(services) >= 2 and all(s in d for s in services):
-                        diff = d[services[0]] - d[services[1]]
+                        diff = float(calc_batch(d[services[0]], d[services[1]], '-'))
                         parts = [f"{services[0].capitalize()} p95={d[services[0]]}ms", f"{services[1].capitalize()} p95={d[services[1]]}ms", f"diff={diff}ms"]
                         if metrics_live:
                             live_str = ", ".join([f"{k} {v}ms" for k,v in metrics_live.items() if v is not None])
@@ -203,8 +219,8 @@ def execute_workflow(query: str, user_id: str = None):
                         answer = ", ".join(parts)
                         data_payload = {'targets': services, 'p95s': {services[0]: d[services[0]], services[1]: d[services[1]]}, 'diff_ms': diff, 'live_p95s': metrics_live}
                     else:
-                        answer = json.dumps(sql_res.dict())
-                        data_payload = {'raw': sql_res.dict()}
+                        answer = json.dumps({'p95s': d})
+                        data_payload = {'raw': {'p95s': d}}
                     return {'answer': answer, 'status': 'done', 'trace': [], 'data': data_payload}
                 # Otherwise record bailout and fall through to deterministic handlers below
                 record_prov('langchain_agent','agent','langchain', {'query':query}, {'output': out}, 0.5, 'langchain_agent_bailout', session_id=user_id)
@@ -250,14 +266,13 @@ def execute_workflow(query: str, user_id: str = None):
     # Else simple deterministic flow (fallback)
     if intent == 'metrics_lookup':
         svc = entities.get('service') or 'payments'; window = entities.get('window') or '5m'
-        # We are inside FastAPI's threadpool worker (no active event loop), so use asyncio.run
-        metrics_res = asyncio.run(call_metrics(svc, window))
-        record_prov('fetch_metrics','tool','metrics', {'service':svc,'window':window}, metrics_res.dict(), metrics_res.score, 'direct_api', session_id=user_id)
-        if not metrics_res.success:
+        # We are inside FastAPI's threadpool worker; run on the broker's shared loop so pooled clients are reused
+        metrics_res = run_sync(call_metrics(svc, window))
+        record_prov('fetch_metrics','tool','metrics', {'service':svc,'window':window}, metrics_res.model_dump(), metrics_res.score, 'direct_api', session_id=user_id)
+        if not metrics_res.success or metrics_res.data is None:
             # try docs fallback
             try:
-                r = httpx.get(f'{settings.DOCS_BASE_URL}/search', params={'q': svc}, timeout=settings.HTTP_TIMEOUT_SECONDS)
-                docs = r.json()
+                docs = execute_http_tool(f'{settings.docs_base_url}/search', {'q': svc}, DEFAULT_TOOL_REGISTRY['docs_tool'])
                 record_prov('http_docs','tool','http_docs', {'q':svc}, docs, 0.5, 'http_fallback', session_id=user_id)
                 if docs.get('items'):
                     t = docs['items'][0]
@@ -265,7 +280,7 @@ def execute_workflow(query: str, user_id: str = None):
             except Exception:
                 pass
             return {'answer':'No metrics found', 'status':'clarify', 'trace': []}
-        p95 = metrics_res.data.get('p95')
+        p95 = metrics_res.data.p95_latency
         if p95 and p95 > settings.default_p95_threshold_ms:
             ans = f"{svc} p95={p95}ms > {settings.default_p95_threshold_ms}ms"
         else:
@@ -274,13 +289,12 @@ def execute_workflow(query: str, user_id: str = None):
         data_payload = {'service': svc, 'window': window, 'p95': p95, 'threshold_ms': settings.default_p95_threshold_ms, 'verdict': 'above' if p95 and p95 > settings.default_p95_threshold_ms else 'ok'}
         return {'answer': ans, 'status':'done', 'trace': [], 'data': data_payload}
     if intent == 'knowledge_lookup':
-        vec_res = call_vector(query)
-        record_prov('vector','tool','vector', {'query':query}, vec_res.dict(), vec_res.score, 'vector_search', session_id=user_id)
-        if not vec_res.success or vec_res.score < settings.KNOWLEDGE_SCORE_MIN:
+        vec_res = run_sync(call_vector(query))
+        record_prov('vector','tool','vector', {'query':query}, vec_res.model_dump(), vec_res.score, 'vector_search', session_id=user_id)
+        if not vec_res.success or vec_res.score < vector_min_score():
             # fallback http docs
             try:
-                r = httpx.get(f'{settings.DOCS_BASE_URL}/search', params={'q': query}, timeout=settings.HTTP_TIMEOUT_SECONDS)
-                docs = r.json()
+                docs = execute_http_tool(f'{settings.docs_base_url}/search', {'q': query}, DEFAULT_TOOL_REGISTRY['docs_tool'])
                 record_prov('http_docs','tool','http_docs', {'q':query}, docs, 0.5, 'http_fallback', session_id=user_id)
                 if docs.get('items'):
                     t = docs['items'][0]
@@ -288,9 +302,9 @@ def execute_workflow(query: str, user_id: str = None):
             except Exception:
                 pass
             return {'answer': 'No reliable docs found. Clarify?', 'status':'clarify', 'trace': []}
-        top = vec_res.data.get('top', {})
-        ans = f"Found doc: {top.get('payload',{}).get('title','unknown')} - snippet: {top.get('payload',{}).get('text','')[:300]}"
-        data_payload = {'query': query, 'top': {'title': top.get('payload',{}).get('title','unknown'), 'snippet': top.get('payload',{}).get('text','')[:300]}}
+        top = vec_res.top.payload
+        ans = f"Found doc: {top.get('title','unknown')} - snippet: {top.get('snippet','')}"
+        data_payload = {'query': query, 'top': {'title': top.get('title','unknown'), 'snippet': top.get('snippet',''), 'score': vec_res.score}}
         clear_pending_clarify(user_id)
         return {'answer': ans, 'status':'done', 'trace': [], 'data': data_payload}
     if intent == 'calc_compare':
@@ -299,13 +313,11 @@ def execute_workflow(query: str, user_id: str = None):
             parts = [p.strip() for p in query.split('and')]
             targets = [p for p in parts if p in settings.service_catalog]
         if targets and len(targets) >= 2:
-            sql = 'SELECT * FROM services'
-            sql_res = run_sql(sql)
-            rows = sql_res.data.get('rows', [])
-            d = {r[0]: r[1] for r in rows}
-            if all(t in d for t in targets[:2]):
-                a, b = targets[:2]
-                diff = d[a] - d[b]
+            a, b = targets[:2]
+            d = fetch_service_p95s([a, b])
+            record_prov('util_sql','tool','sqlite', {'services': [a, b]}, {'p95s': d, 'sql_cache': sql_cache.trace_info()}, 0.9, 'sql_pushdown', session_id=user_id)
+            if a in d and b in d:
+                diff = float(calc_batch(d[a], d[b], '-'))
                 ans = f"{a.capitalize()} p95={d[a]}ms, {b.capitalize()} p95={d[b]}ms, diff={diff}ms"
                 data_payload = {'targets': [a,b], 'p95s': {a: d[a], b: d[b]}, 'diff_ms': diff}
                 clear_pending_clarify(user_id)
@@ -2,12 +2,14 @@ from typing import Any, Dict, List, Optional
 from dataclasses import dataclass, field
 from .config import settings
 from .router import classify_and_extract
-from .trace import record_prov, clear_trace
+from .trace import record_prov, traced
+from .stage_metrics import timed
 from .session_state import get_pending_clarify, set_pending_clarify, clear_pending_clarify
 from .tools.metrics_client import call_metrics
-from .tools.vector_tool import call_vector
-from .tools.util_tool import run_sql
-import asyncio, httpx
+from .tools.vector_tool import call_vector, min_score as vector_min_score
+from .tools.util_tool import calc_batch, fetch_service_p95s, sql_cache
+from .tool_broker import execute_http_tool, run_sync
+from .tools.registry import DEFAULT_TOOL_REGISTRY
 
 @dataclass
 class OrchestratorState:
@@ -24,6 +26,7 @@ class OrchestratorState:
 
 # Nodes
 
+@timed('node', 'route')
 def node_route(st: OrchestratorState) -> OrchestratorState:
     parsed = classify_and_extract(st.query)
     st.intent = parsed.get('intent')
@@ -32,6 +35,7 @@ def node_route(st: OrchestratorState) -> OrchestratorState:
     record_prov('intent','router','llm', {'query': st.query}, parsed, st.confidence, 'router_prompt', session_id=st.user_id)
     return st
 
+@timed('node', 'plan')
 def node_plan(st: OrchestratorState) -> OrchestratorState:
     # Determine missing info and set clarify if needed
     if st.confidence < 0.6 or not st.intent:
@@ -54,17 +58,18 @@ def node_plan(st: OrchestratorState) -> OrchestratorState:
         pass
     return st
 
+@timed('node', 'act')
 def node_act(st: OrchestratorState) -> OrchestratorState:
     if st.clarify_question:
         return st
     if st.intent == 'metrics_lookup':
         svc = st.entities.get('service') or 'payments'
         window = st.entities.get('window') or '5m'
-        res = asyncio.run(call_metrics(svc, window))
-        record_prov('fetch_metrics','tool','metrics', {'service':svc,'window':window}, res.dict(), res.score, 'direct_api', session_id=st.user_id)
-        st.tool_results.append(res.dict())
-        if res.success:
-            p95 = res.data.get('p95')
+        res = run_sync(call_metrics(svc, window))
+        record_prov('fetch_metrics','tool','metrics', {'service':svc,'window':window}, res.model_dump(), res.score, 'direct_api', session_id=st.user_id)
+        st.tool_results.append(res.model_dump())
+        if res.success and res.data:
+            p95 = res.data.p95_latency
             if p95 and p95 > settings.default_p95_threshold_ms:
                 st.answer = f"{svc} p95={p95}ms > {settings.default_p95_threshold_ms}ms"
                 st.data = {'service': svc, 'window': window, 'p95': p95, 'threshold_ms': settings.default_p95_threshold_ms, 'verdict': 'above'}
@@ -75,8 +80,7 @@ def node_act(st: OrchestratorState) -> OrchestratorState:
         else:
             # Try docs fallback
             try:
-                r = httpx.get(f'{settings.DOCS_BASE_URL}/search', params={'q': svc}, timeout=settings.HTTP_TIMEOUT_SECONDS)
-                docs = r.json()
+                docs = execute_http_tool(f'{settings.docs_base_url}/search', {'q': svc}, DEFAULT_TOOL_REGISTRY['docs_tool'])
                 record_prov('http_docs','tool','http_docs', {'q':svc}, docs, 0.5, 'http_fallback', session_id=st.user_id)
                 if docs.get('items'):
                     t = docs['items'][0]
@@ -88,21 +92,20 @@ def node_act(st: OrchestratorState) -> OrchestratorState:
                 pass
             st.clarify_question = 'No metrics found'
     elif st.intent == 'knowledge_lookup':
-        vec = call_vector(st.query)
-        record_prov('vector','tool','vector', {'query':st.query}, vec.dict(), vec.score, 'vector_search', session_id=st.user_id)
-        st.tool_results.append(vec.dict())
-        if vec.success and vec.score >= settings.KNOWLEDGE_SCORE_MIN:
-            top = vec.data.get('top', {})
-            title = (top.get('payload',{}) or {}).get('title','unknown')
-            snippet = (top.get('payload',{}) or {}).get('text','')[:300]
+        vec = run_sync(call_vector(st.query))
+        record_prov('vector','tool','vector', {'query':st.query}, vec.model_dump(), vec.score, 'vector_search', session_id=st.user_id)
+        st.tool_results.append(vec.model_dump())
+        if vec.success and vec.score >= vector_min_score():
+            top = vec.top.payload
+            title = top.get('title','unknown')
+            snippet = top.get('snippet','')
             st.answer = f"Found doc: {title} - snippet: {snippet}"
             st.data = {'query': st.query, 'top': {'title': title, 'snippet': snippet}}
             st.status = 'done'
         else:
             # Fallback docs search
             try:
-                r = httpx.get(f'{settings.DOCS_BASE_URL}/search', params={'q': st.query}, timeout=settings.HTTP_TIMEOUT_SECONDS)
-                docs = r.json()
+                docs = execute_http_tool(f'{settings.docs_base_url}/search', {'q': st.query}, DEFAULT_TOOL_REGISTRY['docs_tool'])
                 record_prov('http_docs','tool','http_docs', {'q':st.query}, docs, 0.5, 'http_fallback', session_id=st.user_id)
                 if docs.get('items'):
                     t = docs['items'][0]
@@ -114,16 +117,15 @@ def node_act(st: OrchestratorState) -> OrchestratorState:
                 pass
             st.clarify_question = 'No reliable docs found. Clarify?'
     elif st.intent == 'calc_compare':
-        sql_res = run_sql('SELECT * FROM services')
-        rows = sql_res.data.get('rows', [])
-        d = {r[0]: r[1] for r in rows}
         targets = st.entities.get('targets') or []
         if len(targets) < 2:
             st.clarify_question = "Which two services should I compare (e.g., payments vs orders)?"
             return st
         a, b = targets[:2]
+        d = fetch_service_p95s([a, b])
+        record_prov('util_sql','tool','sqlite', {'services': [a, b]}, {'p95s': d, 'sql_cache': sql_cache.trace_info()}, 0.9, 'sql_pushdown', session_id=st.user_id)
         if a in d and b in d:
-            diff = d[a] - d[b]
+            diff = float(calc_batch(d[a], d[b], '-'))
             st.answer = f"{a.capitalize()} p95={d[a]}ms, {b.capitalize()} p95={d[b]}ms, diff={diff}ms"
             st.data = {'targets': [a,b], 'p95s': {a: d[a], b: d[b]}, 'diff_ms': diff}
             st.status = 'done'
@@ -131,6 +133,7 @@ def node_act(st: OrchestratorState) -> OrchestratorState:
             st.clarify_question = 'Targets not found in table'
     return st
 
+@timed('node', 'reflect')
 def node_reflect(st: OrchestratorState) -> OrchestratorState:
     # If we asked a clarification, persist and mark clarify
     if st.clarify_question:
@@ -149,11 +152,8 @@ def node_finalize(st: OrchestratorState) -> Dict[str, Any]:
 
 # Graph runner
 
+@traced   # joins the caller's trace, or starts one when run standalone
 def run_graph(query: str, user_id: Optional[str] = None) -> Dict[str, Any]:
-    # Generate a new trace ID and clear any existing trace
-    trace_id = new_trace_id()
-    clear_trace(trace_id)
-    
     try:
         st = OrchestratorState(user_id=user_id, query=query)
         st = node_route(st)
@@ -2,12 +2,14 @@ from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field
 from .config import settings
 from .router import classify_and_extract
-from .trace import record_prov, clear_trace, new_trace_id
+from .trace import record_prov, traced
+from .stage_metrics import timed
 from .session_state import get_pending_clarify, set_pending_clarify, clear_pending_clarify
 from .tools.metrics_client import call_metrics
-from .tools.vector_tool import call_vector
-from .tools.util_tool import run_sql
-import asyncio, httpx
+from .tools.vector_tool import call_vector, min_score as vector_min_score
+from .tools.util_tool import calc_batch, fetch_service_p95s, sql_cache
+from .tool_broker import execute_http_tool, run_sync
+from .tools.registry import DEFAULT_TOOL_REGISTRY
 
 # Full LangGraph integration
 try:
@@ -140,54 +142,45 @@ def lg_act(state: LGState, settings=None) -> LGState:
                 
             # Get metrics for the service
             try:
-                import asyncio
-                # Create a new event loop for this thread
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    # Run the async function in the event loop
-                    metrics = loop.run_until_complete(call_metrics(svc, window, metric))
-                    
-                    if metrics and metrics.get('success'):
-                        metrics_data = metrics.get('data', {})
-                        p95 = metrics_data.get('p95_latency', 0)
-                        # Format the response to match the expected format
-                        state.answer = f"{svc} p95={p95}ms"
-                        if p95 > 200:  # Add threshold indicator if needed
-                            state.answer += " > 200ms"
-                        state.data = {
-                            'service': svc,
-                            'window': window,
-                            'p95_latency': p95,
-                            'p99_latency': metrics_data.get('p99_latency'),
-                            'error_rate': metrics_data.get('error_rate'),
-                            'request_count': metrics_data.get('request_count')
-                        }
-                    else:
-                        error_msg = metrics.get('error', 'Unknown error')
-                        state.clarify_question = f"Could not fetch metrics for {svc}: {error_msg}. Please try again or specify a different service."
-                finally:
-                    # Always clean up the event loop
-                    loop.close()
+                # Run on the broker's shared event loop (pooled clients, no per-call loop setup)
+                metrics = run_sync(call_metrics(svc, window, metric))
+                record_prov('fetch_metrics','tool','metrics', {'service':svc,'window':window,'metric':metric}, metrics.model_dump(), metrics.score, 'direct_api', session_id=state.user_id)
+
+                if metrics.success and metrics.data:
+                    metrics_data = metrics.data
+                    p95 = metrics_data.p95_latency or 0
+                    # Format the response to match the expected format
+                    state.answer = f"{svc} p95={p95}ms"
+                    if p95 > 200:  # Add threshold indicator if needed
+                        state.answer += " > 200ms"
+                    state.data = {
+                        'service': svc,
+                        'window': window,
+                        'p95_latency': p95,
+                        'p99_latency': metrics_data.p99_latency,
+                        'error_rate': metrics_data.error_rate,
+                        'request_count': metrics_data.request_count
+                    }
+                else:
+                    error_msg = metrics.error or 'Unknown error'
+                    state.clarify_question = f"Could not fetch metrics for {svc}: {error_msg}. Please try again or specify a different service."
             except Exception as e:
                 state.error = f"Error fetching metrics: {str(e)}"
                 import traceback
                 state.error += f"\n\nTraceback:\n{traceback.format_exc()}"
         elif state.intent == 'knowledge_lookup':
-            vec = call_vector(state.query)
-            record_prov('vector','tool','vector', {'query':state.query}, vec.dict(), vec.score, 'vector_search', session_id=state.user_id)
-            knowledge_score_min = getattr(settings, 'KNOWLEDGE_SCORE_MIN', 0.7)
-            if vec.success and vec.score >= knowledge_score_min:
-                top = vec.data.get('top', {})
-                title = (top.get('payload',{}) or {}).get('title','unknown')
-                snippet = (top.get('payload',{}) or {}).get('text','')[:300]
+            vec = run_sync(call_vector(state.query))
+            record_prov('vector','tool','vector', {'query':state.query}, vec.model_dump(), vec.score, 'vector_search', session_id=state.user_id)
+            if vec.success and vec.score >= vector_min_score():
+                top = vec.top.payload
+                title = top.get('title','unknown')
+                snippet = top.get('snippet','')
                 state.answer = f"Found doc: {title} - snippet: {snippet}"
                 state.data = {'query': state.query, 'top': {'title': title, 'snippet': snippet}}
             else:
                 # fallback docs
                 try:
-                    r = httpx.get(f'{settings.DOCS_BASE_URL}/search', params={'q': state.query}, timeout=settings.HTTP_TIMEOUT_SECONDS)
-                    docs = r.json()
+                    docs = execute_http_tool(f'{settings.docs_base_url}/search', {'q': state.query}, DEFAULT_TOOL_REGISTRY['docs_tool'])
                     record_prov('http_docs','tool','http_docs', {'q':state.query}, docs, 0.5, 'http_fallback', session_id=state.user_id)
                     if docs.get('items'):
                         t = docs['items'][0]
@@ -198,16 +191,15 @@ def lg_act(state: LGState, settings=None) -> LGState:
                     pass
                 state.clarify_question = 'No reliable docs found. Clarify?'
         elif state.intent == 'calc_compare':
-            sql_res = run_sql('SELECT * FROM services')
-            rows = sql_res.data.get('rows', [])
-            d = {r[0]: r[1] for r in rows}
             targets = state.entities.get('targets') or []
             if len(targets) < 2:
                 state.clarify_question = "Which two services should I compare (e.g., payments vs orders)?"
                 return state
             a, b = targets[:2]
+            d = fetch_service_p95s([a, b])
+            record_prov('util_sql','tool','sqlite', {'services': [a, b]}, {'p95s': d, 'sql_cache': sql_cache.trace_info()}, 0.9, 'sql_pushdown', session_id=state.user_id)
             if a in d and b in d:
-                diff = d[a] - d[b]
+                diff = float(calc_batch(d[a], d[b], '-'))
                 state.answer = f"{a.capitalize()} p95={d[a]}ms, {b.capitalize()} p95={d[b]}ms, diff={diff}ms"
                 state.data = {'targets': [a,b], 'p95s': {a: d[a], b: d[b]}, 'diff_ms': diff}
             else:
@@ -318,11 +310,13 @@ def _build_graph():
         
         # Add nodes with wrapped functions
         print("[DEBUG] Adding nodes to the graph...")
+        # wrap_node_func swallows node exceptions into state.error, so time on that
+        node_status = lambda st: 'error' if getattr(st, 'error', None) else 'ok'
         nodes = {
-            'route': wrap_node_func(lg_route),
-            'plan': wrap_node_func(lg_plan),
-            'act': wrap_node_func(lg_act),
-            'reflect': wrap_node_func(lg_reflect)
+            'route': timed('node', 'route', node_status)(wrap_node_func(lg_route)),
+            'plan': timed('node', 'plan', node_status)(wrap_node_func(lg_plan)),
+            'act': timed('node', 'act', node_status)(wrap_node_func(lg_act)),
+            'reflect': timed('node', 'reflect', node_status)(wrap_node_func(lg_reflect))
         }
         
         for node_name, node_func in nodes.items():
@@ -389,6 +383,7 @@ def _build_graph():
 
 # Entry point for adapter
 
+@traced   # joins the caller's trace, or starts one when run standalone
 def run_langgraph(query: str, user_id: Optional[str] = None) -> Dict[str, Any]:
     print(f"[DEBUG] run_langgraph called with query: {query}, user_id: {user_id}")
     
@@ -411,9 +406,6 @@ def run_langgraph(query: str, user_id: Optional[str] = None) -> Dict[str, Any]:
         default_response['answer'] = error_msg
         return default_response
     
-    trace_id = new_trace_id()
-    clear_trace(trace_id)
-    
     try:
         print("[DEBUG] Building LangGraph...")
         app = _build_graph()
@@ -0,0 +1,163 @@
+"""
+OpenTelemetry
+-------------
+Spans for the agent, enabled with `enable_otel`.
+
+`setup_tracing()` installs a TracerProvider with a parent-based ratio sampler
+(`otel_sample_ratio`) and a `BatchSpanProcessor`. Spans are therefore queued
+and exported on the SDK's worker thread, never on the request path. A full
+queue drops spans instead of blocking. It also registers a span hook with
+`app/stage_metrics.py`, so every timed stage becomes a span, nested under
+the request:
+
+    request.query > router.classify_and_extract, node.* > agent.react,
+                    tool.* > http.*, llm.generate
+
+Tool spans carry the tool's ToolMeta (`tool.*` attributes). LLM spans carry
+prompt and generated token counts (see `LocalLLM.generate`). Exporters
+(`otel_exporter`):
+
+- `file`: one JSON span per line in `otel_file_path` (no collector needed).
+- `console`: spans printed to stdout.
+- `otlp`: OTLP/HTTP to `otel_exporter_url` (needs
+  opentelemetry-exporter-otlp-proto-http).
+
+With `enable_otel` off, or without opentelemetry-sdk installed, nothing is
+installed and the instrumentation costs a single `None` check per stage.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from .config import settings
+from . import stage_metrics
+from .tools.registry import DEFAULT_TOOL_REGISTRY
+
+try:
+    from opentelemetry import trace as ot_trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:       # opentelemetry-api is optional
+    ot_trace = None
+
+_provider = None
+
+
+def _tool_attributes(name: str) -> Dict[str, Any]:
+    meta = DEFAULT_TOOL_REGISTRY.get(name)
+    if meta is None:
+        return {"tool.key": name}
+    return {"tool.key": meta.key, "tool.name": meta.name,
+            "tool.capabilities": [c.value for c in meta.capabilities],
+            "tool.timeout_seconds": meta.timeout_seconds, "tool.retries": meta.retries,
+            "tool.failure_threshold": meta.failure_threshold}
+
+
+class _SpanHook:
+    """`stage_metrics` hook: one span per timed stage."""
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def start(self, stage: str, name: str):
+        attributes: Dict[str, Any] = {"agent.stage": stage}
+        if stage in ("tool", "http"):
+            attributes.update(_tool_attributes(name))
+        cm = self.tracer.start_as_current_span(f"{stage}.{name}", attributes=attributes)
+        return cm, cm.__enter__()
+
+    def finish(self, span, status: str) -> None:
+        if not span.is_recording():
+            return
+        span.set_attribute("agent.intent", stage_metrics.current_intent())
+        span.set_attribute("agent.status", status)
+        if status != "ok":
+            span.set_status(Status(StatusCode.ERROR, status))
+
+
+def _file_exporter(path: Path):
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JsonLinesSpanExporter(SpanExporter):
+        """Appends finished spans to a local JSONL file (runs on the batch worker)."""
+
+        def __init__(self):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._lock = threading.Lock()
+
+        def export(self, spans: Sequence) -> "SpanExportResult":
+            lines = "".join(s.to_json(indent=None) + "\n" for s in spans)
+            try:
+                with self._lock, open(path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+    return JsonLinesSpanExporter()
+
+
+def _exporter():
+    kind = settings.otel_exporter.lower()
+    if kind == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        return ConsoleSpanExporter()
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        endpoint = str(settings.otel_exporter_url) if settings.otel_exporter_url else None
+        return OTLPSpanExporter(endpoint=endpoint)
+    if kind == "file":
+        return _file_exporter(Path(settings.otel_file_path))
+    raise ValueError(f"unknown otel_exporter {settings.otel_exporter!r}")
+
+
+def setup_tracing(exporter=None) -> bool:
+    """Install the tracer provider and stage span hook; True when tracing is active."""
+    global _provider
+    if not settings.enable_otel or _provider is not None:
+        return _provider is not None
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        print("[otel] enable_otel is set but opentelemetry-sdk is not installed; tracing disabled")
+        return False
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.otel_service_name,
+                                  "service.version": settings.app_version,
+                                  "deployment.environment": settings.environment,
+                                  "process.pid": os.getpid()}),
+        sampler=ParentBased(TraceIdRatioBased(settings.otel_sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(
+        exporter or _exporter(),
+        max_queue_size=settings.otel_batch_max_queue_size,
+        max_export_batch_size=settings.otel_batch_max_export_batch_size,
+        schedule_delay_millis=settings.otel_batch_schedule_delay_ms,
+    ))
+    _provider = provider
+    stage_metrics.set_span_hook(_SpanHook(provider.get_tracer("intent_agent")))
+    print(f"[otel] Tracing to {settings.otel_exporter} (sample ratio {settings.otel_sample_ratio})")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush queued spans and uninstall the hook."""
+    global _provider
+    if _provider is None:
+        return
+    stage_metrics.set_span_hook(None)
+    provider, _provider = _provider, None
+    provider.shutdown()
+
+
+def set_attributes(attributes: Dict[str, Any]) -> None:
+    """Annotate the current span (no-op unless tracing is active)."""
+    if _provider is None:
+        return
+    span = ot_trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({k: v for k, v in attributes.items() if v is not None})
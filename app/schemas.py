@@ -38,6 +38,9 @@ class QueryResponse(BaseModel):
     summary: Optional[str] = None
     data: dict = {}
     trace: list = []
+    trace_id: Optional[str] = Field(None, description="Provenance trace of this request (see GET /trace/{trace_id})")
+    cached: bool = Field(False, description="True when the answer was served from the answer cache")
+    cache_age_seconds: Optional[float] = Field(None, description="Age of the cached answer, if cached")
 
     class Config:
         alias_generator = lambda s: ''.join(
@@ -46,6 +49,74 @@ class QueryResponse(BaseModel):
         populate_by_name = True
 
 
+# ---------------------------------------------------------
+# Metrics service contract (shared by the metrics service, client and orchestrators)
+# ---------------------------------------------------------
+class MetricsQuery(BaseModel):
+    """One (service, window, metric) lookup."""
+    service: str
+    window: str = Field("5m", description="Lookback window, e.g. 5m, 1h, 24h, 7d")
+    metric: Optional[str] = Field(None, description="Single metric to return (e.g. p95_latency); all when omitted")
+
+
+class MetricsData(BaseModel):
+    """Aggregated metrics for a service over a window. Latencies are in milliseconds."""
+    service: str
+    window: str
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    p95_latency: Optional[float] = None
+    p99_latency: Optional[float] = None
+    error_rate: Optional[float] = None
+    request_count: Optional[int] = None
+    success_rate: Optional[float] = None
+
+
+class MetricsResult(BaseModel):
+    """Result envelope returned by the metrics service and `call_metrics`."""
+    success: bool
+    data: Optional[MetricsData] = None
+    error: Optional[str] = None
+    message: Optional[str] = None
+    score: float = Field(0.0, description="Confidence recorded in provenance")
+
+
+class MetricsBatchRequest(BaseModel):
+    queries: List[MetricsQuery]
+
+
+class MetricsBatchResponse(BaseModel):
+    results: List[MetricsResult]
+
+
+# ---------------------------------------------------------
+# Vector search contract (`call_vector`)
+# ---------------------------------------------------------
+class VectorHit(BaseModel):
+    """One search hit; `payload` carries `title`, `chunk` and `snippet` (full text: content store)."""
+    id: Any
+    score: float
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    dense_score: Optional[float] = Field(None, description="Cosine score from the dense search (hybrid hits)")
+    sparse_score: Optional[float] = Field(None, description="BM25 score from the sparse search (hybrid hits)")
+
+
+class VectorResult(BaseModel):
+    """Result envelope returned by `call_vector`, whichever backend answered."""
+    success: bool
+    hits: List[VectorHit] = Field(default_factory=list)
+    source: str = Field("none", description="hybrid | qdrant | qdrant_sparse | local_ann | local_sparse")
+    error: Optional[str] = None
+    message: Optional[str] = None
+    score: float = Field(
+        0.0, description="Confidence of the top hit, on the dense cosine scale (compared with vector_min_score)"
+    )
+
+    @property
+    def top(self) -> Optional[VectorHit]:
+        return self.hits[0] if self.hits else None
+
+
 # ---------------------------------------------------------
 # Error Schema (optional but useful)
 # ---------------------------------------------------------
@@ -0,0 +1,230 @@
+"""
+Stage Metrics
+-------------
+Where a `/query` spends its time, as fixed-bucket latency histograms and
+counters served in Prometheus text format on the agent's `GET /metrics`.
+
+Timed stages (`stage`, `name`):
+- request / query: the whole `handle_query`
+- router / classify_and_extract
+- node / route, plan, act, reflect: graph nodes (LangGraph or the minimal graph)
+- agent / react: the LangChain ReAct executor
+- tool / metrics_tool, vector_tool, util_sql: the tool functions
+- http / <tool key>: each upstream tool call through the broker (HTTP, or Qdrant gRPC; retries included)
+- llm / generate: `LocalLLM.generate`
+
+Every series also carries `intent` and `status` labels. The intent comes from a
+`ContextVar` set once the router has classified the request. Status is `ok`,
+`error` when the stage raised or its result reported a failure, or
+`circuit_open` for HTTP calls rejected by an open breaker.
+
+Recording is cheap and takes no lock. Each thread accumulates into its own
+shard (`threading.local`), and `collect()` sums the shards only when
+`/metrics` is scraped. Timers use `time.perf_counter`, which is monotonic.
+
+When OpenTelemetry is enabled, `app/otel.py` installs a span hook, and every
+timed stage also becomes a span named `<stage>.<name>` under the current span.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+BUCKETS: Tuple[float, ...] = tuple(sorted(settings.stage_metrics_buckets))
+HISTOGRAM = "agent_stage_duration_seconds"
+QUERIES = "agent_queries_total"
+
+_intent: ContextVar[str] = ContextVar("stage_intent", default="unknown")
+_span_hook: Optional[Any] = None    # .start(stage, name) -> (cm, span); .finish(span, status)
+
+HistKey = Tuple[str, str, str, str]                 # stage, name, intent, status
+CounterKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class _Shard:
+    """One thread's accumulators; only that thread writes to it."""
+
+    __slots__ = ("hist", "counters")
+
+    def __init__(self):
+        # per series: [count per bucket ..., count above the last bucket, sum of seconds]
+        self.hist: Dict[HistKey, List[float]] = {}
+        self.counters: Dict[CounterKey, float] = {}
+
+
+_local = threading.local()
+_shards: List[_Shard] = []
+_shards_lock = threading.Lock()     # taken once per thread, when its shard is created
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def set_span_hook(hook: Optional[Any]) -> None:
+    """Open a span around every timed stage (None disables; see app/otel.py)."""
+    global _span_hook
+    _span_hook = hook
+
+
+# -- recording ------------------------------------------------------------------------
+def set_intent(intent: Optional[str]) -> None:
+    """Label the rest of this request's stages with `intent`."""
+    _intent.set(intent or "unknown")
+
+def current_intent() -> str:
+    return _intent.get()
+
+@contextmanager
+def intent_scope() -> Iterator[None]:
+    """Confine `set_intent` calls to one request."""
+    token = _intent.set(_intent.get())
+    try:
+        yield
+    finally:
+        _intent.reset(token)
+
+def observe(stage: str, name: str, seconds: float, status: str = "ok") -> None:
+    if not settings.stage_metrics_enabled:
+        return
+    hist = _shard().hist
+    key = (stage, name, _intent.get(), status)
+    series = hist.get(key)
+    if series is None:
+        series = hist[key] = [0.0] * (len(BUCKETS) + 2)
+    series[bisect_left(BUCKETS, seconds)] += 1
+    series[-1] += seconds
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    if not settings.stage_metrics_enabled:
+        return
+    counters = _shard().counters
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    counters[key] = counters.get(key, 0.0) + value
+
+
+class timed:
+    """Time a stage, as a `with` block or as a (sync or async) function decorator.
+
+    `status_of(result)` lets a decorated function that reports failures in
+    its return value (rather than by raising) be counted as `error`. Inside a
+    `with` block, set `.status` instead (kept even if the block then raises).
+    """
+
+    __slots__ = ("stage", "name", "status_of", "status", "_t0", "_span")
+
+    def __init__(self, stage: str, name: str, status_of: Optional[Callable[[Any], str]] = None):
+        self.stage = stage
+        self.name = name
+        self.status_of = status_of
+        self.status = "ok"
+        self._t0 = 0.0
+        self._span: Optional[Tuple[Any, Any, Any]] = None     # (hook, span context manager, span)
+
+    def __enter__(self) -> "timed":
+        self.status = "ok"
+        hook = _span_hook
+        if hook is not None:
+            self._span = (hook, *hook.start(self.stage, self.name))
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        status = "error" if exc_type is not None and self.status == "ok" else self.status
+        observe(self.stage, self.name, time.perf_counter() - self._t0, status)
+        if self._span is not None:
+            hook, span_cm, span = self._span
+            self._span = None
+            hook.finish(span, status)
+            span_cm.__exit__(exc_type, exc, tb)
+        return False
+
+    def __call__(self, fn: Callable) -> Callable:
+        stage, name, status_of = self.stage, self.name, self.status_of
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(stage, name) as t:
+                    result = await fn(*args, **kwargs)
+                    if status_of is not None:
+                        t.status = status_of(result)
+                    return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage, name) as t:
+                result = fn(*args, **kwargs)
+                if status_of is not None:
+                    t.status = status_of(result)
+                return result
+        return wrapper
+
+
+# -- collection / exposition -----------------------------------------------------------
+def collect() -> Tuple[Dict[HistKey, List[float]], Dict[CounterKey, float]]:
+    """Sum every thread's shard (reads race benignly with writers)."""
+    hist: Dict[HistKey, List[float]] = {}
+    counters: Dict[CounterKey, float] = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, series in list(shard.hist.items()):
+            total = hist.setdefault(key, [0.0] * (len(BUCKETS) + 2))
+            for i, v in enumerate(list(series)):
+                total[i] += v
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0.0) + value
+    return hist, counters
+
+def reset() -> None:
+    with _shards_lock:
+        for shard in _shards:
+            shard.hist.clear()
+            shard.counters.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(pairs) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render_prometheus() -> str:
+    """Prometheus text exposition (format 0.0.4) of all stage histograms and counters."""
+    hist, counters = collect()
+    lines = [f"# HELP {HISTOGRAM} Wall time spent per agent stage.",
+             f"# TYPE {HISTOGRAM} histogram"]
+    for (stage, name, intent, status), series in sorted(hist.items()):
+        base = _labels((("stage", stage), ("name", name), ("intent", intent), ("status", status)))
+        cumulative = 0.0
+        for bound, n in zip(BUCKETS, series):
+            cumulative += n
+            lines.append(f'{HISTOGRAM}_bucket{{{base},le="{bound}"}} {_num(cumulative)}')
+        cumulative += series[len(BUCKETS)]
+        lines.append(f'{HISTOGRAM}_bucket{{{base},le="+Inf"}} {_num(cumulative)}')
+        lines.append(f"{HISTOGRAM}_sum{{{base}}} {series[-1]:.6f}")
+        lines.append(f"{HISTOGRAM}_count{{{base}}} {_num(cumulative)}")
+    by_name: Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], float]]] = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, rows in by_name.items():
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in rows:
+            lines.append(f"{name}{{{_labels(labels)}}} {_num(value)}" if labels else f"{name} {_num(value)}")
+    return "\n".join(lines) + "\n"
@@ -1,26 +1,245 @@
 # app/tool_broker.py
 import httpx
-import time
 import asyncio
-from typing import Any, Dict
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
 from app.config import settings
 from app.tools.registry import ToolMeta
+from app.circuit_breaker import (BACKOFF_CAP_SECONDS, CircuitOpenError, backoff_delay, get_breaker,
+                                 get_retry_budget)
+from app.stage_metrics import timed
 
-def execute_http_tool(url: str, params: Dict[str,Any], tool_meta: ToolMeta):
-    timeout = httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS)
-    client = httpx.Client(timeout=timeout)
-    attempts = tool_meta.retries or settings.HTTP_RETRIES
-    backoff = settings.HTTP_BACKOFF_BASE
+T = TypeVar("T")
 
-    for attempt in range(attempts + 1):
+try:
+    import h2  # noqa: F401  (optional, enables HTTP/2 on httpx clients)
+    _H2_AVAILABLE = True
+except Exception:
+    _H2_AVAILABLE = False
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def timeout_for(tool_meta: Optional[ToolMeta]) -> httpx.Timeout:
+    """Per-call timeout derived from ToolMeta.timeout_seconds (settings default otherwise)."""
+    total = float(tool_meta.timeout_seconds) if tool_meta else settings.http_timeout_seconds
+    return httpx.Timeout(total, connect=min(total, settings.http_connect_timeout_seconds))
+
+
+class HttpClientManager:
+    """
+    Process-wide pooled HTTP clients.
+
+    One keep-alive pool per upstream origin, so `http_max_connections_per_host`
+    is a real per-host limit. Async clients are bound to the event loop that
+    created them; sync code runs coroutines on the manager's own background
+    loop via `run_sync`, so those clients are shared across requests too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        return {
+            "limits": httpx.Limits(
+                max_connections=settings.http_max_connections_per_host,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry_seconds,
+            ),
+            "timeout": httpx.Timeout(settings.http_timeout_seconds,
+                                     connect=settings.http_connect_timeout_seconds),
+            "http2": settings.http2_enabled and _H2_AVAILABLE,
+        }
+
+    def sync_client(self, url: str) -> httpx.Client:
+        origin = _origin(url)
+        client = self._sync.get(origin)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._sync.get(origin)
+                if client is None or client.is_closed:
+                    client = httpx.Client(**self._client_kwargs())
+                    self._sync[origin] = client
+        return client
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """Pooled AsyncClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        origin = _origin(url)
+        with self._lock:
+            per_loop = self._async.setdefault(loop, {})
+            client = per_loop.get(origin)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**self._client_kwargs())
+                per_loop[origin] = client
+        return client
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="tool-broker-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    def run_sync(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the shared broker loop from synchronous code.
+
+        Replaces per-call `asyncio.run(...)`, which would build (and discard) a
+        fresh event loop and connection pool on every tool call.
+
+        The calling thread blocks until the coroutine finishes. If the wait
+        ends early (timeout, interrupt), the coroutine is cancelled on the loop
+        instead of running on unobserved.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
         try:
-            r = client.get(url, params=params, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
-        except Exception as exc:
-            if attempt >= attempts:
-                raise
-            wait = backoff * (2 ** attempt)
-            # use time.sleep for sync context
-            time.sleep(wait)
-    raise RuntimeError("unreachable")
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def start(self) -> None:
+        self._ensure_loop()
+
+    async def _aclose_loop_clients(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            clients = list(self._async.pop(loop, {}).values())
+        for c in clients:
+            await c.aclose()
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._sync = list(self._sync.values()), {}
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        for c in clients:
+            c.close()
+        if loop is not None and not loop.is_closed():
+            try:
+                asyncio.run_coroutine_threadsafe(self._aclose_loop_clients(loop), loop).result(5)
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                if thread is not None:
+                    thread.join(timeout=5)
+                loop.close()
+
+    async def aclose(self) -> None:
+        """Close every pooled client (called from the FastAPI lifespan)."""
+        await self._aclose_loop_clients(asyncio.get_running_loop())
+        await asyncio.to_thread(self.close)
+
+
+http_clients = HttpClientManager()
+run_sync = http_clients.run_sync
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Transport errors, timeouts, 429 and 5xx are worth retrying; other 4xx are not."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code == 429 or code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+async def execute_http_tool_async(url: str,
+                                  params: Optional[Dict[str, Any]],
+                                  tool_meta: ToolMeta,
+                                  method: str = "GET",
+                                  json_body: Optional[Any] = None):
+    """
+    Call an HTTP tool through its circuit breaker and retry budget.
+
+    Raises CircuitOpenError without touching the network while the tool's
+    breaker is open, so callers drop straight into their fallback path.
+    Retries use full-jitter backoff on asyncio.sleep and stop as soon as the
+    tool's retry budget is exhausted.
+    """
+    client = http_clients.async_client(url)
+    timeout = timeout_for(tool_meta)
+
+    async def attempt():
+        r = await client.request(method, url, params=params, json=json_body, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    return await call_tool_async(tool_meta, attempt, is_retryable)
+
+
+async def call_tool_async(tool_meta: ToolMeta,
+                          attempt: Callable[[], Awaitable[T]],
+                          retryable: Callable[[Exception], bool] = is_retryable) -> T:
+    """
+    Run `attempt()` (one upstream call) under the tool's circuit breaker and
+    retry budget. Shared by HTTP tools and non-HTTP clients such as Qdrant's
+    gRPC search, so every transport opens the same breaker.
+    """
+    with timed("http", tool_meta.key) as timer:
+        return await _call_with_retries(tool_meta, attempt, retryable, timer)
+
+
+async def _call_with_retries(tool_meta: ToolMeta, attempt_once: Callable[[], Awaitable[T]],
+                             retryable_error: Callable[[Exception], bool], timer: timed) -> T:
+    breaker = get_breaker(tool_meta)
+    budget = get_retry_budget(tool_meta)
+    if not breaker.allow():
+        timer.status = "circuit_open"
+        raise CircuitOpenError(tool_meta.key, breaker.retry_after())
+    budget.record_request()
+    attempts = tool_meta.retries
+
+    # True while we hold a breaker admission (a half-open probe slot) whose
+    # outcome is not recorded yet. Cancellation is a BaseException and skips
+    # `except Exception`, so the slot is given back in `finally`.
+    admitted = True
+    try:
+        for attempt in range(attempts + 1):
+            try:
+                result = await attempt_once()
+                admitted = False
+                breaker.record_success()
+                return result
+            except Exception as exc:
+                retryable = retryable_error(exc)
+                admitted = False
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    # The upstream answered; a client-side error says nothing about its health
+                    breaker.record_success()
+                if (attempt >= attempts or not retryable
+                        or not budget.try_acquire() or not breaker.allow()):
+                    raise
+                admitted = True
+                await asyncio.sleep(backoff_delay(attempt))
+        raise RuntimeError("unreachable")
+    finally:
+        if admitted:
+            breaker.release()
+
+
+def execute_http_tool(url: str,
+                      params: Optional[Dict[str, Any]],
+                      tool_meta: ToolMeta,
+                      method: str = "GET",
+                      json_body: Optional[Any] = None):
+    """
+    Synchronous entry point. The calling thread blocks until the call settles.
+    Attempts and backoff sleeps run on the broker loop, and the wait is capped
+    at the tool's worst case (every attempt timing out plus maximal backoff),
+    after which the call is cancelled and TimeoutError raised.
+    """
+    attempts = tool_meta.retries + 1
+    budget = attempts * (tool_meta.timeout_seconds + settings.http_connect_timeout_seconds) + BACKOFF_CAP_SECONDS * tool_meta.retries
+    return run_sync(execute_http_tool_async(url, params, tool_meta, method=method, json_body=json_body),
+                    timeout=budget)
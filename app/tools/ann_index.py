@@ -0,0 +1,228 @@
+"""
+In-process ANN Index
+--------------------
+IVF-flat vector index on NumPy, used for knowledge lookups when Qdrant is
+disabled or unhealthy.
+
+Vectors are clustered with spherical k-means into `n_lists` inverted lists and
+stored contiguously by list, so a query scores only the `nprobe` closest lists
+with one matrix-vector product each. The index is persisted as `.npy` files
+that are opened with `mmap_mode='r'`: loading is instant and every worker
+process shares the same page-cache pages instead of holding its own copy.
+`build_on_disk` builds from a memory-mapped vector file in blocks (k-means
+on a sample), so indexing a large corpus never holds every vector in RAM.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .corpus import load_chunks
+from .embeddings import embed_texts, get_embedder
+
+FORMAT_VERSION = 1
+KMEANS_SAMPLE = 20_000
+BLOCK_ROWS = 8192
+
+
+def swap_into_place(tmp: Path, path: Path) -> None:
+    """Replace directory `path` with `tmp` (readers see the old or the new one, never a mix)."""
+    old = path.with_name(path.name + ".old")
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    if old.exists():
+        for f in old.iterdir():
+            f.unlink()
+        old.rmdir()
+
+
+def _kmeans(vectors: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine); returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+class IVFFlatIndex:
+    """Cosine-similarity IVF-flat index over unit vectors."""
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, offsets: np.ndarray,
+                 ids: np.ndarray, payloads: List[Dict[str, Any]], model_id: str):
+        self.centroids = centroids
+        self.vectors = vectors        # (n, dim), grouped by list
+        self.offsets = offsets        # list i spans vectors[offsets[i]:offsets[i+1]]
+        self.ids = ids                # row -> original document position
+        self.payloads = payloads      # by original position
+        self.model_id = model_id
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, payloads: Sequence[Dict[str, Any]], model_id: str,
+              n_lists: int = 0, seed: int = 0) -> "IVFFlatIndex":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        if n == 0:
+            return cls(np.zeros((0, 0), np.float32), vectors.reshape(0, 0), np.zeros(1, np.int64),
+                       np.zeros(0, np.int64), list(payloads), model_id)
+        k = min(n, n_lists or max(1, int(round(np.sqrt(n)))))
+        centroids = _kmeans(vectors, k, seed=seed) if k > 1 else vectors.mean(axis=0, keepdims=True)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.zeros(k + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=k), out=offsets[1:])
+        return cls(centroids.astype(np.float32), vectors[order], offsets, order.astype(np.int64),
+                   list(payloads), model_id)
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None) -> List[Tuple[float, int]]:
+        """Top-k (score, document position) by cosine similarity."""
+        if len(self) == 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        nprobe = min(len(self.centroids), nprobe or settings.vector_index_nprobe)
+        lists = np.argsort(-(self.centroids @ q))[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+        if rows.size == 0:
+            return []
+        scores = np.asarray(self.vectors[rows] @ q)
+        k = min(k, rows.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(self.ids[rows[i]])) for i in top]
+
+    def vectors_by_position(self) -> np.ndarray:
+        """All vectors in original document order (undoing the per-list grouping)."""
+        out = np.empty((len(self), self.dim), dtype=np.float32)
+        out[np.asarray(self.ids)] = self.vectors
+        return out
+
+    # -- persistence -----------------------------------------------------------
+    def _write_meta(self, tmp: Path) -> None:
+        np.save(tmp / "centroids.npy", self.centroids)
+        np.save(tmp / "offsets.npy", self.offsets)
+        np.save(tmp / "ids.npy", self.ids)
+        (tmp / "meta.json").write_text(json.dumps({
+            "format": FORMAT_VERSION, "model_id": self.model_id,
+            "count": len(self), "payloads": self.payloads}), encoding="utf-8")
+
+    def save(self, path: os.PathLike) -> None:
+        """Write to `path` atomically (a new directory is renamed into place)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / "vectors.npy", self.vectors)
+        self._write_meta(tmp)
+        swap_into_place(tmp, path)
+
+    @classmethod
+    def build_on_disk(cls, vectors: np.ndarray, payloads: Sequence[Dict[str, Any]], model_id: str,
+                      path: os.PathLike, n_lists: int = 0, seed: int = 0) -> "IVFFlatIndex":
+        """
+        Like `build` + `save`, for a (possibly memory-mapped) `vectors` array: centroids
+        are trained on a sample and rows are assigned and copied in blocks.
+        """
+        path = Path(path)
+        n, dim = vectors.shape
+        if n == 0:
+            index = cls.build(np.zeros((0, dim), np.float32), payloads, model_id)
+            index.save(path)
+            return cls.load(path)
+        k = min(n, n_lists or max(1, int(round(np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, max(KMEANS_SAMPLE, 64 * k)), replace=False))
+        train = np.asarray(vectors[sample], dtype=np.float32)
+        centroids = _kmeans(train, k, seed=seed) if k > 1 else train.mean(axis=0, keepdims=True)
+        assign = np.concatenate([np.argmax(np.asarray(vectors[i:i + BLOCK_ROWS], np.float32) @ centroids.T, axis=1)
+                                 for i in range(0, n, BLOCK_ROWS)])
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(k + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=k), out=offsets[1:])
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        out = np.lib.format.open_memmap(tmp / "vectors.npy", mode="w+", dtype=np.float32, shape=(n, dim))
+        for i in range(0, n, BLOCK_ROWS):
+            out[i:i + BLOCK_ROWS] = vectors[order[i:i + BLOCK_ROWS]]
+        out.flush()
+        del out
+        index = cls(centroids.astype(np.float32), np.zeros((0, dim), np.float32), offsets, order,
+                    list(payloads), model_id)
+        index._write_meta(tmp)
+        swap_into_place(tmp, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: os.PathLike, mmap: bool = True) -> "IVFFlatIndex":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported index format {meta.get('format')}")
+        mode = "r" if mmap else None
+        return cls(np.load(path / "centroids.npy"),
+                   np.load(path / "vectors.npy", mmap_mode=mode),
+                   np.load(path / "offsets.npy"),
+                   np.load(path / "ids.npy", mmap_mode=mode),
+                   meta["payloads"], meta["model_id"])
+
+
+def build_local_index(texts: Sequence[str], payloads: Sequence[Dict[str, Any]],
+                      vectors: Optional[np.ndarray] = None, path: Optional[os.PathLike] = None,
+                      embedder=None) -> IVFFlatIndex:
+    """Build and persist the local index (reusing `vectors` when the caller already embedded the texts)."""
+    embedder = embedder or get_embedder()
+    if vectors is None:
+        vectors = embed_texts(list(texts), embedder)
+    index = IVFFlatIndex.build(np.asarray(vectors, dtype=np.float32), payloads, embedder.model_id,
+                               n_lists=settings.vector_index_lists)
+    index.save(path or settings.vector_index_path)
+    return index
+
+
+_index: Optional[IVFFlatIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_local_index() -> IVFFlatIndex:
+    """Memory-mapped index from `vector_index_path`, built from the corpus when missing or stale."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                embedder = get_embedder()
+                index = None
+                try:
+                    index = IVFFlatIndex.load(settings.vector_index_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"[ann_index] Ignoring unreadable index: {e}")
+                if index is None or index.model_id != embedder.model_id:
+                    texts, payloads = load_chunks()
+                    index = build_local_index(texts, payloads, embedder=embedder)
+                _index = index
+    return _index
+
+
+def reset_local_index() -> None:
+    """Drop the loaded index so the next search reloads it from disk."""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,126 @@
+"""
+Content Store
+-------------
+Full chunk text, kept out of the search payloads.
+
+Search payloads carry only `title`, `chunk` and a precomputed `snippet`, which
+is everything the orchestrators render. Full text is fetched lazily by point
+id when a caller actually needs it. The store is a directory with:
+
+- `texts.bin`: UTF-8 chunk texts concatenated, memory-mapped.
+- `offsets.npy`: n+1 byte offsets into `texts.bin`.
+- `ids.json`: point ids, with row i holding id i.
+
+Like the indexes, it is written to a temp directory and swapped into place.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from ..config import settings
+from .ann_index import swap_into_place
+from .corpus import iter_chunks, iter_docs
+
+
+class ContentStoreWriter:
+    """Streams texts into a new store at `path` (published by `close`)."""
+
+    def __init__(self, path: Optional[os.PathLike] = None):
+        self.path = Path(path or settings.content_store_path)
+        self.tmp = self.path.with_name(self.path.name + ".tmp")
+        self.tmp.mkdir(parents=True, exist_ok=True)
+        self._texts: BinaryIO = open(self.tmp / "texts.bin", "wb")
+        self._offsets: List[int] = [0]
+        self._ids: List[str] = []
+
+    def add(self, point_id: str, text: str) -> None:
+        data = text.encode("utf-8")
+        self._texts.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._ids.append(point_id)
+
+    def close(self) -> "ContentStore":
+        self._texts.close()
+        np.save(self.tmp / "offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+        (self.tmp / "ids.json").write_text(json.dumps(self._ids), encoding="utf-8")
+        swap_into_place(self.tmp, self.path)
+        return ContentStore.load(self.path)
+
+    def abort(self) -> None:
+        self._texts.close()
+        for f in self.tmp.iterdir():
+            f.unlink()
+        self.tmp.rmdir()
+
+
+class ContentStore:
+    """Read side: text by point id or by row, from the memory-mapped texts file."""
+
+    def __init__(self, texts: np.ndarray, offsets: np.ndarray, ids: List[str]):
+        self._data = texts
+        self.offsets = offsets
+        self.ids = ids
+        self._rows: Dict[str, int] = {pid: i for i, pid in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> str:
+        a, b = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self._data[a:b]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (self[i] for i in range(len(self)))
+
+    def get(self, point_id: str) -> Optional[str]:
+        row = self._rows.get(point_id)
+        return None if row is None else self[row]
+
+    @classmethod
+    def load(cls, path: os.PathLike) -> "ContentStore":
+        path = Path(path)
+        offsets = np.load(path / "offsets.npy")
+        ids = json.loads((path / "ids.json").read_text(encoding="utf-8"))
+        size = int(offsets[-1])
+        texts = np.memmap(path / "texts.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+        return cls(texts, offsets, ids)
+
+
+def build_content_store(path: Optional[os.PathLike] = None) -> ContentStore:
+    writer = ContentStoreWriter(path)
+    for c in iter_chunks(iter_docs()):
+        writer.add(c.id, c.text)
+    return writer.close()
+
+
+_store: Optional[ContentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_content_store() -> ContentStore:
+    """Memory-mapped store from `content_store_path`, built from the corpus when missing."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = ContentStore.load(settings.content_store_path)
+                except FileNotFoundError:
+                    _store = build_content_store()
+    return _store
+
+
+def reset_content_store() -> None:
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def fetch_text(point_id: str) -> Optional[str]:
+    """Full text of a chunk (None if the id is unknown)."""
+    return get_content_store().get(point_id)
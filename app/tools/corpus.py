@@ -0,0 +1,120 @@
+"""
+Corpus
+------
+Discovery of the markdown documents that back knowledge lookups
+(`settings.seed_data_path`). Shared by `qdrant_seed.py`, the in-process vector
+index and the docs service so they all see the same corpus.
+
+Documents are indexed as token-bounded, overlapping chunks. Tokens are
+whitespace-delimited words, a cheap and model-agnostic stand-in for model
+tokens. Everything here is a generator, so a corpus is read one file at a
+time. A chunk's search payload is slim: title, position and a precomputed
+snippet. Full text lives in the content store (`content_store.py`) under the
+chunk's stable point id.
+"""
+
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from ..config import settings
+
+PathLike = Union[str, Path]
+POINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "intent-agent/docs")
+
+
+def point_id(title: str, chunk: int = 0) -> str:
+    """Stable point id for a chunk (same title and position -> same id across runs)."""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{title}#{chunk}"))
+
+
+def doc_dir(path: Optional[PathLike] = None) -> Path:
+    """Resolve the docs directory; relative paths are taken from the repo root."""
+    p = Path(path or settings.seed_data_path)
+    if not p.is_absolute() and not p.exists():
+        p = Path(__file__).resolve().parents[2] / p
+    return p
+
+
+def iter_doc_paths(path: Optional[PathLike] = None) -> Iterator[Path]:
+    root = doc_dir(path)
+    if root.exists():
+        yield from sorted(root.glob("*.md"))
+
+
+def load_docs(path: Optional[PathLike] = None) -> Tuple[List[str], List[str]]:
+    """(texts, titles) for every `.md` file, titles being the file names."""
+    docs, titles = [], []
+    for p in iter_doc_paths(path):
+        docs.append(p.read_text(encoding="utf-8"))
+        titles.append(p.name)
+    return docs, titles
+
+
+def iter_docs(path: Optional[PathLike] = None) -> Iterator[Tuple[str, str]]:
+    """(title, text) per `.md` file, one file in memory at a time."""
+    for p in iter_doc_paths(path):
+        yield p.name, p.read_text(encoding="utf-8")
+
+
+_WORD_RE = re.compile(r"\S+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def make_snippet(text: str, max_chars: Optional[int] = None) -> str:
+    """Whitespace-collapsed prefix of `text`, cut at a word boundary within `max_chars`."""
+    max_chars = max_chars or settings.snippet_chars
+    flat = _SPACE_RE.sub(" ", text).strip()
+    if len(flat) <= max_chars:
+        return flat
+    cut = flat.rfind(" ", 0, max_chars + 1)
+    return flat[:cut if cut > 0 else max_chars]
+
+
+class Chunk(NamedTuple):
+    title: str
+    chunk: int
+    text: str
+
+    @property
+    def id(self) -> str:
+        return point_id(self.title, self.chunk)
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """What the search indexes store (and return) for this chunk."""
+        return {"title": self.title, "chunk": self.chunk, "snippet": make_snippet(self.text)}
+
+
+def chunking_params() -> Dict[str, int]:
+    """Settings that decide chunk boundaries (recorded in the index manifest)."""
+    return {"max_tokens": settings.chunk_max_tokens, "overlap_tokens": settings.chunk_overlap_tokens}
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, overlap: Optional[int] = None) -> Iterator[str]:
+    """Windows of at most `max_tokens` words, consecutive windows sharing `overlap` words."""
+    max_tokens = max_tokens or settings.chunk_max_tokens
+    overlap = settings.chunk_overlap_tokens if overlap is None else overlap
+    step = max(1, max_tokens - overlap)
+    spans = [m.span() for m in _WORD_RE.finditer(text)]
+    for start in range(0, len(spans), step):
+        window = spans[start:start + max_tokens]
+        yield text[window[0][0]:window[-1][1]]
+        if start + max_tokens >= len(spans):
+            break
+
+
+def iter_chunks(docs: Optional[Iterator[Tuple[str, str]]] = None) -> Iterator[Chunk]:
+    for title, text in (iter_docs() if docs is None else docs):
+        for i, piece in enumerate(chunk_text(text)):
+            yield Chunk(title, i, piece)
+
+
+def load_chunks(path: Optional[PathLike] = None) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """(texts, slim payloads) of every chunk; for small rebuilds that need the whole corpus at once."""
+    texts, payloads = [], []
+    for c in iter_chunks(iter_docs(path)):
+        texts.append(c.text)
+        payloads.append(c.payload)
+    return texts, payloads
@@ -0,0 +1,122 @@
+"""
+Docs Search Index
+-----------------
+Incrementally maintained BM25 inverted index behind the docs service's
+`/search` (the orchestrators' HTTP fallback for knowledge lookups).
+
+The postings map term -> {doc id: term frequency}, and each document is a
+markdown file in `seed_data_path`. `refresh()` stats the directory and
+re-tokenizes only files whose (mtime, size) changed. Changed files have
+their old postings removed first, and deleted files are dropped. Document
+frequencies and the average length therefore stay exact without a rebuild.
+A query scores only the postings of its own terms, and `heapq` selects the
+top `offset + limit`, so the matching set is never fully sorted.
+"""
+
+import heapq
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+from .corpus import doc_dir, iter_doc_paths, make_snippet
+from .embeddings import tokenize
+from .sparse_index import B, K1
+
+
+class DocsSearchIndex:
+    def __init__(self, path: Optional[os.PathLike] = None):
+        self.path = path
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}     # id -> title, length, snippet, stamp
+        self.total_length = 0
+        self.refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    # -- incremental maintenance -----------------------------------------------
+    def _remove(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id)
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            plist = self.postings[term]
+            del plist[doc_id]
+            if not plist:
+                del self.postings[term]
+
+    def _add(self, doc_id: str, text: str, stamp: Tuple[int, int]) -> None:
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.total_length += length
+        self.docs[doc_id] = {"title": doc_id, "length": length, "terms": list(counts),
+                             "snippet": make_snippet(text), "stamp": stamp}
+
+    def refresh(self) -> Dict[str, int]:
+        """Re-index added / modified files and drop deleted ones; returns the counts."""
+        with self._lock:
+            seen, added, updated = set(), 0, 0
+            for p in iter_doc_paths(self.path):
+                st = p.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+                doc_id = p.name
+                seen.add(doc_id)
+                current = self.docs.get(doc_id)
+                if current is not None and current["stamp"] == stamp:
+                    continue
+                text = p.read_text(encoding="utf-8")
+                if current is not None:
+                    self._remove(doc_id)
+                    updated += 1
+                else:
+                    added += 1
+                self._add(doc_id, text, stamp)
+            removed = [d for d in self.docs if d not in seen]
+            for doc_id in removed:
+                self._remove(doc_id)
+            self.refreshed_at = time.monotonic()
+            return {"added": added, "updated": updated, "removed": len(removed), "docs": len(self.docs)}
+
+    def maybe_refresh(self, max_age_seconds: Optional[float] = None) -> None:
+        max_age = settings.docs_index_refresh_seconds if max_age_seconds is None else max_age_seconds
+        if time.monotonic() - self.refreshed_at >= max_age:
+            self.refresh()
+
+    # -- query -------------------------------------------------------------------
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        """BM25 over the query's terms; one page of hits plus the total number of matches."""
+        with self._lock:
+            n = len(self.docs)
+            avgdl = self.total_length / n if n else 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                df = len(plist)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in plist.items():
+                    dl = self.docs[doc_id]["length"]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (
+                        tf + K1 * (1 - B + B * dl / avgdl))
+            top = heapq.nlargest(offset + limit, scores.items(), key=lambda kv: (kv[1], kv[0]))[offset:]
+            items = [{"id": doc_id, "title": self.docs[doc_id]["title"], "score": round(score, 4),
+                      "snippet": self.docs[doc_id]["snippet"]} for doc_id, score in top]
+        next_offset = offset + len(items) if offset + len(items) < len(scores) else None
+        return {"query": query, "total": len(scores), "offset": offset, "limit": limit,
+                "next_offset": next_offset, "items": items}
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Full document by id (read from disk; the index keeps only postings and snippets)."""
+        with self._lock:
+            doc = self.docs.get(doc_id)
+        if doc is None:
+            return None
+        text = (doc_dir(self.path) / doc_id).read_text(encoding="utf-8")
+        return {"id": doc_id, "title": doc["title"], "text": text}
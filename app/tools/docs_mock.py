@@ -3,11 +3,33 @@ Mock Docs Service
 -----------------
 Simulates an external documents service endpoint for local testing.
 Runs on port 9010 when started via start_local.sh.
+
+Endpoints:
+- GET /search?q=&limit=&offset=  -> BM25 search over `seed_data_path` (paginated)
+- GET /docs/{doc_id}             -> one document (seed docs by file name, else mock data)
+- GET /health
 """
 
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Query
+
+from app.config import settings
+from app.tools.docs_index import DocsSearchIndex
+
+INDEX = DocsSearchIndex()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Prebuild the inverted index; later requests only re-read changed files
+    stats = await asyncio.to_thread(INDEX.refresh)
+    print(f"[Mock Docs] Indexed {stats['docs']} docs")
+    yield
 
-app = FastAPI(title="Docs Mock Service", version="1.0")
+
+app = FastAPI(title="Docs Mock Service", version="1.0", lifespan=lifespan)
 
 # Example mock data
 MOCK_DOCS = {
@@ -16,15 +38,29 @@ MOCK_DOCS = {
 }
 
 
+@app.get("/search")
+def search_docs(q: str = Query(..., min_length=1),
+                limit: int = Query(10, ge=1),
+                offset: int = Query(0, ge=0)):
+    """
+    Ranked docs for `q`: {"items": [{"id", "title", "score", "snippet"}], "total", "next_offset"}.
+    """
+    INDEX.maybe_refresh()
+    return INDEX.search(q, limit=min(limit, settings.docs_search_max_limit), offset=offset)
+
+
 @app.get("/docs/{doc_id}")
 async def get_doc(doc_id: str):
     """
     Mock endpoint that returns document details for testing.
     """
+    doc = INDEX.get(doc_id)
+    if doc is not None:
+        return doc
     return MOCK_DOCS.get(doc_id, {"error": "Document not found"})
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "ok", "service": "docs_mock"}
+    return {"status": "ok", "service": "docs_mock", "indexed_docs": len(INDEX)}
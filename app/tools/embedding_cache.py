@@ -0,0 +1,240 @@
+"""
+Embedding Cache
+---------------
+On-disk text -> vector cache shared by the seeder, the indexer and query-time
+embedding.
+
+Each embedding model gets its own directory under `embedding_cache_path`
+(named after its `model_id`, so vectors from different models or versions are
+never mixed). Inside are two append-only files:
+
+- `vectors.bin`: rows of `dim` float16 (or float32) values, read through
+  `np.memmap` so lookups touch only the pages they need and every worker
+  shares them through the page cache.
+- `keys.bin`: one 16-byte blake2b digest of the text per row.
+
+In memory, the index is two NumPy arrays: the first 8 bytes of each digest as
+a sorted uint64 array, and the matching row numbers. Lookups for a batch are
+one `np.searchsorted`, and new rows are merged in with `np.insert` (16 bytes
+per entry, no Python objects). A hit is confirmed against the full 16-byte key.
+
+Each row is appended to `vectors.bin` before its key, under an `flock`, so a
+reader never sees a key whose vector is missing. Other processes' appends are
+picked up when `keys.bin` grows. The append handles stay open. A writer checks
+the file sizes under the lock and truncates only when they are not whole,
+matching rows (a torn tail left by a writer that died mid-append).
+"""
+
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+KEY_BYTES = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+def _prefixes(keys: np.ndarray) -> np.ndarray:
+    """First 8 bytes of each (n, KEY_BYTES) uint8 key row, as uint64."""
+    return np.ascontiguousarray(keys[:, :8]).view("<u8").ravel()
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped vector store for one embedding model."""
+
+    def __init__(self, path: os.PathLike, model_id: str, dim: int, dtype: str = "float16",
+                 max_entries: int = 0):
+        self.path = Path(path) / re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+        self.model_id = model_id
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._prefix = np.zeros(0, dtype=np.uint64)       # sorted key prefixes
+        self._prefix_rows = np.zeros(0, dtype=np.int64)   # row of each prefix
+        self._keys = np.zeros((0, KEY_BYTES), dtype=np.uint8)
+        self._vectors = np.zeros((0, dim), dtype=self.dtype)
+        self._keys_size = -1
+        self._indexed = 0
+        self._files: Optional[Tuple] = None   # (keys, vectors) append handles
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = self.path / "meta.txt"
+        expected = f"{model_id}\n{dim}\n{self.dtype.name}\n"
+        if not meta.exists():
+            meta.write_text(expected, encoding="utf-8")
+        elif meta.read_text(encoding="utf-8") != expected:
+            # Same model id but a different layout (dim / dtype changed): start over
+            for name in ("keys.bin", "vectors.bin"):
+                (self.path / name).unlink(missing_ok=True)
+            meta.write_text(expected, encoding="utf-8")
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._keys)
+
+    # -- files -----------------------------------------------------------------
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _refresh(self) -> None:
+        """(Re)map the files if another writer (or we) appended rows since the last look."""
+        try:
+            size = self._file("keys.bin").stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size == self._keys_size:
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        try:
+            vec_rows = self._file("vectors.bin").stat().st_size // row_bytes
+        except FileNotFoundError:
+            vec_rows = 0
+        n = min(size // KEY_BYTES, vec_rows)
+        if n == 0:
+            self._keys = np.zeros((0, KEY_BYTES), dtype=np.uint8)
+            self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+        else:
+            self._keys = np.memmap(self._file("keys.bin"), dtype=np.uint8, mode="r", shape=(n, KEY_BYTES))
+            self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(n, self.dim))
+        if n > self._indexed:
+            new = _prefixes(self._keys[self._indexed:n])
+            order = np.argsort(new, kind="stable")
+            new_rows = np.arange(self._indexed, n, dtype=np.int64)[order]
+            # side="right": on a prefix collision the older row stays first
+            at = np.searchsorted(self._prefix, new[order], side="right")
+            self._prefix = np.insert(self._prefix, at, new[order])
+            self._prefix_rows = np.insert(self._prefix_rows, at, new_rows)
+        elif n < self._indexed:
+            self._prefix = np.zeros(0, dtype=np.uint64)
+            self._prefix_rows = np.zeros(0, dtype=np.int64)
+            self._indexed = 0
+            self._keys_size = -1
+            return self._refresh()
+        self._indexed = n
+        self._keys_size = size
+
+    def _find_many(self, keys: Sequence[bytes]) -> np.ndarray:
+        """Row of each key, -1 where it is not cached."""
+        if not keys or not len(self._prefix):
+            return np.full(len(keys), -1, dtype=np.int64)
+        wanted = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), KEY_BYTES)
+        at = np.searchsorted(self._prefix, _prefixes(wanted))
+        at = np.minimum(at, len(self._prefix) - 1)
+        rows = self._prefix_rows[at]
+        found = (self._prefix[at] == _prefixes(wanted)) & (self._keys[rows] == wanted).all(axis=1)
+        return np.where(found, rows, -1)
+
+    def _open_files(self):
+        """Append handles, reopened if the files were replaced (layout reset by another process)."""
+        if self._files is not None and all(os.fstat(f.fileno()).st_nlink for f in self._files):
+            return self._files
+        if self._files is not None:
+            for f in self._files:
+                f.close()
+        self._files = (open(self._file("keys.bin"), "ab"), open(self._file("vectors.bin"), "ab"))
+        return self._files
+
+    def _repair_tail(self, kf, vf) -> None:
+        """Under the flock: cut back to whole, matching rows if a writer died mid-append."""
+        row_bytes = self.dim * self.dtype.itemsize
+        key_size, vec_size = os.fstat(kf.fileno()).st_size, os.fstat(vf.fileno()).st_size
+        n = min(key_size // KEY_BYTES, vec_size // row_bytes)
+        if key_size != n * KEY_BYTES or vec_size != n * row_bytes:
+            kf.truncate(n * KEY_BYTES)
+            vf.truncate(n * row_bytes)
+
+    # -- API -------------------------------------------------------------------
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            self._refresh()
+            rows = self._find_many(keys)
+            out = [None if r < 0 else np.asarray(self._vectors[r], dtype=np.float32) for r in rows]
+            hits = int((rows >= 0).sum())
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> int:
+        """Append vectors for texts not cached yet; returns how many rows were written."""
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(len(texts), self.dim)
+        keys = [text_key(t) for t in texts]
+        with self._lock:
+            kf, vf = self._open_files()
+            fcntl.flock(kf, fcntl.LOCK_EX)
+            try:
+                self._repair_tail(kf, vf)
+                self._refresh()     # remaps only if someone else appended since our last look
+                room = (self.max_entries - len(self._keys)) if self.max_entries else len(texts)
+                seen, rows = set(), []
+                for i, (k, row) in enumerate(zip(keys, self._find_many(keys))):
+                    if row < 0 and k not in seen:
+                        seen.add(k)
+                        rows.append((i, k))
+                rows = rows[:max(0, room)]
+                if rows:
+                    vf.write(np.ascontiguousarray(vectors[[i for i, _ in rows]]).tobytes())
+                    vf.flush()
+                    kf.write(b"".join(k for _, k in rows))
+                    kf.flush()
+            finally:
+                fcntl.flock(kf, fcntl.LOCK_UN)
+        return len(rows)
+
+    def encode(self, texts: Sequence[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Vectors for `texts`, calling `encode` only for the ones not cached."""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        cached = self.get_many(texts)
+        todo = [i for i, v in enumerate(cached) if v is None]
+        for i, v in enumerate(cached):
+            if v is not None:
+                out[i] = v
+        if todo:
+            fresh = np.asarray(encode([texts[i] for i in todo]), dtype=np.float32)
+            out[todo] = fresh
+            self.put_many([texts[i] for i in todo], fresh)
+        if self.dtype != np.float32 and len(texts) > len(todo):
+            # float16 rounding leaves cached rows a hair off unit length
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms > 0, norms, 1.0)
+        return out
+
+    def stats(self) -> Dict[str, object]:
+        entries = len(self)
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"model_id": self.model_id, "entries": entries, "hits": hits, "misses": misses,
+                "dtype": self.dtype.name}
+
+
+_caches: Dict[tuple, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(embedder) -> Optional[EmbeddingCache]:
+    """Cache for `embedder`'s model under `embedding_cache_path`, or None when disabled."""
+    if not settings.embedding_cache_enabled:
+        return None
+    key = (settings.embedding_cache_path, embedder.model_id)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = EmbeddingCache(settings.embedding_cache_path, embedder.model_id, embedder.dim,
+                                       settings.embedding_cache_dtype, settings.embedding_cache_max_entries)
+                _caches[key] = cache
+    return cache
@@ -0,0 +1,117 @@
+"""
+Embeddings
+----------
+Text -> vector encoders shared by the seeder and query-time retrieval.
+
+`sentence-transformers` is used when it is installed (and selected); otherwise
+a signed feature-hashing embedder over word unigrams and bigrams gives
+deterministic, dependency-free vectors. Every embedder exposes a `model_id`
+so indexes built with one model are never queried with another.
+
+`embed_texts` goes through the on-disk embedding cache (`embedding_cache.py`),
+so unchanged documents and repeated queries are never encoded twice.
+"""
+
+import hashlib
+import re
+import threading
+from typing import List, Sequence
+
+import numpy as np
+
+from ..config import settings
+from .embedding_cache import get_embedding_cache
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+class HashingEmbedder:
+    """Signed hashing of unigrams + bigrams into `dim` buckets, L2-normalized."""
+
+    semantic = False
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.model_id = f"hashing-v1-{dim}"
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        if not features:
+            return vec
+        h = np.fromiter((_hash64(f) for f in features), dtype=np.uint64, count=len(features))
+        signs = np.where(h >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        np.add.at(vec, (h % np.uint64(self.dim)).astype(np.int64), signs)
+        # Sublinear term frequency keeps long documents from being dominated by repeats
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        return vec
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.stack([self._encode_one(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        return normalize(out)
+
+
+class SentenceTransformerEmbedder:
+    """Thin wrapper so the semantic model exposes the same interface."""
+
+    semantic = True
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.model_id = f"st:{model_name}:{self.dim}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vecs = self.model.encode(list(texts), show_progress_bar=False, convert_to_numpy=True)
+        return normalize(np.asarray(vecs, dtype=np.float32))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Process-wide embedder selected by `embedding_backend` (auto prefers sentence-transformers)."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                backend = settings.embedding_backend.lower()
+                if backend in ("auto", "sentence_transformers"):
+                    try:
+                        _embedder = SentenceTransformerEmbedder(settings.embedding_model)
+                    except Exception as e:
+                        if backend == "sentence_transformers":
+                            raise
+                        print(f"[embeddings] sentence-transformers unavailable ({e}); using hashing embedder")
+                if _embedder is None:
+                    _embedder = HashingEmbedder(settings.embedding_dim)
+    return _embedder
+
+
+def embed_texts(texts: Sequence[str], embedder=None, use_cache: bool = True) -> np.ndarray:
+    """(n, dim) float32 unit vectors; cached vectors are reused when `use_cache`."""
+    embedder = embedder or get_embedder()
+    cache = get_embedding_cache(embedder) if use_cache else None
+    if cache is None:
+        return embedder.encode(texts)
+    return cache.encode(list(texts), embedder.encode)
+
+
+def embed_query(text: str, embedder=None) -> np.ndarray:
+    return embed_texts([text], embedder)[0]
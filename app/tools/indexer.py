@@ -0,0 +1,396 @@
+"""
+Indexer
+-------
+Incremental, content-hash based (re)indexing of the docs corpus.
+
+Documents are split into token-bounded, overlapping chunks (`corpus.py`); one
+chunk is one point. A manifest (`index_manifest_path`) records the embedding
+model, the chunking parameters and, per document, a sha256 and its chunk count
+(point ids are uuid5 of title#chunk, so they are stable). Qdrant is tracked
+separately under `qdrant`: the physical collection, its parameters, model and
+chunking, and the per-document hashes last published to it. A run without a
+client (local-only, or Qdrant down) leaves that record alone, so the next run
+with a client still upserts everything Qdrant missed.
+
+A run streams the corpus twice, one file at a time. The first pass hashes the
+documents and measures chunk lengths. The second chunks -> batches -> embeds
+on a worker pool -> uploads with bounded in-flight upserts (`pipeline.py`).
+Only chunks of new or changed documents are embedded (through the embedding
+cache) and upserted. Unchanged chunks reuse the vectors already in the local
+index. Removed documents and trailing chunks are deleted. Vectors stream into
+a memory-mapped file, from which the local IVF index is built in blocks.
+
+Points and local indexes carry slim payloads (title, chunk, snippet). The
+full chunk texts are streamed into the content store (`content_store.py`),
+which the sparse index is then built from.
+
+A full rebuild (new model, vector size, chunking parameters,
+`qdrant_store.collection_params()` or `--force`) is written to a fresh collection and published by swapping the
+`qdrant_collection` alias, so searches never see a missing or half-built
+collection. `ReindexScheduler` runs this every
+`embeddings_reindex_interval_hours`.
+
+A run holds an exclusive `flock` on `<index_manifest_path>.lock` from start to
+finish, so the schedulers in several uvicorn workers (or a CLI run next to the
+server) never reindex at the same time. A scheduled run that finds the lock
+taken is skipped, because another process is already doing the work.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .ann_index import IVFFlatIndex, reset_local_index
+from .content_store import ContentStoreWriter, reset_content_store
+from .corpus import Chunk, chunk_text, chunking_params, iter_chunks, iter_docs, point_id
+from .embedding_cache import get_embedding_cache
+from .embeddings import embed_texts, get_embedder, tokenize
+from .pipeline import BoundedUploader, Throughput, batched, count_docs, embed_batches
+from .qdrant_store import collection_params, create_collection
+from .sparse_index import SPARSE_VECTOR_NAME, build_sparse_index, doc_sparse_vectors, reset_sparse_index
+
+MANIFEST_FORMAT = 3
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: Optional[os.PathLike] = None) -> Dict[str, Any]:
+    p = Path(path or settings.index_manifest_path)
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {"format": MANIFEST_FORMAT, "model_id": None, "docs": {}, "qdrant": {}}
+
+
+def save_manifest(manifest: Dict[str, Any], path: Optional[os.PathLike] = None) -> None:
+    p = Path(path or settings.index_manifest_path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def _previous_rows(model_id: str) -> Tuple[Optional[IVFFlatIndex], Dict[Tuple[str, int], int]]:
+    """The current local index (if built with `model_id`) and its row per (title, chunk)."""
+    try:
+        index = IVFFlatIndex.load(settings.vector_index_path)
+    except Exception:
+        return None, {}
+    if index.model_id != model_id or len(index) == 0:
+        return None, {}
+    row_of = np.empty(len(index), dtype=np.int64)
+    row_of[np.asarray(index.ids)] = np.arange(len(index))
+    return index, {(p["title"], p.get("chunk", 0)): int(row_of[i]) for i, p in enumerate(index.payloads)}
+
+
+# -- Qdrant -------------------------------------------------------------------
+def qdrant_client():
+    """A QdrantClient when `use_qdrant` is on and qdrant-client is importable, else None."""
+    if not settings.use_qdrant:
+        return None
+    try:
+        from qdrant_client import QdrantClient
+    except Exception:
+        return None
+    return QdrantClient(url=settings.qdrant_url)
+
+
+def _points(chunks: Sequence[Chunk], vectors: np.ndarray, sparse: Sequence) -> List[Any]:
+    from qdrant_client.http.models import PointStruct, SparseVector
+    return [PointStruct(id=c.id,
+                        vector={"": v.tolist(),
+                                SPARSE_VECTOR_NAME: SparseVector(indices=idx.tolist(), values=val.tolist())},
+                        payload=c.payload)
+            for c, v, (idx, val) in zip(chunks, vectors, sparse)]
+
+
+def _resolve_alias(client, alias: str) -> Optional[str]:
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def _swap_alias(client, alias: str, collection: str) -> None:
+    """Point `alias` at `collection` in one atomic alias update."""
+    from qdrant_client.http.models import (CreateAlias, CreateAliasOperation, DeleteAlias,
+                                           DeleteAliasOperation)
+    ops = []
+    if _resolve_alias(client, alias) is not None:
+        ops.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    ops.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+
+
+class QdrantSync:
+    """
+    Streams upserts into the collection behind `qdrant_collection`, or into a fresh
+    one when rebuilding, which `finish` then publishes by swapping the alias.
+    """
+
+    def __init__(self, client, dim: int, rebuild: bool):
+        self.client = client
+        self.alias = settings.qdrant_collection
+        self.current = _resolve_alias(client, self.alias)
+        self.legacy = self.current is None and client.collection_exists(self.alias)
+        target = self.current or (self.alias if self.legacy else None)
+        if target is not None and not rebuild:
+            rebuild = client.get_collection(target).config.params.vectors.size != dim
+        self.rebuild = target is None or rebuild
+        if self.rebuild:
+            # Build a fresh collection next to the live one, then publish it via the alias
+            self.collection = f"{self.alias}_{int(time.time())}"
+            create_collection(client, self.collection, dim)
+        else:
+            self.collection = target
+        self.uploader = BoundedUploader(
+            lambda pts: client.upsert(collection_name=self.collection, points=pts, wait=True),
+            settings.index_max_inflight_upserts)
+
+    def upsert(self, chunks: Sequence[Chunk], vectors: np.ndarray, avgdl: float) -> None:
+        sparse, _ = doc_sparse_vectors([c.text for c in chunks], avgdl)
+        self.uploader.submit(_points(chunks, vectors, sparse))
+
+    def finish(self, stale_ids: Sequence[str]) -> str:
+        """Wait for uploads, drop stale points and (on rebuild) publish; returns the physical collection."""
+        from qdrant_client.http.models import PointIdsList
+        self.uploader.close()
+        if not self.rebuild:
+            for batch in batched(stale_ids, settings.index_batch_size):
+                self.client.delete(collection_name=self.collection, points_selector=PointIdsList(points=batch))
+            return self.collection
+        if self.legacy:
+            # A physical collection squats the alias name; it has to go before the alias can exist
+            self.client.delete_collection(self.alias)
+        _swap_alias(self.client, self.alias, self.collection)
+        if self.current is not None and self.current != self.collection:
+            self.client.delete_collection(self.current)
+        return self.collection
+
+    def abort(self) -> None:
+        try:
+            self.uploader.close()
+        except Exception:
+            pass
+        if self.rebuild:
+            self.client.delete_collection(self.collection)
+
+
+# -- reindex ------------------------------------------------------------------
+_reindex_lock = threading.Lock()     # threads of this process; the flock covers other processes
+
+
+@contextmanager
+def _exclusive_reindex(wait: bool) -> Iterator[bool]:
+    """Hold the reindex lock (thread lock + flock next to the manifest); yields False if busy and not `wait`."""
+    if not _reindex_lock.acquire(blocking=wait):
+        yield False
+        return
+    try:
+        lock_path = Path(settings.index_manifest_path + ".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        _reindex_lock.release()
+
+
+def reindex(doc_path: Optional[os.PathLike] = None, client=None, force: bool = False,
+            wait: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Bring the local indexes (and Qdrant, when `client` is given) in line with the corpus.
+    Returns counts of added/changed/removed/unchanged documents plus pipeline throughput,
+    or None when `wait` is False and another thread or process is already reindexing.
+    """
+    with _exclusive_reindex(wait) as acquired:
+        if not acquired:
+            return None
+        started = time.perf_counter()
+        embedder = get_embedder()
+        manifest = load_manifest()
+        # New chunk boundaries change the text behind every (title, chunk) id, so
+        # no stored vector or point can be reused
+        rebuild = (force or manifest.get("model_id") != embedder.model_id
+                   or manifest.get("format") != MANIFEST_FORMAT
+                   or manifest.get("chunking") != chunking_params())
+        known = {} if rebuild else manifest.get("docs", {})
+
+        # Pass 1: hashes and chunk lengths (BM25 needs the corpus-wide average up front)
+        hashes: Dict[str, str] = {}
+        n_chunks = total_len = 0
+        for title, text in iter_docs(doc_path):
+            hashes[title] = content_hash(text)
+            for piece in chunk_text(text):
+                n_chunks += 1
+                total_len += len(tokenize(piece))
+        avgdl = total_len / n_chunks if total_len else 1.0
+
+        added = [t for t in hashes if t not in known]
+        changed = [t for t in hashes if t in known and known[t]["hash"] != hashes[t]]
+        removed = [t for t in manifest.get("docs", {}) if t not in hashes]
+        # What Qdrant last received, independent of the local indexes (a manifest
+        # without this record predates it: republish everything)
+        published = manifest.get("qdrant") or {}
+        qdocs = published.get("docs", {})
+        stats = {"added": len(added), "changed": len(changed), "removed": len(removed),
+                 "unchanged": len(hashes) - len(added) - len(changed), "embedded": 0,
+                 "collection": published.get("collection")}
+        local_ok = Path(settings.vector_index_path).exists() and Path(settings.sparse_index_path).exists()
+        # Never synced to Qdrant, or built with another model / chunking / storage options: publish everything
+        qdrant_rebuild = client is not None and (
+            rebuild or published.get("collection") is None
+            or published.get("collection_params") != collection_params()
+            or published.get("model_id") != embedder.model_id or published.get("chunking") != chunking_params())
+        qdrant_dirty = {t for t in hashes if t not in qdocs or qdocs[t]["hash"] != hashes[t]}
+        qdrant_ok = client is None or not (qdrant_rebuild or qdrant_dirty or any(t not in hashes for t in qdocs))
+        if not (added or changed or removed or rebuild) and local_ok and qdrant_ok:
+            stats["seconds"] = round(time.perf_counter() - started, 3)
+            return stats
+
+        # Pass 2: stream chunks -> embed -> upsert, spooling vectors to disk for the local index
+        dirty = set(added) | set(changed)
+        previous, prev_rows = (None, {}) if rebuild else _previous_rows(embedder.model_id)
+        cache = get_embedding_cache(embedder)
+        hits_before = cache.hits if cache else 0
+        embedded: List[int] = []
+
+        def encode(batch: List[Chunk]) -> np.ndarray:
+            out = np.empty((len(batch), embedder.dim), dtype=np.float32)
+            todo = []
+            for i, c in enumerate(batch):
+                row = None if c.title in dirty else prev_rows.get((c.title, c.chunk))
+                if row is None:
+                    todo.append(i)
+                else:
+                    out[i] = previous.vectors[row]
+            if todo:
+                out[todo] = embed_texts([batch[i].text for i in todo], embedder)
+            embedded.append(len(todo))
+            return out
+
+        sync = (QdrantSync(client, embedder.dim, rebuild or qdrant_rebuild)
+                if client is not None and n_chunks else None)
+        spool = Path(settings.vector_index_path).with_name(Path(settings.vector_index_path).name + ".spool")
+        spool.mkdir(parents=True, exist_ok=True)
+        payloads: List[Dict[str, Any]] = []
+        chunk_counts: Dict[str, int] = {}
+        throughput = Throughput()
+        contents = ContentStoreWriter()
+        try:
+            with open(spool / "vectors.f32", "wb") as vf:
+                batches = batched(iter_chunks(iter_docs(doc_path)), settings.index_batch_size)
+                for batch, vectors in embed_batches(batches, encode, workers=settings.index_embed_workers):
+                    vf.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                    for c in batch:
+                        contents.add(c.id, c.text)
+                        payloads.append(c.payload)
+                        chunk_counts[c.title] = c.chunk + 1
+                    throughput.add(docs=count_docs(batch), chunks=len(batch))
+                    if sync is not None:
+                        keep = [i for i, c in enumerate(batch) if sync.rebuild or c.title in qdrant_dirty]
+                        if keep:
+                            sync.upsert([batch[i] for i in keep], vectors[keep], avgdl)
+
+            n = len(payloads)
+            vectors = (np.memmap(spool / "vectors.f32", dtype=np.float32, mode="r", shape=(n, embedder.dim))
+                       if n else np.zeros((0, embedder.dim), np.float32))
+            IVFFlatIndex.build_on_disk(vectors, payloads, embedder.model_id, settings.vector_index_path,
+                                       n_lists=settings.vector_index_lists)
+            del vectors, previous
+            store = contents.close()
+            contents = None
+            build_sparse_index(store, payloads)
+            reset_local_index()
+            reset_sparse_index()
+            reset_content_store()
+
+            if sync is not None:
+                stale = [point_id(t, i) for t, entry in qdocs.items()
+                         for i in range(chunk_counts.get(t, 0), entry.get("chunks", 0))]
+                published = {"collection": sync.finish(stale), "collection_params": collection_params(),
+                             "model_id": embedder.model_id, "chunking": chunking_params(),
+                             "docs": {t: {"hash": hashes[t], "chunks": chunk_counts.get(t, 0)} for t in hashes}}
+        except BaseException:
+            if sync is not None:
+                sync.abort()
+            if contents is not None:
+                contents.abort()
+            raise
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+
+        save_manifest({"format": MANIFEST_FORMAT, "model_id": embedder.model_id, "chunking": chunking_params(),
+                       "docs": {t: {"hash": hashes[t], "chunks": chunk_counts.get(t, 0)} for t in hashes},
+                       "qdrant": published})
+        stats.update(throughput.stats())
+        stats["embedded"] = sum(embedded)
+        stats["embedding_cache_hits"] = (cache.hits - hits_before) if cache else 0
+        stats["collection"] = published.get("collection")
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+
+class ReindexScheduler:
+    """Runs `reindex` every `interval_hours` on a worker thread; searches keep serving meanwhile."""
+
+    def __init__(self, interval_hours: float):
+        self.interval_seconds = interval_hours * 3600.0
+        self._task: Optional[asyncio.Task] = None
+        self.last_stats: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    async def run_once(self) -> Optional[Dict[str, Any]]:
+        try:
+            stats = await asyncio.to_thread(lambda: reindex(client=qdrant_client(), wait=False))
+            self.last_error = None
+            if stats is None:
+                print("[indexer] Reindex skipped: another process holds the reindex lock")
+                return self.last_stats
+            self.last_stats = stats
+            print(f"[indexer] Reindex finished: {self.last_stats}")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[indexer] Reindex failed: {e}")
+        return self.last_stats
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.run_once()
+
+    def start(self) -> None:
+        if self.interval_seconds > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+
+reindex_scheduler = ReindexScheduler(settings.embeddings_reindex_interval_hours)
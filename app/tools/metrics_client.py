@@ -1,59 +1,117 @@
-import httpx
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional
 from ..config import settings
+from ..stage_metrics import timed
+from ..schemas import MetricsBatchRequest, MetricsBatchResponse, MetricsQuery, MetricsResult
+from ..tool_broker import execute_http_tool_async
+from .registry import DEFAULT_TOOL_REGISTRY
+from .metrics_store import STORE, query_result
+from .util_tool import record_service_latencies, record_service_latencies_async
 
 
-async def call_metrics(service: str, window: str = "1h", timeout: Optional[float] = None) -> Dict[str, Any]:
+def _tool_meta(timeout: Optional[float]):
+    meta = DEFAULT_TOOL_REGISTRY["metrics_tool"]
+    return meta.model_copy(update={"timeout_seconds": timeout}) if timeout else meta
+
+
+# Live readings waiting to be written to SQLite in one batched insert
+_pending: List[Dict[str, Any]] = []
+_pending_since = 0.0
+_pending_lock = threading.Lock()
+
+
+def _take_pending(force: bool = False) -> List[Dict[str, Any]]:
+    global _pending, _pending_since
+    with _pending_lock:
+        if not _pending or not (force or len(_pending) >= settings.sql_record_batch_rows
+                                or time.monotonic() - _pending_since >= settings.sql_record_flush_seconds):
+            return []
+        rows, _pending = _pending, []
+        return rows
+
+
+async def _remember(results: List[MetricsResult]) -> None:
+    """Buffer fresh p95/p99 readings for the SQL summary table used by calc_compare."""
+    global _pending_since
+    if not settings.sql_record_live_metrics:
+        return
+    now = time.time()
+    rows = [{"service": r.data.service, "p95_ms": r.data.p95_latency, "p99_ms": r.data.p99_latency, "ts": now}
+            for r in results if r.success and r.data and r.data.p95_latency is not None]
+    if rows:
+        with _pending_lock:
+            if not _pending:
+                _pending_since = time.monotonic()
+            _pending.extend(rows)
+    batch = _take_pending()
+    if batch:
+        try:
+            await record_service_latencies_async(batch)
+        except Exception as e:
+            print(f"[metrics_client] Failed to record latencies: {e}")
+
+
+def flush_recorded_latencies() -> int:
+    """Write whatever live readings are still buffered (called on shutdown)."""
+    rows = _take_pending(force=True)
+    return record_service_latencies(rows) if rows else 0
+
+
+@timed("tool", "metrics_tool", status_of=lambda r: "ok" if r.success else "error")
+async def call_metrics(service: str,
+                       window: str = "1h",
+                       metric: Optional[str] = None,
+                       timeout: Optional[float] = None) -> MetricsResult:
+    """
+    Fetch aggregated metrics for a service and time window from the metrics service.
+    Goes through the pooled client / circuit breaker in tool_broker; failures are
+    returned as `MetricsResult(success=False)` rather than raised.
+
+    With `metrics_source=inprocess` the local MetricsStore is queried directly.
+    """
+    if settings.metrics_source == "inprocess":
+        result = query_result(STORE, MetricsQuery(service=service, window=window, metric=metric))
+        await _remember([result])
+        return result
+    params = {"service": service, "window": window}
+    if metric:
+        params["metric"] = metric
+    try:
+        payload = await execute_http_tool_async(
+            f"{settings.metrics_base_url}/metrics/query", params, _tool_meta(timeout))
+        result = MetricsResult.model_validate(payload)
+    except Exception as e:
+        return MetricsResult(
+            success=False,
+            error=str(e),
+            message=f'Failed to fetch metrics for {service} (last {window}): {e}',
+        )
+    await _remember([result])
+    return result
+
+
+@timed("tool", "metrics_tool", status_of=lambda rs: "ok" if all(r.success for r in rs) else "error")
+async def call_metrics_batch(queries: List[MetricsQuery],
+                             timeout: Optional[float] = None) -> List[MetricsResult]:
     """
-    Lightweight metrics mock client used by the orchestrator.
-    Returns mock metrics data for the specified service and time window.
+    Fetch many (service, window, metric) tuples in one round trip.
+    Results are returned in the same order as `queries`.
     """
-    # Mock data generation
-    import random
-    from datetime import datetime, timedelta
-    
+    if not queries:
+        return []
+    if settings.metrics_source == "inprocess":
+        results = [query_result(STORE, q) for q in queries]
+        await _remember(results)
+        return results
     try:
-        # Generate some mock metrics data
-        current_time = datetime.utcnow()
-        
-        # Parse window (e.g., '5m', '1h', '24h')
-        if window.endswith('m'):
-            minutes = int(window[:-1])
-            start_time = current_time - timedelta(minutes=minutes)
-        elif window.endswith('h'):
-            hours = int(window[:-1])
-            start_time = current_time - timedelta(hours=hours)
-        elif window.endswith('d'):
-            days = int(window[:-1])
-            start_time = current_time - timedelta(days=days)
-        else:
-            start_time = current_time - timedelta(minutes=5)  # default to 5 minutes
-        
-        # Generate mock metrics
-        metrics = {
-            'service': service,
-            'window': window,
-            'start_time': start_time.isoformat(),
-            'end_time': current_time.isoformat(),
-            'p95_latency': round(random.uniform(200, 400), 2),  # Ensure p95 is above 200ms for testing
-            'p99_latency': round(random.uniform(100, 300), 2),
-            'error_rate': round(random.uniform(0.1, 5.0), 2),
-            'request_count': random.randint(1000, 10000),
-            'success_rate': round(random.uniform(95.0, 99.9), 2),
-            'status': 'success'
-        }
-        
-        return {
-            'success': True,
-            'data': metrics,
-            'message': f'Mock metrics for {service} (last {window})'
-        }
-        
+        payload = await execute_http_tool_async(
+            f"{settings.metrics_base_url}/metrics/query_batch", None, _tool_meta(timeout),
+            method="POST", json_body=MetricsBatchRequest(queries=queries).model_dump())
+        results = MetricsBatchResponse.model_validate(payload).results
     except Exception as e:
-        return {
-            'success': False,
-            'error': str(e),
-            'service': service,
-            'window': window,
-            'message': f'Failed to generate mock metrics: {str(e)}'
-        }
+        return [MetricsResult(success=False, error=str(e),
+                              message=f'Failed to fetch metrics for {q.service} (last {q.window}): {e}')
+                for q in queries]
+    await _remember(results)
+    return results
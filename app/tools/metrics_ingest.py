@@ -0,0 +1,228 @@
+"""
+Metrics Bulk Ingest
+-------------------
+Streaming NDJSON ingest for the metrics service.
+
+Request bodies (plain or gzip-compressed NDJSON, one sample per line) are
+parsed incrementally as chunks arrive, grouped into per-service batches and
+put on a bounded queue. A background aggregator drains the queue into the
+MetricsStore's time buckets. When the queue stays full the endpoint stops
+reading and answers 429 with how many lines were consumed, so emitters can
+back off and resume instead of the service buffering without bound.
+"""
+
+import asyncio
+import json
+import math
+import time
+import zlib
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics_store import MetricsStore
+
+# service -> (latencies_ms, errors, timestamps)
+Batch = Dict[str, Tuple[List[float], List[bool], List[float]]]
+
+_TRUE = frozenset(("true", "1", "yes", "y", "t"))
+_FALSE = frozenset(("false", "0", "no", "n", "f", ""))
+
+
+def parse_bool(value: Any) -> bool:
+    """JSON booleans, 0/1 and the usual strings ("false" is False); anything else raises ValueError."""
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        v = value.strip().lower()
+        if v in _TRUE:
+            return True
+        if v in _FALSE:
+            return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+class NDJSONParser:
+    """Incremental NDJSON decoder; feed() arbitrary byte chunks, get complete rows back."""
+
+    def __init__(self, gzipped: bool = False):
+        # wbits=16+MAX_WBITS accepts the gzip container
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        self._buf = b""
+        self.bad_lines = 0
+        self.lines_read = 0     # every newline-terminated (or final) line, blank ones included
+
+    def _lines(self, data: bytes) -> Iterator[bytes]:
+        self._buf += data
+        *lines, self._buf = self._buf.split(b"\n")
+        return iter(lines)
+
+    def _decode(self, lines: Iterator[bytes]) -> Iterator[Dict[str, Any]]:
+        for line in lines:
+            self.lines_read += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                self.bad_lines += 1
+                continue
+            if isinstance(row, dict):
+                yield row
+            else:
+                self.bad_lines += 1
+
+    def feed(self, chunk: bytes) -> Iterator[Dict[str, Any]]:
+        if self._inflater is not None:
+            chunk = self._inflater.decompress(chunk)
+        return self._decode(self._lines(chunk))
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        tail = self._inflater.flush() if self._inflater is not None else b""
+        lines = list(self._lines(tail))
+        if self._buf:       # last line without a trailing newline
+            lines.append(self._buf)
+            self._buf = b""
+        return self._decode(iter(lines))
+
+
+class IngestPipeline:
+    """Bounded queue of sample batches plus the aggregator that writes them into the store."""
+
+    def __init__(self, store: MetricsStore, max_batches: int = 256, batch_rows: int = 5000):
+        self.store = store
+        self.batch_rows = batch_rows
+        self.queue: "asyncio.Queue[Batch]" = asyncio.Queue(maxsize=max_batches)
+        self._task: Optional[asyncio.Task] = None
+        self._rate_window: Deque[Tuple[float, int]] = deque()
+        self.rows_enqueued = 0
+        self.rows_aggregated = 0
+        self.rows_rejected = 0
+        self.backpressure_events = 0
+
+    # -- producer side ---------------------------------------------------------
+    def to_sample(self, row: Dict[str, Any], now: float) -> Optional[Tuple[str, float, bool, float]]:
+        """(service, latency_ms, error, ts), or None (counted in `rows_rejected`) for a malformed row."""
+        try:
+            latency, ts = float(row["latency_ms"]), float(row.get("ts") or now)
+            # NaN / inf / negative latencies would index outside the sketch and sink the whole batch
+            if not (math.isfinite(latency) and latency >= 0 and math.isfinite(ts)):
+                raise ValueError("latency_ms must be finite and >= 0, ts finite")
+            return str(row["service"]), latency, parse_bool(row.get("error", False)), ts
+        except (KeyError, TypeError, ValueError):
+            self.rows_rejected += 1
+            return None
+
+    async def offer(self, batch: Batch, rows: int, timeout: float) -> bool:
+        """Enqueue a batch, waiting up to `timeout`; False means the caller must back off."""
+        try:
+            await asyncio.wait_for(self.queue.put(batch), timeout)
+        except asyncio.TimeoutError:
+            self.backpressure_events += 1
+            return False
+        self.rows_enqueued += rows
+        return True
+
+    # -- consumer side ---------------------------------------------------------
+    def _flush(self, batch: Batch) -> int:
+        n = 0
+        for service, (lat, err, ts) in batch.items():
+            n += self.store.record_many(service, np.asarray(lat), np.asarray(err, dtype=bool), np.asarray(ts))
+        return n
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self.queue.get()
+            try:
+                rows = sum(len(v[0]) for v in batch.values())
+                # numpy work happens off the event loop so request handling keeps flowing
+                await asyncio.to_thread(self._flush, batch)
+                self.rows_aggregated += rows
+                self._rate_window.append((time.monotonic(), rows))
+            except Exception as e:
+                print(f"[Metrics Ingest] Aggregation failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task.cancel()
+        self._task = None
+
+    def rows_per_second(self, horizon: float = 10.0) -> float:
+        cutoff = time.monotonic() - horizon
+        while self._rate_window and self._rate_window[0][0] < cutoff:
+            self._rate_window.popleft()
+        return round(sum(n for _, n in self._rate_window) / horizon, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "rows_enqueued": self.rows_enqueued,
+            "rows_aggregated": self.rows_aggregated,
+            "rows_rejected": self.rows_rejected,
+            "backpressure_events": self.backpressure_events,
+            "rows_per_second": self.rows_per_second(),
+        }
+
+
+async def ingest_stream(pipeline: IngestPipeline,
+                        chunks,
+                        gzipped: bool = False,
+                        put_timeout: float = 1.0) -> Dict[str, Any]:
+    """
+    Parse an async iterable of body chunks into the pipeline.
+
+    Batches are enqueued in stream order, so everything before `lines_consumed`
+    is durable in the queue. `backpressure` is True when the queue stayed full
+    and ingestion stopped early; the client should resend from that line.
+    """
+    parser = NDJSONParser(gzipped=gzipped)
+    batch: Batch = defaultdict(lambda: ([], [], []))
+    pending = accepted = rejected = consumed = 0
+    now = time.time()
+
+    async def flush() -> bool:
+        nonlocal batch, pending, accepted, consumed
+        if pending and not await pipeline.offer(dict(batch), pending, put_timeout):
+            return False
+        accepted += pending
+        consumed = parser.lines_read
+        batch, pending = defaultdict(lambda: ([], [], [])), 0
+        return True
+
+    def add(rows) -> None:
+        nonlocal pending, rejected
+        for row in rows:
+            smp = pipeline.to_sample(row, now)
+            if smp is None:
+                rejected += 1
+                continue
+            lat, err, ts = batch[smp[0]]
+            lat.append(smp[1]); err.append(smp[2]); ts.append(smp[3])
+            pending += 1
+
+    def result(backpressure: bool) -> Dict[str, Any]:
+        return {"accepted": accepted, "rejected": rejected, "bad_lines": parser.bad_lines,
+                "lines_consumed": consumed, "backpressure": backpressure}
+
+    async for chunk in chunks:
+        add(parser.feed(chunk))
+        if pending >= pipeline.batch_rows and not await flush():
+            return result(True)
+    add(parser.close())
+    return result(not await flush())
@@ -3,21 +3,115 @@ Mock Metrics Service
 --------------------
 Simulates a metrics collection or monitoring endpoint.
 Runs on port 9000 when started via start_local.sh.
+
+Endpoints:
+- POST /metrics               -> sink for metrics payloads
+- GET  /metrics/query         -> aggregated metrics for one (service, window, metric)
+- POST /metrics/query_batch   -> many lookups in one round trip
+- POST /metrics/ingest        -> streamed (optionally gzip) NDJSON bulk ingest
+- GET  /metrics/ingest/stats  -> queue depth, rows/sec and drop counters
 """
 
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.schemas import MetricsBatchRequest, MetricsBatchResponse, MetricsQuery, MetricsResult
+from app.tools.metrics_store import STORE, query_result, seed_synthetic
+from app.tools.metrics_ingest import IngestPipeline, ingest_stream
+
+INGEST = IngestPipeline(STORE,
+                        max_batches=settings.metrics_ingest_queue_batches,
+                        batch_rows=settings.metrics_ingest_batch_rows)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.metrics_seed_synthetic:
+        services = [s.strip() for s in settings.service_catalog.split(',') if s.strip()]
+        n = seed_synthetic(STORE, services, hours=1.0)
+        print(f"[Mock Metrics] Seeded {n} synthetic samples for {services}")
+    INGEST.start()
+    try:
+        yield
+    finally:
+        await INGEST.stop()
 
-app = FastAPI(title="Metrics Mock Service", version="1.0")
+
+app = FastAPI(title="Metrics Mock Service", version="1.0", lifespan=lifespan)
+
+
+def query_metrics(q: MetricsQuery) -> MetricsResult:
+    """Produce aggregated metrics for one query by merging store buckets."""
+    return query_result(STORE, q)
 
 
 @app.post("/metrics")
 async def collect_metrics(request: Request):
     """
-    Mock endpoint to receive metrics payloads.
+    Receive metrics payloads. Samples shaped like
+    {"service": ..., "latency_ms": ..., "error": bool, "ts": epoch} (or a list of
+    them under "samples") are recorded into the store. Malformed samples are
+    validated like bulk ingest rows (`IngestPipeline.to_sample`), skipped and counted.
     """
     data = await request.json()
-    print("[Mock Metrics] Received payload:", data)
-    return {"status": "received", "payload_size": len(str(data))}
+    samples = data.get("samples", [data]) if isinstance(data, dict) else data
+    recorded = rejected = 0
+    now = time.time()
+    for smp in samples if isinstance(samples, list) else [samples]:
+        sample = INGEST.to_sample(smp, now) if isinstance(smp, dict) and smp.get("service") else None
+        if sample is None:
+            rejected += 1
+            continue
+        service, latency, error, ts = sample
+        STORE.record(service, latency, error, ts)
+        recorded += 1
+    return {"status": "received", "recorded": recorded, "rejected": rejected}
+
+
+def _ingest_headers() -> dict:
+    return {"X-Ingest-Queue-Depth": str(INGEST.queue.qsize()),
+            "X-Ingest-Queue-Capacity": str(INGEST.queue.maxsize)}
+
+
+@app.post("/metrics/ingest")
+async def ingest_metrics(request: Request):
+    """
+    Bulk ingest of NDJSON samples (`Content-Encoding: gzip` supported), one
+    {"service", "latency_ms", "error", "ts"} object per line. The body is parsed
+    as it streams in. Returns 429 + Retry-After when the aggregator queue is
+    full; `lines_consumed` tells the client where to resume.
+    """
+    gzipped = "gzip" in request.headers.get("content-encoding", "").lower()
+    result = await ingest_stream(INGEST, request.stream(), gzipped=gzipped,
+                                 put_timeout=settings.metrics_ingest_put_timeout_seconds)
+    headers = _ingest_headers()
+    if result["backpressure"]:
+        headers["Retry-After"] = "1"
+        return JSONResponse(status_code=429, content={"status": "backpressure", **result}, headers=headers)
+    return JSONResponse(content={"status": "accepted", **result}, headers=headers)
+
+
+@app.get("/metrics/ingest/stats")
+async def ingest_stats():
+    """Ingest throughput (rows/sec over the last 10s) and queue counters."""
+    return INGEST.stats()
+
+
+@app.get("/metrics/query", response_model=MetricsResult)
+async def metrics_query(service: str, window: str = "5m", metric: Optional[str] = None):
+    """Aggregated metrics for a single service and window."""
+    return query_metrics(MetricsQuery(service=service, window=window, metric=metric))
+
+
+@app.post("/metrics/query_batch", response_model=MetricsBatchResponse)
+async def metrics_query_batch(req: MetricsBatchRequest):
+    """Answer many (service, window, metric) lookups in one round trip, in request order."""
+    return MetricsBatchResponse(results=[query_metrics(q) for q in req.queries])
 
 
 @app.get("/health")
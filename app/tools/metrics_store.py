@@ -0,0 +1,289 @@
+"""
+Metrics Store
+-------------
+In-process time-series store backing the metrics service.
+
+Each service keeps one ring buffer per rollup resolution (1m, 5m, 1h, 1d by
+default). A bucket holds a mergeable log-bucketed latency histogram
+(DDSketch-style: every value is reported within `relative_accuracy` of its
+true value) plus request / error counters, and every tier is updated
+incrementally as samples arrive. A window query is planned onto the coarsest
+tier whose buckets fit inside the window, with only the ragged edges merged
+from finer tiers, so its cost stays flat as windows and retention grow. An
+edge older than every finer tier's retention is served by the whole enclosing
+coarse bucket instead, so it is never silently dropped.
+Memory per series is fixed at sum(retention x n_bins) counters.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from ..schemas import MetricsData, MetricsQuery, MetricsResult
+
+
+def parse_window(window: str) -> timedelta:
+    """Parse a window such as '5m', '1h', '24h' or '7d' (defaults to 5 minutes)."""
+    try:
+        if window.endswith('m'):
+            return timedelta(minutes=int(window[:-1]))
+        if window.endswith('h'):
+            return timedelta(hours=int(window[:-1]))
+        if window.endswith('d'):
+            return timedelta(days=int(window[:-1]))
+    except ValueError:
+        pass
+    return timedelta(minutes=5)
+
+
+class SketchLayout:
+    """Shared bin layout; sketches with the same layout merge by adding counts."""
+
+    def __init__(self, relative_accuracy: float = 0.02, min_value: float = 0.1, max_value: float = 120_000.0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.n_bins = int(math.ceil(math.log(max_value / min_value) / self.log_gamma)) + 1
+        # Representative value of bin i (bin i covers (min*gamma^(i-1), min*gamma^i])
+        edges = min_value * np.power(self.gamma, np.arange(self.n_bins, dtype=np.float64))
+        self.values = edges * 2.0 / (1.0 + self.gamma)
+        self.values[0] = min_value
+
+    def index(self, values: np.ndarray) -> np.ndarray:
+        v = np.maximum(np.asarray(values, dtype=np.float64), self.min_value)
+        idx = np.ceil(np.log(v / self.min_value) / self.log_gamma)
+        return np.clip(idx, 0, self.n_bins - 1).astype(np.int64)
+
+    def quantile(self, counts: np.ndarray, q: float) -> Optional[float]:
+        total = int(counts.sum())
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        i = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        return float(self.values[min(i, self.n_bins - 1)])
+
+
+class SeriesRing:
+    """Ring buffer of `capacity` buckets of `interval` seconds for one service."""
+
+    def __init__(self, layout: SketchLayout, interval: int, capacity: int):
+        self.layout = layout
+        self.interval = interval
+        self.capacity = capacity
+        self.epochs = np.full(capacity, -1, dtype=np.int64)      # bucket number held by each slot
+        self.hist = np.zeros((capacity, layout.n_bins), dtype=np.uint32)
+        self.requests = np.zeros(capacity, dtype=np.int64)
+        self.errors = np.zeros(capacity, dtype=np.int64)
+        self.lock = threading.Lock()
+
+    def _claim(self, buckets: np.ndarray) -> np.ndarray:
+        """Map bucket numbers to slots, resetting slots that still hold older buckets."""
+        slots = buckets % self.capacity
+        stale = self.epochs[slots] != buckets
+        if stale.any():
+            s = np.unique(slots[stale])
+            # Only reset slots whose new bucket is newer than what they hold
+            newest = np.zeros(self.capacity, dtype=np.int64) - 1
+            np.maximum.at(newest, slots, buckets)
+            s = s[newest[s] > self.epochs[s]]
+            self.hist[s] = 0
+            self.requests[s] = 0
+            self.errors[s] = 0
+            self.epochs[s] = newest[s]
+        return slots
+
+    def add(self, ts: np.ndarray, latencies: np.ndarray, errors: np.ndarray) -> int:
+        buckets = (ts // self.interval).astype(np.int64)
+        with self.lock:
+            slots = self._claim(buckets)
+            live = self.epochs[slots] == buckets          # drop samples older than retention
+            if not live.all():
+                slots, latencies, errors = slots[live], latencies[live], errors[live]
+            np.add.at(self.hist, (slots, self.layout.index(latencies)), 1)
+            np.add.at(self.requests, slots, 1)
+            np.add.at(self.errors, slots, errors.astype(np.int64))
+            return int(slots.size)
+
+    def merge_range(self, first_bucket: int, last_bucket: int):
+        """Merged (histogram, requests, errors) over buckets [first, last]; touches only those slots."""
+        first_bucket = max(first_bucket, last_bucket - self.capacity + 1)
+        buckets = np.arange(first_bucket, last_bucket + 1, dtype=np.int64)
+        with self.lock:
+            slots = buckets % self.capacity
+            slots = slots[self.epochs[slots] == buckets]
+            return (self.hist[slots].sum(axis=0, dtype=np.uint64),
+                    int(self.requests[slots].sum()),
+                    int(self.errors[slots].sum()))
+
+    def nbytes(self) -> int:
+        return self.hist.nbytes + self.epochs.nbytes + self.requests.nbytes + self.errors.nbytes
+
+
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((60, 1440), (300, 2016), (3600, 720), (86400, 400))
+
+
+class MetricsStore:
+    """Per-service rollup rings of latency sketches with planned window queries."""
+
+    def __init__(self,
+                 tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS,
+                 layout: Optional[SketchLayout] = None,
+                 clock: Callable[[], float] = time.time):
+        """`tiers` is a list of (resolution_seconds, retention_buckets); each coarser
+        resolution must be a multiple of the next finer one."""
+        self.tiers = sorted((int(r), int(n)) for r, n in tiers)
+        for (fine, _), (coarse, _) in zip(self.tiers, self.tiers[1:]):
+            if coarse % fine:
+                raise ValueError(f"rollup resolution {coarse}s is not a multiple of {fine}s")
+        self.interval = self.tiers[0][0]
+        self.layout = layout or SketchLayout()
+        self._clock = clock
+        self._series: Dict[str, List[SeriesRing]] = {}
+        self._lock = threading.Lock()
+
+    def _rings(self, service: str) -> List[SeriesRing]:
+        rings = self._series.get(service)
+        if rings is None:
+            with self._lock:
+                rings = self._series.setdefault(
+                    service, [SeriesRing(self.layout, r, n) for r, n in self.tiers])
+        return rings
+
+    def services(self) -> List[str]:
+        return sorted(self._series)
+
+    def record(self, service: str, latency_ms: float, error: bool = False, ts: Optional[float] = None) -> None:
+        self.record_many(service, [latency_ms], [error], None if ts is None else [ts])
+
+    def record_many(self,
+                    service: str,
+                    latencies_ms: Iterable[float],
+                    errors: Optional[Iterable[bool]] = None,
+                    timestamps: Optional[Iterable[float]] = None) -> int:
+        lat = np.asarray(list(latencies_ms) if not isinstance(latencies_ms, np.ndarray) else latencies_ms,
+                         dtype=np.float64)
+        if lat.size == 0:
+            return 0
+        err = (np.zeros(lat.size, dtype=bool) if errors is None
+               else np.asarray(list(errors) if not isinstance(errors, np.ndarray) else errors, dtype=bool))
+        ts = (np.full(lat.size, self._clock()) if timestamps is None
+              else np.asarray(list(timestamps) if not isinstance(timestamps, np.ndarray) else timestamps,
+                              dtype=np.float64))
+        # Incremental rollups: every tier absorbs the batch as it arrives
+        rings = self._rings(service)
+        n = rings[0].add(ts, lat, err)
+        for ring in rings[1:]:
+            ring.add(ts, lat, err)
+        return n
+
+    def plan(self, window_seconds: float, now: float) -> List[Tuple[int, int, int]]:
+        """
+        Cover the window with (tier_index, first_bucket, last_bucket) ranges.
+
+        The interior is served by the coarsest tier whose buckets fit entirely
+        inside the window; the leftover edges recurse into the finest tier that
+        still retains them, down to the base resolution (which includes the
+        partial buckets at both ends). When no finer tier retains an edge, the
+        range widens to the enclosing bucket of the current tier.
+        """
+        base = self.interval
+        start = int((now - window_seconds) // base) * base
+        end = (int(now // base) + 1) * base
+        # Oldest second each tier still holds
+        retained = [(int(now // res) - n + 1) * res for res, n in self.tiers]
+
+        def finer(t: int, a: int) -> Optional[int]:
+            return next((f for f in range(t - 1, -1, -1) if retained[f] <= a), None)
+
+        def cover(a: int, b: int, t: Optional[int]) -> List[Tuple[int, int, int]]:
+            if a >= b:
+                return []
+            if t == 0:
+                return [(0, a // base, b // base - 1)]
+            res = self.tiers[t][0]
+            left = finer(t, a)
+            lo = -(-a // res) * res if left is not None else (a // res) * res
+            right = finer(t, (b // res) * res)
+            hi = (b // res) * res if right is not None else -(-b // res) * res
+            if lo >= hi:
+                return cover(a, b, left)
+            return cover(a, lo, left) + [(t, lo // res, hi // res - 1)] + cover(hi, b, right)
+
+        return cover(start, end, len(self.tiers) - 1)
+
+    def query(self, service: str, window_seconds: float, now: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """p95/p99/error rate over the last `window_seconds`, or None if there is no data."""
+        rings = self._series.get(service)
+        if rings is None:
+            return None
+        now = self._clock() if now is None else now
+        hist = np.zeros(self.layout.n_bins, dtype=np.uint64)
+        requests = errors = 0
+        for t, first, last in self.plan(window_seconds, now):
+            h, r, e = rings[t].merge_range(first, last)
+            hist += h
+            requests += r
+            errors += e
+        if requests == 0:
+            return None
+        return {
+            'p95_latency': round(self.layout.quantile(hist, 0.95), 2),
+            'p99_latency': round(self.layout.quantile(hist, 0.99), 2),
+            'error_rate': round(100.0 * errors / requests, 3),
+            'success_rate': round(100.0 * (requests - errors) / requests, 3),
+            'request_count': requests,
+        }
+
+    def memory_bytes(self) -> int:
+        return sum(r.nbytes() for rings in self._series.values() for r in rings)
+
+
+def query_result(store: MetricsStore, q: MetricsQuery) -> MetricsResult:
+    """Answer a MetricsQuery from the store using the shared response schema."""
+    try:
+        end = store._clock()
+        window = parse_window(q.window)
+        stats = store.query(q.service, window.total_seconds(), now=end)
+        if stats is None:
+            return MetricsResult(success=False, error='no_data',
+                                 message=f'No metrics for {q.service} in the last {q.window}')
+        end_dt = datetime.fromtimestamp(end, tz=timezone.utc)
+        fields = {'service': q.service, 'window': q.window,
+                  'start_time': (end_dt - window).isoformat(), 'end_time': end_dt.isoformat()}
+        if q.metric:
+            fields[q.metric] = stats.get(q.metric)
+        else:
+            fields.update(stats)
+        return MetricsResult(success=True, data=MetricsData(**fields), score=0.9,
+                             message=f'Metrics for {q.service} (last {q.window})')
+    except Exception as e:
+        return MetricsResult(success=False, error=str(e),
+                             message=f'Failed to compute metrics for {q.service}: {e}')
+
+
+def seed_synthetic(store: MetricsStore, services: Iterable[str], hours: float = 1.0,
+                   rps: float = 2.0, seed: Optional[int] = None) -> int:
+    """Backfill synthetic traffic so a fresh mock service has data to answer with."""
+    rng = np.random.default_rng(seed)
+    now = store._clock()
+    n = int(hours * 3600 * rps)
+    total = 0
+    for i, svc in enumerate(services):
+        ts = now - rng.uniform(0, hours * 3600, n)
+        # Lognormal latencies centred around ~120-200ms with a heavy tail
+        lat = rng.lognormal(mean=math.log(120 + 40 * i), sigma=0.45, size=n)
+        err = rng.random(n) < 0.01 * (i + 1)
+        total += store.record_many(svc, lat, err, ts)
+    return total
+
+
+STORE = MetricsStore(
+    tiers=list(zip(settings.metrics_rollup_resolutions, settings.metrics_rollup_retention_buckets)),
+    layout=SketchLayout(relative_accuracy=settings.metrics_sketch_relative_accuracy),
+)
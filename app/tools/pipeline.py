@@ -0,0 +1,104 @@
+"""
+Ingestion Pipeline
+------------------
+Generator stages for indexing: chunks -> fixed-size batches -> embeddings
+(worker pool) -> bounded uploads.
+
+Each stage pulls from the previous one lazily, and at most `max_inflight`
+batches are queued on a pool at a time, so memory depends on the batch size
+and the number of workers, not on the corpus size.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_batches(batches: Iterable[List[T]], encode: Callable[[List[T]], np.ndarray],
+                  workers: int = 2, max_inflight: Optional[int] = None) -> Iterator[Tuple[List[T], np.ndarray]]:
+    """
+    (batch, vectors) in input order, encoding up to `workers` batches concurrently
+    (sentence-transformers and NumPy release the GIL while they compute).
+    """
+    max_inflight = max_inflight or 2 * workers
+    pending: Deque[Tuple[List[T], Future]] = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed") as pool:
+        for batch in batches:
+            pending.append((batch, pool.submit(encode, batch)))
+            if len(pending) >= max_inflight:
+                done, fut = pending.popleft()
+                yield done, fut.result()
+        while pending:
+            done, fut = pending.popleft()
+            yield done, fut.result()
+
+
+class BoundedUploader:
+    """Runs `send(batch)` on a pool, blocking `submit` while `max_inflight` calls are outstanding."""
+
+    def __init__(self, send: Callable[[Any], Any], max_inflight: int = 4):
+        self.send = send
+        self.max_inflight = max(1, max_inflight)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="upload")
+        self._pending: Deque[Future] = deque()
+        self.sent = 0
+
+    def submit(self, batch: Any) -> None:
+        while len(self._pending) >= self.max_inflight:
+            self._pending.popleft().result()
+        self._pending.append(self._pool.submit(self.send, batch))
+        self.sent += 1
+
+    def close(self) -> None:
+        """Wait for every outstanding upload; re-raises the first failure."""
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "BoundedUploader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Throughput:
+    """Counts documents / chunks through a pipeline and reports rates."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.docs = 0
+        self.chunks = 0
+
+    def add(self, docs: int = 0, chunks: int = 0) -> None:
+        self.docs += docs
+        self.chunks += chunks
+
+    def stats(self) -> Dict[str, float]:
+        seconds = max(time.perf_counter() - self.started, 1e-9)
+        return {"docs": self.docs, "chunks": self.chunks,
+                "docs_per_sec": round(self.docs / seconds, 1),
+                "chunks_per_sec": round(self.chunks / seconds, 1)}
+
+
+def count_docs(chunks: Sequence[Any]) -> int:
+    """Documents started in a batch of `Chunk`s (each document's chunk 0)."""
+    return sum(1 for c in chunks if c.chunk == 0)
@@ -0,0 +1,194 @@
+"""
+Qdrant Store
+------------
+Collection layout and the pooled search client for Qdrant.
+
+Layout (seeding side): an unnamed dense vector plus the `bm25` sparse vector.
+Settings control on-disk storage, HNSW parameters and optional scalar (int8) or
+product quantization. `collection_params()` is recorded in the index manifest,
+and any change to it triggers an alias-swapped rebuild.
+
+Search (query side): every search goes through the batch API and asks only
+for the slim payload fields (`PAYLOAD_FIELDS`); full text stays in the
+content store. One request
+carries any number of (dense | sparse) searches. A process-wide
+`AsyncQdrantClient` is used over gRPC (`qdrant_prefer_grpc`) when
+qdrant-client is installed. Otherwise the REST batch endpoint is called
+through the pooled httpx clients in `tool_broker`. Both transports run under
+the `vector_tool` circuit breaker and retry budget (`call_tool_async`).
+
+The gRPC client belongs to the event loop that created it (normally the
+broker loop) and `close_async_client` closes it there.
+"""
+
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from ..config import settings
+from ..schemas import VectorHit
+from ..tool_broker import call_tool_async, execute_http_tool_async, is_retryable
+from .registry import DEFAULT_TOOL_REGISTRY
+from .sparse_index import SPARSE_VECTOR_NAME
+
+# A search is ("dense", vector) or ("sparse", (indices, values)), plus its limit
+Search = Tuple[str, Union[np.ndarray, Tuple[np.ndarray, np.ndarray]], int]
+PAYLOAD_FIELDS = ["title", "chunk", "snippet"]
+
+
+def collection_params() -> Dict[str, Any]:
+    """Storage / index options a collection is created with (compared across runs)."""
+    return {"on_disk": settings.qdrant_on_disk, "quantization": settings.qdrant_quantization.lower(),
+            "hnsw_m": settings.qdrant_hnsw_m, "hnsw_ef_construct": settings.qdrant_hnsw_ef_construct}
+
+
+def create_collection(client, name: str, dim: int, params: Optional[Dict[str, Any]] = None) -> None:
+    from qdrant_client.http import models as m
+    params = params or collection_params()
+    quantization = None
+    if params["quantization"] == "scalar":
+        quantization = m.ScalarQuantization(scalar=m.ScalarQuantizationConfig(
+            type=m.ScalarType.INT8, quantile=0.99, always_ram=True))
+    elif params["quantization"] == "product":
+        quantization = m.ProductQuantization(product=m.ProductQuantizationConfig(
+            compression=m.CompressionRatio.X16, always_ram=True))
+    elif params["quantization"] not in ("", "none"):
+        raise ValueError(f"unknown qdrant_quantization {params['quantization']!r}")
+    client.create_collection(
+        collection_name=name,
+        vectors_config=m.VectorParams(size=dim, distance=m.Distance.COSINE, on_disk=params["on_disk"]),
+        sparse_vectors_config={SPARSE_VECTOR_NAME: m.SparseVectorParams(
+            modifier=m.Modifier.IDF, index=m.SparseIndexParams(on_disk=params["on_disk"]))},
+        hnsw_config=m.HnswConfigDiff(m=params["hnsw_m"], ef_construct=params["hnsw_ef_construct"],
+                                     on_disk=params["on_disk"]),
+        quantization_config=quantization,
+    )
+
+
+def search_params(hnsw_ef: Optional[int] = None) -> Dict[str, Any]:
+    """REST `params` for dense searches (ef and quantized rescoring)."""
+    params: Dict[str, Any] = {}
+    ef = hnsw_ef or settings.qdrant_search_hnsw_ef
+    if ef:
+        params["hnsw_ef"] = ef
+    if settings.qdrant_quantization.lower() not in ("", "none"):
+        params["quantization"] = {"rescore": True, "oversampling": settings.qdrant_search_oversampling}
+    return params
+
+
+# -- pooled client ----------------------------------------------------------------
+_client = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_lock = threading.Lock()
+_RETRYABLE_GRPC = {"UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED", "ABORTED", "INTERNAL"}
+
+
+async def get_async_client():
+    """Shared AsyncQdrantClient (gRPC when preferred), or None without qdrant-client."""
+    global _client, _client_loop
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    from qdrant_client import AsyncQdrantClient
+                except Exception:
+                    return None
+                _client = AsyncQdrantClient(url=settings.qdrant_url, prefer_grpc=settings.qdrant_prefer_grpc,
+                                            grpc_port=settings.qdrant_grpc_port)
+                _client_loop = asyncio.get_running_loop()
+    return _client
+
+
+async def close_async_client(timeout: float = 5.0) -> None:
+    """Close the shared client on the loop that owns it (call before that loop is shut down)."""
+    global _client, _client_loop
+    with _client_lock:
+        client, loop = _client, _client_loop
+        _client = _client_loop = None
+    if client is None:
+        return
+    if loop is None or loop is asyncio.get_running_loop():
+        await client.close()
+    elif loop.is_running():
+        await asyncio.wait_for(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.close(), loop)), timeout)
+
+
+def _grpc_retryable(exc: Exception) -> bool:
+    """Timeouts, connection failures and transient gRPC / HTTP statuses are worth retrying."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None)           # grpc.aio.AioRpcError
+    if callable(code):
+        try:
+            return getattr(code(), "name", "") in _RETRYABLE_GRPC
+        except Exception:
+            return False
+    status = getattr(exc, "status_code", None)  # qdrant_client UnexpectedResponse
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return is_retryable(exc)
+
+
+# -- batch search -----------------------------------------------------------------
+def _rest_search(kind: str, vector, limit: int, params: Dict[str, Any], with_payload) -> Dict[str, Any]:
+    if kind == "sparse":
+        indices, values = vector
+        query: Any = {"name": SPARSE_VECTOR_NAME,
+                      "vector": {"indices": np.asarray(indices).tolist(), "values": np.asarray(values).tolist()}}
+    else:
+        query = np.asarray(vector).tolist()
+    body = {"vector": query, "limit": limit, "with_payload": with_payload}
+    if kind == "dense" and params:
+        body["params"] = params
+    return body
+
+
+def _grpc_search(kind: str, vector, limit: int, params: Dict[str, Any], with_payload):
+    from qdrant_client.http import models as m
+    if kind == "sparse":
+        indices, values = vector
+        query: Any = m.NamedSparseVector(name=SPARSE_VECTOR_NAME, vector=m.SparseVector(
+            indices=np.asarray(indices).tolist(), values=np.asarray(values).tolist()))
+        return m.SearchRequest(vector=query, limit=limit, with_payload=with_payload)
+    search_params = None
+    if params:
+        q = params.get("quantization")
+        search_params = m.SearchParams(
+            hnsw_ef=params.get("hnsw_ef"),
+            quantization=m.QuantizationSearchParams(rescore=q["rescore"], oversampling=q["oversampling"]) if q else None)
+    return m.SearchRequest(vector=np.asarray(vector).tolist(), limit=limit, with_payload=with_payload,
+                           params=search_params)
+
+
+async def search_batch(searches: Sequence[Search], collection: Optional[str] = None,
+                       timeout: Optional[float] = None,
+                       with_payload: Union[bool, Sequence[str]] = tuple(PAYLOAD_FIELDS)) -> List[List[VectorHit]]:
+    """Run all `searches` in one round trip; hits per search, in order."""
+    with_payload = with_payload if isinstance(with_payload, bool) else list(with_payload)
+    if not searches:
+        return []
+    collection = collection or settings.qdrant_collection
+    params = search_params()
+    tool_meta = DEFAULT_TOOL_REGISTRY["vector_tool"]
+    if timeout:
+        tool_meta = tool_meta.model_copy(update={"timeout_seconds": timeout})
+    client = await get_async_client() if settings.qdrant_prefer_grpc else None
+    if client is not None:
+        requests = [_grpc_search(k, v, n, params, with_payload) for k, v, n in searches]
+
+        async def attempt():
+            return await asyncio.wait_for(client.search_batch(collection_name=collection, requests=requests),
+                                          tool_meta.timeout_seconds)
+
+        results = await call_tool_async(tool_meta, attempt, _grpc_retryable)
+        return [[VectorHit(id=p.id, score=float(p.score), payload=p.payload or {}) for p in points]
+                for points in results]
+    url = f"{settings.qdrant_url.rstrip('/')}/collections/{collection}/points/search/batch"
+    body = {"searches": [_rest_search(k, v, n, params, with_payload) for k, v, n in searches]}
+    # Pooled keep-alive client shared across searches (see app/tool_broker.py)
+    resp = await execute_http_tool_async(url, None, tool_meta, method="POST", json_body=body)
+    return [[VectorHit(id=p.get("id"), score=float(p.get("score", 0.0)), payload=p.get("payload") or {})
+             for p in points]
+            for points in resp.get("result", [])]
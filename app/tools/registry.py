@@ -16,6 +16,8 @@ class ToolMeta(BaseModel):
     capabilities: List[ToolCapability]
     timeout_seconds: int = 5
     retries: int = 1
+    failure_threshold: int = 5
+    reset_timeout_seconds: float = 30.0
     description: Optional[str] = None
     request_schema: Optional[dict] = None
     response_schema: Optional[dict] = None
@@ -44,6 +46,14 @@ DEFAULT_TOOL_REGISTRY: Dict[str, ToolMeta] = {
         timeout_seconds=3,
         retries=0,
         description="Local sqlite utility tool"
+    ),
+    "docs_tool": ToolMeta(
+        key="docs_tool",
+        name="docs_tool",
+        capabilities=[ToolCapability.HTTP],
+        timeout_seconds=5,
+        retries=1,
+        description="Keyword search over the docs HTTP service"
     )
 }
 
@@ -0,0 +1,198 @@
+"""
+Sparse Index
+------------
+BM25 sparse vectors and an in-process inverted index over them.
+
+Terms are hashed to 31-bit ids, so documents and queries map to the same
+sparse space without shipping a vocabulary: the seeder uploads the same
+(indices, values) pairs to Qdrant as a named sparse vector (with Qdrant's IDF
+modifier), and the local index keeps them as postings lists. Document values
+are BM25 term-frequency weights; IDF is applied at query time. Memory is
+proportional to the number of non-zeros, never to vocabulary x documents.
+Queries drop `STOPWORDS`, so function words never make an off-topic question
+match a document.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .corpus import load_chunks
+from .ann_index import swap_into_place
+from .embeddings import tokenize
+
+FORMAT_VERSION = 1
+SPARSE_VECTOR_NAME = "bm25"
+K1 = 1.2
+B = 0.75
+STOPWORDS = frozenset("""
+a about an and are as at be by can could do does for from how i if in is it me my of on or
+our please should show tell that the their there this to up us was we what when where which
+who why will with would you your
+""".split())
+
+
+def term_id(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode(), digest_size=4).digest(), "little") & 0x7FFFFFFF
+
+
+def term_counts(text: str) -> Dict[int, int]:
+    counts: Dict[int, int] = Counter()
+    for tok in tokenize(text):
+        counts[term_id(tok)] += 1
+    return counts
+
+
+def query_terms(text: str) -> List[str]:
+    """Distinct query tokens without stopwords, in order."""
+    return list(dict.fromkeys(t for t in tokenize(text) if t not in STOPWORDS))
+
+
+def doc_sparse_vectors(docs: Sequence[str],
+                       avgdl: Optional[float] = None) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], float]:
+    """
+    BM25-weighted (indices, values) per document, plus the average document length.
+    Pass the corpus-wide `avgdl` when vectorizing a batch of a larger corpus.
+    """
+    counts = [term_counts(d) for d in docs]
+    lengths = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+    if avgdl is None:
+        avgdl = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+    vectors = []
+    for c, dl in zip(counts, lengths):
+        idx = np.fromiter(c.keys(), dtype=np.int64, count=len(c))
+        tf = np.fromiter(c.values(), dtype=np.float64, count=len(c))
+        val = tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+        order = np.argsort(idx)
+        vectors.append((idx[order], val[order].astype(np.float32)))
+    return vectors, avgdl
+
+
+def query_sparse_vector(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Query terms (stopwords removed) with weight 1 each (IDF is applied by the index / Qdrant)."""
+    ids = np.array(sorted({term_id(t) for t in query_terms(text)}), dtype=np.int64)
+    return ids, np.ones(len(ids), dtype=np.float32)
+
+
+class SparseIndex:
+    """Postings lists in flat arrays: term t spans doc_ids/weights[offsets[i]:offsets[i+1]]."""
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 idf: np.ndarray, n_docs: int, payloads: List[Dict[str, Any]]):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.idf = idf
+        self.n_docs = n_docs
+        self.payloads = payloads
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    @property
+    def nnz(self) -> int:
+        return int(self.doc_ids.shape[0])
+
+    @classmethod
+    def build(cls, docs: Sequence[str], payloads: Sequence[Dict[str, Any]]) -> "SparseIndex":
+        vectors, _ = doc_sparse_vectors(docs)
+        if not vectors or not any(len(i) for i, _ in vectors):
+            return cls(np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int32),
+                       np.zeros(0, np.float32), np.zeros(0, np.float32), len(docs), list(payloads))
+        all_terms = np.concatenate([i for i, _ in vectors])
+        all_weights = np.concatenate([v for _, v in vectors])
+        all_docs = np.concatenate([np.full(len(i), d, dtype=np.int32) for d, (i, _) in enumerate(vectors)])
+        order = np.argsort(all_terms, kind="stable")
+        all_terms, all_weights, all_docs = all_terms[order], all_weights[order], all_docs[order]
+        terms, starts, df = np.unique(all_terms, return_index=True, return_counts=True)
+        offsets = np.append(starts, len(all_terms)).astype(np.int64)
+        n = len(docs)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return cls(terms, offsets, all_docs, all_weights, idf, n, list(payloads))
+
+    def search_vector(self, indices: np.ndarray, values: np.ndarray, k: int = 5) -> List[Tuple[float, int]]:
+        """Top-k (score, document position) for a sparse query vector."""
+        if self.nnz == 0 or len(indices) == 0:
+            return []
+        pos = np.searchsorted(self.terms, indices)
+        pos = np.minimum(pos, len(self.terms) - 1)
+        hit = self.terms[pos] == indices
+        if not hit.any():
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for p, w in zip(pos[hit], values[hit]):
+            a, b = self.offsets[p], self.offsets[p + 1]
+            scores[self.doc_ids[a:b]] += w * self.idf[p] * self.weights[a:b]
+        matched = np.flatnonzero(scores)
+        k = min(k, matched.size)
+        if k == 0:
+            return []
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), int(i)) for i in top]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, int]]:
+        return self.search_vector(*query_sparse_vector(query), k=k)
+
+    # -- persistence -----------------------------------------------------------
+    def save(self, path: os.PathLike) -> None:
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        for name in ("terms", "offsets", "doc_ids", "weights", "idf"):
+            np.save(tmp / f"{name}.npy", getattr(self, name))
+        (tmp / "meta.json").write_text(json.dumps({
+            "format": FORMAT_VERSION, "n_docs": self.n_docs, "payloads": self.payloads}), encoding="utf-8")
+        swap_into_place(tmp, path)
+
+    @classmethod
+    def load(cls, path: os.PathLike, mmap: bool = True) -> "SparseIndex":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported index format {meta.get('format')}")
+        mode = "r" if mmap else None
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mode)
+                  for name in ("terms", "offsets", "doc_ids", "weights", "idf")}
+        return cls(n_docs=meta["n_docs"], payloads=meta["payloads"], **arrays)
+
+
+def build_sparse_index(texts: Sequence[str], payloads: Sequence[Dict[str, Any]],
+                       path: Optional[os.PathLike] = None) -> SparseIndex:
+    index = SparseIndex.build(texts, payloads)
+    index.save(path or settings.sparse_index_path)
+    return index
+
+
+_index: Optional[SparseIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_sparse_index() -> SparseIndex:
+    """Memory-mapped sparse index from `sparse_index_path`, built from the corpus when missing."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    _index = SparseIndex.load(settings.sparse_index_path)
+                except Exception as e:
+                    if not isinstance(e, FileNotFoundError):
+                        print(f"[sparse_index] Ignoring unreadable index: {e}")
+                    texts, payloads = load_chunks()
+                    _index = build_sparse_index(texts, payloads)
+    return _index
+
+
+def reset_sparse_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,232 @@
+"""
+SQL Result Cache
+----------------
+Versioned cache of read-only `run_sql` results.
+
+Entries are keyed by (normalized SQL, params) and remember the version of
+every table the statement reads. Writes bump a per-table counter in
+`_table_versions` through AFTER INSERT/UPDATE/DELETE triggers, so a cached
+result stays valid exactly until one of its tables changes, no matter which
+connection or process wrote it. `PRAGMA data_version` is the fast path: while
+it is unchanged on the reading connection nothing has been committed and the
+version table is not re-read. The cache is an LRU bounded by approximate bytes.
+
+Reads never run DDL. The triggers are installed on the write side: at startup,
+when the service schema is created, and after `run_sql` executes a CREATE or
+ALTER. A statement that reads a table without bump triggers is simply not
+cached.
+"""
+
+import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+VERSION_TABLE = "_table_versions"
+TRIGGER_PREFIX = "_tv_"
+_OPS = ("INSERT", "UPDATE", "DELETE")
+_install_lock = threading.Lock()    # one installer at a time per process; IF NOT EXISTS covers other processes
+
+_LITERAL_RE = re.compile(r"('(?:''|[^'])*'|\"(?:\"\"|[^\"])*\")")
+_VOLATILE_RE = re.compile(r"\b(random|randomblob|changes|last_insert_rowid|total_changes|"
+                          r"current_(date|time|timestamp)|'now')", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and case outside string literals; drop a trailing ';'."""
+    parts = _LITERAL_RE.split(sql.strip().rstrip(";"))
+    out = [p if i % 2 else " ".join(p.lower().split()) for i, p in enumerate(parts)]
+    return "".join(out).strip()
+
+
+def is_cacheable(sql: str) -> bool:
+    """Statements whose result can change without a table write are never cached."""
+    return not sql.lstrip()[:7].upper().startswith("EXPLAIN") and not _VOLATILE_RE.search(sql)
+
+
+def _params_key(params: Any) -> Hashable:
+    if not params:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+
+def _approx_size(rows: List[Dict[str, Any]]) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for k, v in row.items():
+            size += sys.getsizeof(v)
+    return size
+
+
+def install_version_triggers(conn: sqlite3.Connection) -> None:
+    """Create the version table and bump triggers for every user table (idempotent; write connection only)."""
+    with _install_lock:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+                     f"(name TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID")
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()]
+        existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()}
+        for table in tables:
+            if table == VERSION_TABLE:
+                continue
+            quoted = table.replace('"', '""')
+            literal = table.replace("'", "''")
+            for op in _OPS:
+                name = f"{TRIGGER_PREFIX}{table}_{op.lower()}"
+                if name in existing:
+                    continue
+                conn.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{name.replace(chr(34), chr(34) * 2)}" AFTER {op} ON "{quoted}" '
+                    f"BEGIN INSERT INTO {VERSION_TABLE} (name, version) VALUES ('{literal}', 1) "
+                    f"ON CONFLICT(name) DO UPDATE SET version = version + 1; END")
+        conn.commit()
+
+
+def versioned_tables(conn: sqlite3.Connection) -> frozenset:
+    """Tables that have all three bump triggers (the only ones whose reads can be cached)."""
+    names = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ? ESCAPE '!'",
+        (TRIGGER_PREFIX.replace("_", "!_") + "%",)).fetchall()}
+    tables = {r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()}
+    return frozenset(t for t in tables
+                     if all(f"{TRIGGER_PREFIX}{t}_{op.lower()}" in names for op in _OPS))
+
+
+@dataclass
+class _Entry:
+    rows: List[Dict[str, Any]]
+    versions: Tuple[Tuple[str, int], ...]
+    nbytes: int
+
+
+class SQLResultCache:
+    """Thread-safe byte-bounded LRU of query results validated against table versions."""
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max(1, max_bytes // 8)
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._deps: Dict[Hashable, Optional[Tuple[str, ...]]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    # -- table versions ---------------------------------------------------------
+    def _snapshot(self, conn: sqlite3.Connection) -> Tuple[int, Dict[str, int], frozenset]:
+        """(schema_version, {table: version}, versioned tables) as seen by `conn`, re-read only after a commit."""
+        states = self._local.__dict__.setdefault("states", {})
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        state = states.get(id(conn))
+        if state is not None and state[0] is conn and state[1] == data_version:
+            return state[2], state[3], state[4]
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if state is not None and state[0] is conn and state[2] == schema_version:
+            versioned = state[4]
+        else:
+            versioned = versioned_tables(conn)
+        try:
+            versions = {r[0]: r[1] for r in conn.execute(f"SELECT name, version FROM {VERSION_TABLE}").fetchall()}
+        except sqlite3.OperationalError:        # triggers not installed yet: nothing is cacheable
+            versions, versioned = {}, frozenset()
+        states[id(conn)] = (conn, data_version, schema_version, versions, versioned)
+        return schema_version, versions, versioned
+
+    def _tables_read(self, conn: sqlite3.Connection, sql: str, params: Any) -> Optional[Tuple[str, ...]]:
+        """Tables a statement reads, from the b-trees its bytecode opens (views included).
+        None means the statement touches something we cannot version (temp/virtual tables)."""
+        roots = {r[0]: r[1] for r in conn.execute(
+            "SELECT rootpage, tbl_name FROM sqlite_master WHERE rootpage > 0").fetchall()}
+        tables = set()
+        for op in conn.execute("EXPLAIN " + sql, params or []).fetchall():
+            opcode = op[1]
+            if opcode == "VOpen":
+                return None
+            if opcode in ("OpenRead", "OpenWrite", "ReopenIdx"):
+                if op[4] != 0 or op[3] not in roots:
+                    return None
+                tables.add(roots[op[3]])
+        return tuple(sorted(tables))
+
+    # -- cache ------------------------------------------------------------------
+    def get_or_execute(self, path: str, conn: sqlite3.Connection, sql: str, params: Any) -> List[Dict[str, Any]]:
+        """Serve `sql` from the cache when every table it reads is unchanged, else run it on `conn`."""
+        schema_version, versions, versioned = self._snapshot(conn)
+        norm = normalize_sql(sql)
+        dep_key = (path, schema_version, norm)
+        tables = self._deps.get(dep_key, ())
+        if dep_key not in self._deps:
+            tables = self._tables_read(conn, sql, params)
+            with self._lock:
+                if len(self._deps) > 4096:
+                    self._deps.clear()
+                self._deps[dep_key] = tables
+        if tables is None or not versioned.issuperset(tables):
+            return [dict(r) for r in conn.execute(sql, params or []).fetchall()]
+
+        key = (path, norm, _params_key(params))
+        current = tuple((t, versions.get(t, 0)) for t in tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.versions == current:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._local.last_hit = True
+                    return [dict(r) for r in entry.rows]
+                self.invalidations += 1
+                self._drop(key)
+            self.misses += 1
+            self._local.last_hit = False
+
+        rows = [dict(r) for r in conn.execute(sql, params or []).fetchall()]
+        self._store(key, rows, current)
+        return [dict(r) for r in rows]
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.nbytes
+
+    def _store(self, key: Hashable, rows: List[Dict[str, Any]], versions: Tuple[Tuple[str, int], ...]) -> None:
+        nbytes = _approx_size(rows)
+        if nbytes > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(rows, versions, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes and self._entries:
+                _, old = self._entries.popitem(last=False)
+                self.bytes -= old.nbytes
+                self.evictions += 1
+
+    def trace_info(self) -> Dict[str, Any]:
+        """Whether this thread's last cached read hit, plus the running hit rate (for provenance)."""
+        stats = self.stats()
+        return {"hit": getattr(self._local, "last_hit", None), "hit_rate": stats["hit_rate"],
+                "entries": stats["entries"], "bytes": stats["bytes"]}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._deps.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "invalidations": self.invalidations, "evictions": self.evictions}
@@ -1,55 +1,358 @@
+import os
+import re
 import sqlite3
-import math
-from typing import Any, Dict, List, Optional, Union
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Union
+from urllib.parse import quote
+
+import numpy as np
+
 from ..config import settings as cfg
+from ..stage_metrics import timed
+from .sql_cache import SQLResultCache, install_version_triggers, is_cacheable
+
+_DDL_RE = re.compile(r"^\s*(CREATE|ALTER)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|VACUUM|ATTACH|REINDEX)\b", re.IGNORECASE)
+
+_local = threading.local()
+_all_connections: List[sqlite3.Connection] = []
+_registry_lock = threading.Lock()
+_generation = 0         # bumped by close_connections; older per-thread pools are discarded
+_sql_executor: Optional[ThreadPoolExecutor] = None
+sql_cache = SQLResultCache(max_bytes=cfg.sql_cache_max_bytes)
+
+
+def _db_path() -> str:
+    return getattr(cfg, "local_db_path", "local_agent.db")
+
+
+def is_read_only(query: str) -> bool:
+    """SELECT/WITH/EXPLAIN statements without write keywords can use a read-only connection."""
+    head = query.lstrip().split(None, 1)[0].upper() if query.strip() else ""
+    return head in ("SELECT", "WITH", "EXPLAIN") and not _WRITE_RE.search(query)
+
+
+def _connect(readonly: bool) -> sqlite3.Connection:
+    path = _db_path()
+    if readonly:
+        # mode=ro: the query tools can never write, even through a crafted statement
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                               check_same_thread=False, cached_statements=cfg.sqlite_statement_cache_size)
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False,
+                               cached_statements=cfg.sqlite_statement_cache_size)
+        conn.execute("PRAGMA journal_mode = WAL")      # readers never block the writer
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {int(cfg.sqlite_mmap_size_bytes)}")
+    conn.execute(f"PRAGMA cache_size = -{int(cfg.sqlite_cache_size_kib)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.row_factory = sqlite3.Row
+    with _registry_lock:
+        _all_connections.append(conn)
+    return conn
+
+
+def get_connection(readonly: bool = False) -> sqlite3.Connection:
+    """
+    Per-thread pooled connection (one read-only and one read-write per thread and database).
+    sqlite3's `cached_statements` keeps an LRU of prepared statements on each
+    connection, so repeated queries skip re-compilation.
+    """
+    if getattr(_local, "generation", None) != _generation:
+        _local.pool, _local.generation = {}, _generation
+    pool = _local.pool
+    key = (_db_path(), readonly)
+    conn = pool.get(key)
+    if conn is None:
+        if readonly and not os.path.exists(key[0]):
+            get_connection(readonly=False)             # creates the file (and WAL mode) first
+        conn = pool[key] = _connect(readonly)
+    return conn
+
 
+def close_connections() -> None:
+    """Close every pooled connection of every thread and the SQL executor (called on shutdown)."""
+    global _sql_executor, _generation
+    with _registry_lock:
+        conns = list(_all_connections)
+        _all_connections.clear()
+        executor, _sql_executor = _sql_executor, None
+        _generation += 1        # other threads reconnect instead of reusing a closed connection
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    if executor is not None:
+        executor.shutdown(wait=False)
 
+
+@timed("tool", "util_sql", status_of=lambda rows: "error" if rows and "error" in rows[0] else "ok")
 def run_sql(query: str, params: Optional[Union[List[Any], Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
     """
     Executes a SQL query on a local SQLite database.
     Used for local mocking of database calls inside the orchestration flow.
+    Reads go through a pooled read-only connection (and the versioned result
+    cache); writes are committed on the thread's read-write connection.
     """
 
-    db_path = getattr(cfg, "local_db_path", "local_agent.db")
-
+    conn = None
+    readonly = True
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(query, params or [])
+        readonly = is_read_only(query)
+        if readonly and cfg.sql_cache_enabled and is_cacheable(query):
+            return sql_cache.get_or_execute(_db_path(), get_connection(readonly=True), query, params)
+        conn = get_connection(readonly=readonly)
+        cursor = conn.execute(query, params or [])
         rows = cursor.fetchall()
-        conn.commit()
-        conn.close()
+        if not readonly:
+            conn.commit()
+            if cfg.sql_cache_enabled and _DDL_RE.match(query):
+                install_version_triggers(conn)          # new tables get their cache bump triggers here
 
         # Convert to list of dicts
         return [dict(row) for row in rows]
     except Exception as e:
+        # The pooled write connection outlives this call: never leave it mid-transaction
+        if conn is not None and not readonly and conn.in_transaction:
+            conn.rollback()
         # In local/mock mode, we just return a safe placeholder
         return [{"query": query, "error": str(e)}]
 
 
+def _executor() -> ThreadPoolExecutor:
+    global _sql_executor
+    with _registry_lock:
+        if _sql_executor is None:
+            _sql_executor = ThreadPoolExecutor(max_workers=cfg.sqlite_pool_size, thread_name_prefix="sqlite")
+        return _sql_executor
+
+
+def install_sql_cache_triggers() -> None:
+    """Give every existing table its result-cache bump triggers (startup; tables made elsewhere)."""
+    if cfg.sql_cache_enabled:
+        install_version_triggers(get_connection(readonly=False))
+
+
+async def run_sql_async(query: str, params: Optional[Union[List[Any], Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """Async wrapper: runs `run_sql` on the dedicated SQLite executor (each worker keeps its own connections)."""
+    return await asyncio.get_running_loop().run_in_executor(_executor(), run_sql, query, params)
+
+
+# ---------------------------------------------------------------------------
+# Service latency schema (calc_compare)
+# ---------------------------------------------------------------------------
+# Raw p95/p99 observations land in `service_metrics`; an AFTER INSERT trigger
+# keeps `service_latency_summary` (latest value per service) up to date, so
+# lookups are a primary-key probe instead of a scan. `services` is kept as a
+# view for queries written against the old table. A legacy `services` table is
+# only converted by `migrate_service_schema()` (run at startup), never on reads.
+_SERVICE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS service_metrics (
+    service TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    p95_ms  REAL,
+    p99_ms  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_service_metrics_service_ts ON service_metrics(service, ts);
+CREATE TABLE IF NOT EXISTS service_latency_summary (
+    service    TEXT PRIMARY KEY,
+    p95_ms     REAL,
+    p99_ms     REAL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_service_metrics_summary
+AFTER INSERT ON service_metrics
+BEGIN
+    INSERT INTO service_latency_summary (service, p95_ms, p99_ms, updated_at)
+    VALUES (NEW.service, NEW.p95_ms, NEW.p99_ms, NEW.ts)
+    ON CONFLICT(service) DO UPDATE SET
+        p95_ms = excluded.p95_ms,
+        p99_ms = COALESCE(excluded.p99_ms, service_latency_summary.p99_ms),
+        updated_at = excluded.updated_at
+    WHERE excluded.updated_at >= service_latency_summary.updated_at;
+END;
+"""
+
+_schema_ready: Dict[str, bool] = {}
+_schema_lock = threading.Lock()
+
+
+def _legacy_services_table(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'services'").fetchone()
+    return row is not None and row[0] == "table"
+
+
+def ensure_service_schema() -> None:
+    """Create the service latency tables once per database (writers only; never touches a legacy table)."""
+    path = _db_path()
+    if _schema_ready.get(path):
+        return
+    with _schema_lock:
+        if _schema_ready.get(path):
+            return
+        conn = get_connection(readonly=False)
+        conn.executescript(_SERVICE_SCHEMA)
+        if _legacy_services_table(conn):
+            print(f"[util_sql] {path} still has a legacy `services` table; "
+                  f"run migrate_service_schema() to fold it into service_metrics")
+        else:
+            conn.execute("CREATE VIEW IF NOT EXISTS services AS "
+                         "SELECT service, p95_ms AS p95, p99_ms AS p99, updated_at FROM service_latency_summary")
+        conn.commit()
+        install_sql_cache_triggers()
+        _schema_ready[path] = True
+
+
+def migrate_service_schema() -> int:
+    """
+    Explicit migration (run from the app's startup): copy a legacy `services`
+    table's p95 (and p99, when present) rows into `service_metrics`, keep the old
+    table as `services_legacy` and create the compatibility view in its place.
+    Returns the number of rows migrated.
+    """
+    path = _db_path()
+    conn = get_connection(readonly=False)
+    with _schema_lock:
+        conn.executescript(_SERVICE_SCHEMA)
+        if not _legacy_services_table(conn):
+            install_sql_cache_triggers()
+            return 0
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(services)").fetchall()]
+        lower = [c.lower() for c in cols]
+        service = cols[lower.index("service")] if "service" in lower else cols[0]
+        p95 = next((cols[lower.index(c)] for c in ("p95", "p95_ms") if c in lower),
+                   cols[1] if len(cols) >= 2 else None)
+        p99 = next((f'"{cols[lower.index(c)]}"' for c in ("p99", "p99_ms") if c in lower), "NULL")
+        backup, suffix = "services_legacy", 0
+        while conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (backup,)).fetchone():
+            suffix += 1
+            backup = f"services_legacy_{suffix}"
+        with conn:
+            migrated = 0
+            if p95 is not None:
+                migrated = conn.execute(
+                    f'INSERT INTO service_metrics (service, ts, p95_ms, p99_ms) '
+                    f'SELECT "{service}", 0, "{p95}", {p99} FROM services '
+                    f'WHERE "{p95}" IS NOT NULL').rowcount
+            conn.execute(f'ALTER TABLE services RENAME TO "{backup}"')
+            conn.execute("CREATE VIEW IF NOT EXISTS services AS "
+                         "SELECT service, p95_ms AS p95, p99_ms AS p99, updated_at FROM service_latency_summary")
+        install_sql_cache_triggers()
+        _schema_ready[path] = True
+    print(f"[util_sql] Migrated {migrated} rows from the legacy `services` table in {path}; "
+          f"the original table is kept as `{backup}`")
+    return migrated
+
+
+def record_service_latencies(rows: List[Dict[str, Any]]) -> int:
+    """Append {"service", "p95_ms", "p99_ms"?, "ts"?} observations; the trigger refreshes the summary."""
+    ensure_service_schema()
+    now = time.time()
+    params = [(r["service"], float(r.get("ts") or now), r.get("p95_ms"), r.get("p99_ms"))
+              for r in rows if r.get("service") and r.get("p95_ms") is not None]
+    if not params:
+        return 0
+    conn = get_connection(readonly=False)
+    with conn:
+        conn.executemany("INSERT INTO service_metrics (service, ts, p95_ms, p99_ms) VALUES (?, ?, ?, ?)", params)
+    return len(params)
+
+
+async def record_service_latencies_async(rows: List[Dict[str, Any]]) -> int:
+    return await asyncio.get_running_loop().run_in_executor(_executor(), record_service_latencies, rows)
+
+
+def _in_placeholders(n: int) -> str:
+    # Round the IN-list up to a power of two (padded with NULLs, which never
+    # match) so a handful of statement shapes stay in the prepared-statement LRU
+    size = 1 << max(0, n - 1).bit_length()
+    return ", ".join("?" * size)
+
+
+def fetch_service_p95s(services: List[str]) -> Dict[str, float]:
+    """Latest p95 (ms) for just the requested services, via an indexed `WHERE service IN (...)`."""
+    wanted = list(dict.fromkeys(s for s in services if s))
+    if not wanted:
+        return {}
+    # Read-only: no DDL here. Before any write has created the table, the query
+    # errors and the result is simply empty
+    sql = (f"SELECT service, p95_ms FROM service_latency_summary "
+           f"WHERE service IN ({_in_placeholders(len(wanted))})")
+    params = wanted + [None] * (sql.count("?") - len(wanted))
+    return {r["service"]: r["p95_ms"] for r in run_sql(sql, params)
+            if "error" not in r and r.get("p95_ms") is not None}
+
+
+_BINARY_OPS = ("+", "-", "*", "/", "^", "sqrt", "log", "ratio", "pct_change")
+_COMPARE_OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+_AGG_OPS = ("mean", "sum", "min", "max", "std", "percentile")
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def calc_batch(a: ArrayLike,
+               b: Optional[ArrayLike] = None,
+               op: str = "+",
+               q: Optional[float] = None,
+               axis: Optional[int] = None) -> Union[np.ndarray, float]:
+    """
+    Vectorized calculator over whole columns (NumPy arrays, lists or scalars).
+
+    - elementwise: `+ - * / ^ sqrt log ratio pct_change` (b broadcasts against a;
+      division by zero gives inf, `pct_change` is (a - b) / b * 100)
+    - thresholds: `> >= < <=` against b, returning a boolean array
+    - aggregations over a: `mean sum min max std percentile` (`q` in 0-100)
+
+    Raises ValueError for unknown ops; invalid inputs (sqrt of a negative, log of
+    a value <= 0 or to base 1) give NaN in their positions rather than failing
+    the whole batch, matching the scalar `calc`. Overflow gives inf.
+    """
+    x = np.asarray(a, dtype=np.float64)
+    if op in _AGG_OPS:
+        if op == "percentile":
+            if q is None:
+                raise ValueError("percentile needs q")
+            return np.percentile(x, q, axis=axis)
+        return getattr(np, op)(x, axis=axis)
+    y = np.asarray(0.0 if b is None else b, dtype=np.float64)
+    if op in _COMPARE_OPS:
+        return _COMPARE_OPS[op](x, y)
+    if op not in _BINARY_OPS:
+        raise ValueError(f"Unsupported operation: {op}")
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        if op == "+":
+            return x + y
+        if op == "-":
+            return x - y
+        if op == "*":
+            return x * y
+        if op in ("/", "ratio"):
+            return np.where(y != 0, x / np.where(y != 0, y, 1.0), np.inf)
+        if op == "^":
+            return np.power(x, y)
+        if op == "sqrt":
+            return np.sqrt(x)
+        if op == "log":
+            base = np.where(y > 0, y, np.e)
+            valid = (x > 0) & (base != 1.0)
+            return np.where(valid, np.log(np.where(valid, x, 1.0)) / np.log(np.where(valid, base, np.e)), np.nan)
+        # pct_change
+        return np.where(y != 0, (x - y) / np.where(y != 0, y, 1.0) * 100.0, np.inf)
+
+
 def calc(a: float, b: float, op: str = "+") -> float:
     """
     Performs a basic arithmetic or mathematical operation.
     Acts as a utility calculator for orchestrator logic (e.g., scoring, metrics normalization).
+    Thin scalar wrapper around `calc_batch`.
     """
     try:
-        if op == "+":
-            return a + b
-        elif op == "-":
-            return a - b
-        elif op == "*":
-            return a * b
-        elif op == "/":
-            return a / b if b != 0 else float("inf")
-        elif op == "^":
-            return math.pow(a, b)
-        elif op == "sqrt":
-            return math.sqrt(a)
-        elif op == "log":
-            return math.log(a, b if b > 0 else math.e)
-        else:
-            raise ValueError(f"Unsupported operation: {op}")
+        return float(calc_batch(a, b, op))
     except Exception as e:
         print(f"[util_tool.calc] Error: {e}")
         return float("nan")
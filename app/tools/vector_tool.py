@@ -1,54 +1,272 @@
-from typing import Any, Dict, List, Optional
-import httpx
-import json
-from ..config import settings as cfg 
+import asyncio
+import time
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
 
+import numpy as np
 
-async def call_vector(
-    collection_name: str,
-    query_vector: List[float],
+from ..config import settings as cfg
+from ..schemas import VectorHit, VectorResult
+from ..stage_metrics import timed
+from ..tool_broker import http_clients
+from .embeddings import embed_texts, get_embedder
+from .ann_index import get_local_index
+from .qdrant_store import Search, search_batch
+from .content_store import fetch_text
+from .corpus import point_id
+from .embeddings import tokenize
+from .sparse_index import get_sparse_index, query_sparse_vector, query_terms
+
+_health = {"ok": False, "checked_at": float("-inf")}
+
+
+async def qdrant_healthy() -> bool:
+    """Cached Qdrant readiness probe (`/readyz`), re-checked every `qdrant_health_ttl_seconds`."""
+    now = time.monotonic()
+    if now - _health["checked_at"] < cfg.qdrant_health_ttl_seconds:
+        return _health["ok"]
+    url = f"{cfg.qdrant_url.rstrip('/')}/readyz"
+    try:
+        r = await http_clients.async_client(url).get(url, timeout=cfg.http_connect_timeout_seconds)
+        ok = r.status_code == 200
+    except Exception:
+        ok = False
+    _health.update(ok=ok, checked_at=now)
+    return ok
+
+
+def min_score() -> float:
+    """Score a top hit needs to count as an answer; hashing vectors score lower than semantic ones."""
+    if get_embedder().semantic:
+        return cfg.vector_score_threshold_primary
+    return cfg.vector_score_threshold_fallback
+
+
+def _result(hits: List[VectorHit], source: str) -> VectorResult:
+    return VectorResult(success=bool(hits), hits=hits, source=source,
+                        score=hits[0].score if hits else 0.0,
+                        message=f"{len(hits)} hits from {source}")
+
+
+async def _search_qdrant(searches: Sequence[Search], collection: Optional[str],
+                         timeout: Optional[float]) -> List[VectorResult]:
+    """One batched round trip (pooled gRPC or REST, see qdrant_store.py) for all `searches`."""
+    results = await search_batch(searches, collection or cfg.qdrant_collection, timeout)
+    return [_result(hits, "qdrant" if kind == "dense" else "qdrant_sparse")
+            for (kind, _, _), hits in zip(searches, results)]
+
+
+def search_local(vector, limit: int = 5) -> VectorResult:
+    index = get_local_index()
+    hits = [VectorHit(id=pos, score=score, payload=index.payloads[pos])
+            for score, pos in index.search(vector, k=limit)]
+    return _result(hits, "local_ann")
+
+
+def search_sparse_local(query: str, limit: int = 5) -> VectorResult:
+    index = get_sparse_index()
+    hits = [VectorHit(id=pos, score=score, payload=index.payloads[pos])
+            for score, pos in index.search(query, k=limit)]
+    return _result(hits, "local_sparse")
+
+
+async def call_sparse(
+    query: str,
     limit: int = 5,
+    collection_name: Optional[str] = None,
     timeout: Optional[float] = None,
-) -> Dict[str, Any]:
+) -> VectorResult:
     """
-    Communicates with the Qdrant vector database (or local mock) to perform similarity search.
-    This is used by the Orchestrator to retrieve semantically similar items.
+    Lexical (BM25) search with the same sparse representation the seeder uploads:
+    Qdrant's `bm25` sparse vector when available, else the local inverted index.
+    """
+    qdrant_error = None
+    if cfg.use_qdrant and await qdrant_healthy():
+        try:
+            return (await _search_qdrant([("sparse", query_sparse_vector(query), limit)],
+                                         collection_name, timeout))[0]
+        except Exception as e:
+            qdrant_error = str(e)
+    try:
+        result = await asyncio.to_thread(search_sparse_local, query, limit)
+    except Exception as e:
+        return VectorResult(success=False, error=str(e), message=f"Local sparse index unavailable: {e}")
+    if qdrant_error:
+        result.message = f"{result.message} (qdrant failed: {qdrant_error})"
+    return result
 
-    Args:
-        collection_name: Name of the Qdrant collection.
-        query_vector: The vector embedding to query against.
-        limit: Max number of results.
-        timeout: Optional timeout for the request.
 
-    Returns:
-        JSON-like dictionary with search results or error.
+async def call_dense(
+    query: str,
+    limit: int = 5,
+    collection_name: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> VectorResult:
     """
+    Dense (embedding) search: Qdrant when `use_qdrant` is on and its health check
+    passes, otherwise (or if the search fails) the in-process IVF index built
+    from the same docs.
+    """
+    return (await call_vector_batch([query], limit, collection_name, timeout, hybrid=False))[0]
 
-    # Default timeout
-    timeout = timeout or settings.HTTP_TIMEOUT_SECONDS
 
-    qdrant_url = f"http://localhost:{settings.qdrant_port}/collections/{collection_name}/points/search"
+def _hit_key(hit: VectorHit) -> Hashable:
+    """Identity of a chunk across backends (Qdrant uuids and local positions differ)."""
+    p = hit.payload
+    return (p["title"], p.get("chunk", 0)) if "title" in p else hit.id
 
-    payload = {
-        "vector": query_vector,
-        "limit": limit,
-    }
 
+def rrf_fuse(rankings: Sequence[Sequence[Hashable]], k: int = 60,
+             weights: Optional[Sequence[float]] = None) -> List[Tuple[Hashable, float]]:
+    """
+    Reciprocal rank fusion: score(d) = sum_i w_i / (k + rank_i(d)), ranks from 1.
+    Candidates are mapped to dense codes once and scored with a single bincount.
+    """
+    codes: Dict[Hashable, int] = {}
+    flat = [codes.setdefault(key, len(codes)) for ranking in rankings for key in ranking]
+    if not flat:
+        return []
+    ranks = np.concatenate([np.arange(1, len(r) + 1, dtype=np.float64) for r in rankings])
+    w = np.concatenate([np.full(len(r), 1.0 if weights is None else weights[i])
+                        for i, r in enumerate(rankings)])
+    scores = np.bincount(np.asarray(flat), weights=w / (k + ranks), minlength=len(codes))
+    order = np.argsort(-scores, kind="stable")
+    keys = list(codes)
+    return [(keys[i], float(scores[i])) for i in order]
+
+
+def term_coverage(query: str, hit: VectorHit) -> float:
+    """Share of the query's non-stopword terms that occur in the hit's chunk text."""
+    terms = query_terms(query)
+    if not terms:
+        return 0.0
+    p = hit.payload
+    text = fetch_text(point_id(p["title"], p.get("chunk", 0))) if "title" in p else None
+    tokens = set(tokenize(text if text is not None else p.get("snippet", "")))
+    return sum(t in tokens for t in terms) / len(terms)
+
+
+def _fuse(query: str, dense: VectorResult, sparse: VectorResult, limit: int) -> VectorResult:
+    """RRF-merge one query's dense and BM25 results. Blocking: may read chunk text."""
+    if not dense.hits and not sparse.hits:
+        error = "; ".join(e for e in (dense.error, sparse.error) if e) or None
+        return VectorResult(success=False, error=error, source="hybrid",
+                            message=f"No hits (dense: {dense.message}; sparse: {sparse.message})")
+    by_key: Dict[Hashable, VectorHit] = {}
+    dense_scores: Dict[Hashable, float] = {}
+    sparse_scores: Dict[Hashable, float] = {}
+    for hits, scores in ((dense.hits, dense_scores), (sparse.hits, sparse_scores)):
+        for h in hits:
+            key = _hit_key(h)
+            by_key.setdefault(key, h)
+            scores.setdefault(key, h.score)
+    fused = rrf_fuse([list(dense_scores), list(sparse_scores)], k=cfg.hybrid_rrf_k)[:limit]
+    hits = [VectorHit(id=by_key[key].id, score=score, payload=by_key[key].payload,
+                      dense_score=dense_scores.get(key), sparse_score=sparse_scores.get(key))
+            for key, score in fused]
+    top = hits[0]
+    confidence = top.dense_score or 0.0
+    # Keyword acceptance: the BM25 winner must also be the fused winner and
+    # contain most of the query's content terms (calibrated on coverage, not
+    # on raw BM25, whose scale depends on the corpus and backend)
+    if (confidence < min_score() and sparse.hits and _hit_key(sparse.hits[0]) == fused[0][0]
+            and term_coverage(query, top) >= cfg.hybrid_min_term_coverage):
+        confidence = min_score()
+    return VectorResult(success=True, hits=hits, source="hybrid", score=confidence,
+                        message=f"{len(hits)} hits from {dense.source}+{sparse.source} (rrf)")
+
+
+async def _search_local_pair(query: str, vector, depth: int, hybrid: bool) -> Tuple[VectorResult, VectorResult]:
+    async def guarded(fn, arg, what: str) -> VectorResult:
+        try:
+            return await asyncio.to_thread(fn, arg, depth)
+        except Exception as e:
+            return VectorResult(success=False, error=str(e), message=f"Local {what} index unavailable: {e}")
+
+    if not hybrid:
+        return await guarded(search_local, vector, "vector"), VectorResult(success=False)
+    dense, sparse = await asyncio.gather(guarded(search_local, vector, "vector"),
+                                         guarded(search_sparse_local, query, "sparse"))
+    return dense, sparse
+
+
+@timed("tool", "vector_tool", status_of=lambda rs: "ok" if all(r.success for r in rs) else "error")
+async def call_vector_batch(
+    queries: Sequence[str],
+    limit: int = 5,
+    collection_name: Optional[str] = None,
+    timeout: Optional[float] = None,
+    hybrid: Optional[bool] = None,
+) -> List[VectorResult]:
+    """
+    `call_vector` for several queries at once: the queries are embedded in one
+    encoder call and, against Qdrant, every dense and BM25 search of every query
+    goes out in a single batch request.
+    """
+    hybrid = cfg.hybrid_retrieval_enabled if hybrid is None else hybrid
+    depth = max(limit, cfg.hybrid_candidates) if hybrid else limit
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.post(qdrant_url, json=payload)
-            response.raise_for_status()
-            return response.json()
+        vectors = await asyncio.to_thread(embed_texts, list(queries))
     except Exception as e:
-        # Fallback mock (so you can run without Qdrant Docker)
-        return {
-            "collection_name": collection_name,
-            "query_vector": query_vector[:5],
-            "limit": limit,
-            "status": "mock",
-            "message": f"Qdrant not reachable or error: {e}",
-            "results": [
-                {"id": 1, "score": 0.92, "payload": {"mock": True}},
-                {"id": 2, "score": 0.88, "payload": {"mock": True}},
-            ],
-        }
+        return [VectorResult(success=False, error=str(e), message=f"Embedding failed: {e}") for _ in queries]
+
+    pairs: Optional[List[Tuple[VectorResult, VectorResult]]] = None
+    qdrant_error = None
+    if cfg.use_qdrant and await qdrant_healthy():
+        searches: List[Search] = []
+        for query, vector in zip(queries, vectors):
+            searches.append(("dense", vector, depth))
+            if hybrid:
+                searches.append(("sparse", query_sparse_vector(query), depth))
+        try:
+            results = await _search_qdrant(searches, collection_name, timeout)
+            step = 2 if hybrid else 1
+            pairs = [(results[i], results[i + 1] if hybrid else VectorResult(success=False))
+                     for i in range(0, len(results), step)]
+        except Exception as e:
+            qdrant_error = str(e)
+    if pairs is None:
+        pairs = list(await asyncio.gather(*(_search_local_pair(q, v, depth, hybrid)
+                                            for q, v in zip(queries, vectors))))
+    if hybrid:
+        # Fusion may read chunk texts (mmap/disk) for term coverage: do the
+        # whole batch in one worker thread, off the broker loop
+        out = await asyncio.to_thread(
+            lambda: [_fuse(q, dense, sparse, limit) for q, (dense, sparse) in zip(queries, pairs)])
+    else:
+        out = [dense for dense, _ in pairs]
+    if qdrant_error:
+        for result in out:
+            result.message = f"{result.message} (qdrant failed: {qdrant_error})"
+    return out
+
+
+async def call_vector(
+    query: str,
+    limit: int = 5,
+    collection_name: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> VectorResult:
+    """
+    Hybrid search over the docs corpus.
+    This is used by the Orchestrator to retrieve semantically similar items.
+
+    BM25 and dense searches run concurrently (one batched request against
+    Qdrant), each for `hybrid_candidates` hits. Their results are merged with
+    reciprocal rank fusion, so exact keywords ("SAML") and paraphrases both
+    land. Hits are ordered by fused score. `score` is the top hit's dense
+    cosine, for the orchestrators' threshold. The only exception is a top hit
+    that is also BM25's first hit and contains at least
+    `hybrid_min_term_coverage` of the query's non-stopword terms: it is
+    accepted (raised to `min_score()`). With
+    `hybrid_retrieval_enabled` off this is `call_dense`.
+
+    Args:
+        query: Natural-language query.
+        limit: Max number of results.
+        collection_name: Qdrant collection (defaults to `qdrant_collection`).
+        timeout: Optional timeout override (defaults to vector_tool's ToolMeta).
+
+    Returns:
+        VectorResult with hits ordered by score.
+    """
+    return (await call_vector_batch([query], limit, collection_name, timeout))[0]
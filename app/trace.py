@@ -3,25 +3,278 @@ Lightweight in-memory tracing / provenance store for local development.
 
 Provides:
 - new_trace_id(session_id=None) -> str
+- trace_context(trace_id=None) / @traced: bind the current trace id
+- current_trace_id() -> Optional[str]
 - record_prov(..., session_id=None, trace_id=None) -> str (returns trace_id)
-- get_trace(trace_id) -> list
+- get_trace(trace_id, last_n=None) -> list
+- recent_entries(limit) -> list
+- load_trace(trace_id) -> (source, list): memory first, then the on-disk export
 - clear_trace(trace_id) -> None
 - get_trace_summary(trace_id) -> dict
+- trace_stats() -> dict (sizes and eviction counters)
+
+Memory is bounded:
+- Entries are `__slots__` records held in one global ring buffer, capped at
+  `trace_max_entries` and `trace_max_bytes`. The oldest entries are evicted
+  first.
+- A trace with no new event for `trace_ttl_seconds` is dropped as a whole.
+- `inputs`/`outputs` whose JSON form exceeds `trace_max_field_bytes` are
+  replaced by a preview plus their sha256 and size.
+
+A long-running worker therefore holds a constant amount of provenance.
+
+The trace id of a request is bound once in a `ContextVar` (see
+`trace_context`) and picked up by every `record_prov` call below it, including
+calls made from tasks and threads that copy the context. Reading one trace is
+a lookup in the per-trace index, not a scan of the ring.
+
+With `trace_export_enabled`, entries are also queued for the background
+exporter in `app/trace_export.py` (never blocking the caller), and traces
+evicted from memory can still be read back from disk.
 """
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
 from uuid import uuid4
+import hashlib
+import json
+import sys
 import time
 import threading
 
-_lock = threading.Lock()
-_traces: Dict[str, List[Dict[str, Any]]] = {}
+from .config import settings
+from .trace_export import EXPORTER
+
+_ENTRY_OVERHEAD = 200   # rough bytes for the record + its small fields
+
+
+def _compact(value: Any, max_bytes: int) -> tuple:
+    """(value to store, its approximate size, truncated?) for an `inputs`/`outputs` field."""
+    try:
+        encoded = json.dumps(value, default=str, separators=(",", ":"))
+    except (TypeError, ValueError):
+        encoded = repr(value)
+    size = len(encoded)
+    if size <= max_bytes:
+        return value, size, False
+    digest = hashlib.sha256(encoded.encode("utf-8", "replace")).hexdigest()
+    stub = {"_truncated": True, "bytes": size, "sha256": digest, "preview": encoded[:max_bytes]}
+    return stub, max_bytes + 120, True
+
+
+class ProvEntry:
+    """One provenance event (slots keep the per-entry overhead small)."""
+
+    __slots__ = ("timestamp", "event_type", "component", "actor", "inputs", "outputs",
+                 "confidence", "prompt_name", "session_id", "trace_id", "size", "alive")
+
+    def __init__(self, timestamp: float, event_type: str, component: str, actor: str, inputs: Any,
+                 outputs: Any, confidence: float, prompt_name: Optional[str], session_id: Optional[str],
+                 trace_id: str, size: int):
+        self.timestamp = timestamp
+        self.event_type = event_type
+        self.component = component
+        self.actor = actor
+        self.inputs = inputs
+        self.outputs = outputs
+        self.confidence = confidence
+        self.prompt_name = prompt_name
+        self.session_id = session_id
+        self.trace_id = trace_id
+        self.size = size
+        self.alive = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": self.timestamp,
+            "event_type": self.event_type,
+            "component": self.component,
+            "actor": self.actor,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "confidence": self.confidence,
+            "prompt_name": self.prompt_name,
+            "session_id": self.session_id,
+            "trace_id": self.trace_id,
+        }
+
+
+class TraceStore:
+    """Ring buffer of `ProvEntry` plus a per-trace index, bounded by count, bytes and TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float, max_field_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_field_bytes = max_field_bytes
+        self._lock = threading.Lock()
+        self._ring: Deque[ProvEntry] = deque()
+        # trace_id -> its live entries; ordered by last activity for TTL sweeps
+        self._traces: "OrderedDict[str, Deque[ProvEntry]]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self.entries = 0
+        self.bytes = 0
+        self.counters = {"recorded": 0, "evicted_capacity": 0, "evicted_bytes": 0,
+                         "evicted_ttl": 0, "traces_expired": 0, "fields_truncated": 0}
+
+    # -- eviction (lock held) -------------------------------------------------
+    def _kill(self, entry: ProvEntry) -> None:
+        entry.alive = False
+        entry.inputs = entry.outputs = None
+        self.entries -= 1
+        self.bytes -= entry.size
+
+    def _evict_oldest(self, reason: str) -> None:
+        while self._ring:
+            entry = self._ring.popleft()
+            if not entry.alive:
+                continue
+            self._kill(entry)
+            self.counters[reason] += 1
+            entries = self._traces.get(entry.trace_id)
+            if entries:
+                entries.popleft()       # a trace's oldest live entry is the ring's oldest of it
+                if not entries:
+                    del self._traces[entry.trace_id]
+                    self._last_seen.pop(entry.trace_id, None)
+            return
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        while self._traces:
+            trace_id = next(iter(self._traces))
+            if self._last_seen[trace_id] >= cutoff:
+                break
+            for entry in self._traces.pop(trace_id):
+                self._kill(entry)
+                self.counters["evicted_ttl"] += 1
+            del self._last_seen[trace_id]
+            self.counters["traces_expired"] += 1
+        # Drop dead shells from the front so the ring itself stays bounded
+        while self._ring and not self._ring[0].alive:
+            self._ring.popleft()
+
+    # -- API ------------------------------------------------------------------------
+    def record(self, event_type: str, component: str, actor: str, inputs: Any, outputs: Any,
+               confidence: float, prompt_name: Optional[str], session_id: Optional[str],
+               trace_id: str) -> ProvEntry:
+        inputs, in_size, t1 = _compact(inputs, self.max_field_bytes)
+        outputs, out_size, t2 = _compact(outputs, self.max_field_bytes)
+        now = time.time()
+        entry = ProvEntry(now, sys.intern(event_type), sys.intern(component), sys.intern(actor),
+                          inputs, outputs, float(confidence), prompt_name, session_id, trace_id,
+                          _ENTRY_OVERHEAD + in_size + out_size)
+        with self._lock:
+            self.counters["fields_truncated"] += t1 + t2
+            self.counters["recorded"] += 1
+            self._ring.append(entry)
+            self._traces.setdefault(trace_id, deque()).append(entry)
+            self._traces.move_to_end(trace_id)
+            self._last_seen[trace_id] = now
+            self.entries += 1
+            self.bytes += entry.size
+            self._expire(now)
+            while self.entries > self.max_entries or len(self._ring) > 2 * self.max_entries:
+                self._evict_oldest("evicted_capacity")
+            while self.bytes > self.max_bytes and self.entries > 1:
+                self._evict_oldest("evicted_bytes")
+        return entry
+
+    def get(self, trace_id: str, last_n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Entries of one trace, oldest first (only the newest `last_n` when given)."""
+        with self._lock:
+            self._expire(time.time())
+            entries = self._traces.get(trace_id, ())
+            if last_n is not None:
+                tail = list(islice(reversed(entries), max(last_n, 0)))
+                return [e.to_dict() for e in reversed(tail)]
+            return [e.to_dict() for e in entries]
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        """The newest `limit` live entries across all traces, oldest first."""
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            for entry in reversed(self._ring):
+                if len(out) >= limit:
+                    break
+                if entry.alive:
+                    out.append(entry.to_dict())
+        out.reverse()
+        return out
+
+    def clear(self, trace_id: Optional[str] = None) -> None:
+        with self._lock:
+            if trace_id is None:
+                self._ring.clear()
+                self._traces.clear()
+                self._last_seen.clear()
+                self.entries = self.bytes = 0
+                return
+            for entry in self._traces.pop(trace_id, ()):
+                self._kill(entry)
+            self._last_seen.pop(trace_id, None)
+
+    def summary(self, trace_id: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._traces.get(trace_id)
+            if not entries:
+                return {"trace_id": trace_id, "count": 0}
+            return {
+                "trace_id": trace_id,
+                "count": len(entries),
+                "first_ts": entries[0].timestamp,
+                "last_ts": entries[-1].timestamp,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": self.entries, "bytes": self.bytes, "traces": len(self._traces),
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+                    "ttl_seconds": self.ttl_seconds, **self.counters}
+
+
+STORE = TraceStore(max_entries=settings.trace_max_entries, max_bytes=settings.trace_max_bytes,
+                   ttl_seconds=settings.trace_ttl_seconds, max_field_bytes=settings.trace_max_field_bytes)
+
+
+_current_trace: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
 
 def new_trace_id(session_id: Optional[str] = None) -> str:
-    """Create a new trace id and initialize storage for it."""
-    trace_id = str(uuid4())
-    with _lock:
-        _traces[trace_id] = []
-    return trace_id
+    """Create a new trace id (storage is allocated on its first event)."""
+    return str(uuid4())
+
+def current_trace_id() -> Optional[str]:
+    """Trace id bound to the running request, if any."""
+    return _current_trace.get()
+
+@contextmanager
+def trace_context(trace_id: Optional[str] = None) -> Iterator[str]:
+    """Bind a trace id for the enclosed block and yield it.
+
+    Without an explicit id, an already-bound trace is reused, so nested
+    workflows (agent -> adapter -> graph) all record into the request's trace.
+    """
+    bound = _current_trace.get()
+    if trace_id is None and bound is not None:
+        yield bound
+        return
+    token = _current_trace.set(trace_id or new_trace_id())
+    try:
+        yield _current_trace.get()
+    finally:
+        _current_trace.reset(token)
+
+def traced(fn: Callable) -> Callable:
+    """Run `fn` inside `trace_context()` (a new trace unless one is bound)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with trace_context():
+            return fn(*args, **kwargs)
+    return wrapper
 
 def record_prov(event_type: str,
                 component: str,
@@ -32,47 +285,38 @@ def record_prov(event_type: str,
                 prompt_name: Optional[str] = None,
                 session_id: Optional[str] = None,
                 trace_id: Optional[str] = None) -> str:
-    """Record a provenance trace entry. Returns the trace_id used."""
+    """Record a provenance trace entry under `trace_id` or the bound trace. Returns the id used."""
     if trace_id is None:
-        trace_id = new_trace_id(session_id=session_id)
-    entry = {
-        "timestamp": time.time(),
-        "event_type": event_type,
-        "component": component,
-        "actor": actor,
-        "inputs": inputs,
-        "outputs": outputs,
-        "confidence": float(confidence),
-        "prompt_name": prompt_name,
-        "session_id": session_id,
-        "trace_id": trace_id
-    }
-    with _lock:
-        if trace_id not in _traces:
-            _traces[trace_id] = []
-        _traces[trace_id].append(entry)
+        trace_id = _current_trace.get() or new_trace_id(session_id=session_id)
+    entry = STORE.record(event_type, component, actor, inputs, outputs, confidence, prompt_name,
+                         session_id, trace_id)
+    if EXPORTER.running:
+        EXPORTER.submit(entry.to_dict())
     return trace_id
 
-def get_trace(trace_id: str) -> List[Dict[str, Any]]:
-    """Return full trace entries for a trace_id."""
-    with _lock:
-        return list(_traces.get(trace_id, []))
+def get_trace(trace_id: str, last_n: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Return trace entries for a trace_id (the newest `last_n` when given)."""
+    return STORE.get(trace_id, last_n)
 
-def clear_trace(trace_id: str) -> None:
-    """Remove trace entries for a trace_id."""
-    with _lock:
-        if trace_id in _traces:
-            del _traces[trace_id]
+def load_trace(trace_id: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """("memory" | "export", entries): the live trace, else its exported copy."""
+    entries = STORE.get(trace_id)
+    if entries:
+        return "memory", entries
+    return "export", EXPORTER.read(trace_id)
+
+def recent_entries(limit: int = 100) -> List[Dict[str, Any]]:
+    """Newest entries across all traces, oldest first."""
+    return STORE.recent(limit)
+
+def clear_trace(trace_id: Optional[str] = None) -> None:
+    """Remove trace entries for a trace_id (all traces when omitted)."""
+    STORE.clear(trace_id)
 
 def get_trace_summary(trace_id: str) -> Dict[str, Any]:
     """Return a compact summary (count, first_ts, last_ts)."""
-    with _lock:
-        entries = _traces.get(trace_id, [])
-        if not entries:
-            return {"trace_id": trace_id, "count": 0}
-        return {
-            "trace_id": trace_id,
-            "count": len(entries),
-            "first_ts": entries[0]["timestamp"],
-            "last_ts": entries[-1]["timestamp"],
-        }
+    return STORE.summary(trace_id)
+
+def trace_stats() -> Dict[str, Any]:
+    """Current size of the store, its eviction / truncation counters and the exporter's."""
+    return {**STORE.stats(), "export": EXPORTER.stats()}
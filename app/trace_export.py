@@ -0,0 +1,225 @@
+"""
+Trace Export
+------------
+Durable provenance, written off the request path.
+
+`record_prov` hands each entry to `TraceExporter.submit`, which only appends
+to a `deque`. Appends and pops are atomic, so producers never take a lock.
+When the queue already holds `trace_export_queue_size` entries, the entry is
+dropped and counted, so a slow disk can never block a request. A daemon
+writer thread wakes every `trace_export_flush_seconds`, or sooner once a batch
+is full. It serializes the queued entries and appends them to a JSONL segment
+(`traces-NNNNNN.jsonl`), then flushes.
+
+Segments rotate at `trace_export_max_file_bytes`, and only the newest
+`trace_export_max_files` are kept. `index.jsonl` is appended once per trace per batch:
+{trace_id, file, spans: [[offset, length], ...]}. It is kept in memory too, so
+`read(trace_id)` seeks straight to that trace's lines in the retained segments.
+The index is compacted whenever a segment is deleted, and reloaded on start.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .config import settings
+
+INDEX_FILE = "index.jsonl"
+SEGMENT_PREFIX = "traces-"
+
+
+class TraceExporter:
+    def __init__(self, path: Optional[os.PathLike] = None, queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_seconds: Optional[float] = None,
+                 max_file_bytes: Optional[int] = None, max_files: Optional[int] = None):
+        self.path = Path(path or settings.trace_export_path)
+        self.queue_size = queue_size or settings.trace_export_queue_size
+        self.batch_size = batch_size or settings.trace_export_batch_size
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.trace_export_flush_seconds
+        self.max_file_bytes = max_file_bytes or settings.trace_export_max_file_bytes
+        self.max_files = max_files or settings.trace_export_max_files
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()       # guards the index (writer vs readers), never the queue
+        self._index: Dict[str, List[Tuple[str, int, int]]] = {}
+        self._segment: Optional[Path] = None
+        self._segment_size = 0
+        self.counters = {"exported": 0, "dropped": 0, "batches": 0, "rotations": 0,
+                         "segments_deleted": 0, "write_errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # -- producer side (request threads) -------------------------------------------
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        """Queue one entry for export; False (and counted) when the queue is full."""
+        if len(self._queue) >= self.queue_size:
+            self.counters["dropped"] += 1
+            return False
+        self._queue.append(entry)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    # -- lifecycle -------------------------------------------------------------------
+    def start(self) -> None:
+        if self.running:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush whatever is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    # -- writer side -----------------------------------------------------------------
+    def _segments(self) -> List[Path]:
+        return sorted(self.path.glob(f"{SEGMENT_PREFIX}*.jsonl"))
+
+    def _load_index(self) -> None:
+        segments = self._segments()
+        live = {p.name for p in segments}
+        index: Dict[str, List[Tuple[str, int, int]]] = {}
+        index_path = self.path / INDEX_FILE
+        if index_path.exists():
+            with open(index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue        # torn last line after a crash
+                    if rec["file"] in live:
+                        index.setdefault(rec["trace_id"], []).extend(
+                            (rec["file"], o, n) for o, n in rec["spans"])
+        with self._lock:
+            self._index = index
+        if segments:
+            self._segment = segments[-1]
+            self._segment_size = self._segment.stat().st_size
+        else:
+            self._segment, self._segment_size = None, 0
+
+    def _next_segment(self) -> None:
+        segments = self._segments()
+        seq = int(segments[-1].stem[len(SEGMENT_PREFIX):]) + 1 if segments else 1
+        self._segment = self.path / f"{SEGMENT_PREFIX}{seq:06d}.jsonl"
+        self._segment_size = 0
+        if segments:
+            self.counters["rotations"] += 1
+        expired = segments[:max(0, len(segments) + 1 - self.max_files)]
+        if expired:
+            self._delete_segments({p.name for p in expired})
+            for p in expired:
+                p.unlink(missing_ok=True)
+
+    def _delete_segments(self, names: set) -> None:
+        """Drop index references to `names` and rewrite the index file without them."""
+        with self._lock:
+            for trace_id in list(self._index):
+                spans = [s for s in self._index[trace_id] if s[0] not in names]
+                if spans:
+                    self._index[trace_id] = spans
+                else:
+                    del self._index[trace_id]
+            records = [{"trace_id": t, "file": f, "spans": [[o, n]]}
+                       for t, spans in self._index.items() for f, o, n in spans]
+        tmp = self.path / (INDEX_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path / INDEX_FILE)
+        self.counters["segments_deleted"] += len(names)
+
+    def flush(self) -> int:
+        """Write every queued entry (writer thread, or directly in tests / on shutdown)."""
+        written = 0
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            try:
+                self._write_batch(batch)
+                written += len(batch)
+            except OSError as e:
+                self.counters["write_errors"] += 1
+                self.counters["dropped"] += len(batch)
+                print(f"[trace_export] write failed: {e}")
+        return written
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._segment is None or self._segment_size >= self.max_file_bytes:
+            self._next_segment()
+        spans: Dict[str, List[Tuple[int, int]]] = {}
+        chunks = []
+        offset = self._segment_size
+        for entry in batch:
+            line = (json.dumps(entry, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+            spans.setdefault(entry.get("trace_id") or "", []).append((offset, len(line)))
+            chunks.append(line)
+            offset += len(line)
+        with open(self._segment, "ab") as f:
+            f.write(b"".join(chunks))
+        name = self._segment.name
+        with open(self.path / INDEX_FILE, "a", encoding="utf-8") as f:
+            for trace_id, s in spans.items():
+                f.write(json.dumps({"trace_id": trace_id, "file": name, "spans": s}, separators=(",", ":")) + "\n")
+        with self._lock:
+            for trace_id, s in spans.items():
+                self._index.setdefault(trace_id, []).extend((name, o, n) for o, n in s)
+        self._segment_size = offset
+        self.counters["exported"] += len(batch)
+        self.counters["batches"] += 1
+
+    # -- read side ------------------------------------------------------------------
+    def read(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Exported entries of one trace, oldest first (seeks via the index, no scan)."""
+        with self._lock:
+            spans = list(self._index.get(trace_id, ()))
+        out: List[Dict[str, Any]] = []
+        handles: Dict[str, Any] = {}
+        try:
+            for name, offset, length in spans:
+                f = handles.get(name)
+                if f is None:
+                    try:
+                        f = handles[name] = open(self.path / name, "rb")
+                    except FileNotFoundError:
+                        continue        # rotated away since the index was read
+                f.seek(offset)
+                out.append(json.loads(f.read(length)))
+        finally:
+            for f in handles.values():
+                f.close()
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            traces = len(self._index)
+        return {"running": self.running, "queued": len(self._queue), "queue_size": self.queue_size,
+                "traces_indexed": traces, "segment": self._segment.name if self._segment else None,
+                "segments": len(self._segments()) if self.path.exists() else 0, **self.counters}
+
+
+EXPORTER = TraceExporter()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Recall vs. latency (and vector RAM) for vector index configurations.
+
+Behavior:
+- Vectors come from the local index (`VECTOR_INDEX_PATH`, i.e. the seeded corpus)
+  or, with `--synthetic N`, from N random unit vectors (clustered, so ANN is
+  not trivially exact). Queries are perturbed copies of sampled vectors.
+- Ground truth is exact brute-force cosine top-k.
+- The local IVF index is swept over `nprobe`.
+- With `--qdrant`, each collection configuration (plain, scalar / product
+  quantization, on_disk) is built in a throwaway collection, swept over
+  `hnsw_ef` and dropped again.
+
+Reported per row: recall@k, p50/p95 single-query latency in ms, and the
+estimated bytes of vector data kept in RAM.
+
+Example:
+    python bench_vector.py --synthetic 50000 --dim 384 --qdrant
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+
+from app.config import settings
+from app.tools.ann_index import IVFFlatIndex
+from app.tools.embeddings import normalize
+
+QDRANT_CONFIGS = {
+    "plain": {"on_disk": False, "quantization": "none"},
+    "scalar": {"on_disk": False, "quantization": "scalar"},
+    "product": {"on_disk": False, "quantization": "product"},
+    "on_disk": {"on_disk": True, "quantization": "none"},
+    "on_disk+scalar": {"on_disk": True, "quantization": "scalar"},
+}
+
+
+def load_vectors(args) -> np.ndarray:
+    if not args.synthetic:
+        try:
+            return np.asarray(IVFFlatIndex.load(settings.vector_index_path).vectors_by_position())
+        except FileNotFoundError:
+            print(f"No index at {settings.vector_index_path}; using --synthetic 20000")
+            args.synthetic = 20000
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, args.synthetic // 200), args.dim))
+    labels = rng.integers(0, len(centers), size=args.synthetic)
+    return normalize((centers[labels] + 0.6 * rng.normal(size=(args.synthetic, args.dim))).astype(np.float32))
+
+
+def make_queries(vectors: np.ndarray, n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    base = vectors[rng.integers(0, len(vectors), size=n)]
+    return normalize(base + 0.3 * rng.normal(size=base.shape).astype(np.float32) / np.sqrt(vectors.shape[1]))
+
+
+def exact_topk(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    out = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(0, len(queries), 256):
+        scores = queries[i:i + 256] @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        out[i:i + 256] = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, 1), axis=1), 1)
+    return out
+
+
+def summarize(name: str, found, truth: np.ndarray, latencies, ram_bytes: int) -> dict:
+    k = truth.shape[1]
+    recall = np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)])
+    lat = np.asarray(latencies) * 1000.0
+    return {"config": name, "recall": recall, "p50_ms": np.percentile(lat, 50),
+            "p95_ms": np.percentile(lat, 95), "ram_mib": ram_bytes / 2 ** 20}
+
+
+def bench_local(vectors, queries, truth, k: int, nprobes) -> list:
+    index = IVFFlatIndex.build(vectors, [{} for _ in range(len(vectors))], "bench")
+    rows = []
+    for nprobe in nprobes:
+        if nprobe > len(index.centroids):
+            continue
+        found, latencies = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits = index.search(q, k=k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - t0)
+            found.append([pos for _, pos in hits])
+        rows.append(summarize(f"local ivf nprobe={nprobe}", found, truth, latencies,
+                              index.vectors.nbytes + index.centroids.nbytes))
+    return rows
+
+
+def qdrant_ram_bytes(n: int, dim: int, cfg: dict) -> int:
+    """Vector bytes Qdrant keeps in RAM (quantized copies are always_ram; originals unless on_disk)."""
+    original = 0 if cfg["on_disk"] else n * dim * 4
+    quantized = {"none": 0, "scalar": n * dim, "product": n * dim * 4 // 16}[cfg["quantization"]]
+    return original + quantized
+
+
+def bench_qdrant(vectors, queries, truth, k: int, efs, names) -> list:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as m
+    from app.tools.qdrant_store import create_collection
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL", settings.qdrant_url),
+                          prefer_grpc=settings.qdrant_prefer_grpc, grpc_port=settings.qdrant_grpc_port)
+    rows = []
+    for name in names:
+        cfg = dict(QDRANT_CONFIGS[name], hnsw_m=settings.qdrant_hnsw_m,
+                   hnsw_ef_construct=settings.qdrant_hnsw_ef_construct)
+        collection = f"bench_{uuid.uuid4().hex[:8]}"
+        create_collection(client, collection, vectors.shape[1], cfg)
+        try:
+            for i in range(0, len(vectors), 512):
+                client.upsert(collection_name=collection, points=m.Batch(
+                    ids=list(range(i, min(i + 512, len(vectors)))), vectors=vectors[i:i + 512].tolist()))
+            while client.get_collection(collection).status != m.CollectionStatus.GREEN:
+                time.sleep(0.5)
+            for ef in efs:
+                quant = (m.QuantizationSearchParams(rescore=True, oversampling=settings.qdrant_search_oversampling)
+                         if cfg["quantization"] != "none" else None)
+                params = m.SearchParams(hnsw_ef=ef, quantization=quant)
+                found, latencies = [], []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    hits = client.search(collection_name=collection, query_vector=q.tolist(), limit=k,
+                                         search_params=params, with_payload=False)
+                    latencies.append(time.perf_counter() - t0)
+                    found.append([int(h.id) for h in hits])
+                rows.append(summarize(f"qdrant {name} ef={ef}", found, truth, latencies,
+                                      qdrant_ram_bytes(len(vectors), vectors.shape[1], cfg)))
+        finally:
+            client.delete_collection(collection)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--synthetic", type=int, default=0, help="random vectors instead of the local index")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--qdrant", action="store_true", help="also benchmark Qdrant collection configs")
+    parser.add_argument("--configs", nargs="+", default=list(QDRANT_CONFIGS), choices=list(QDRANT_CONFIGS))
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 64, 128])
+    args = parser.parse_args(argv)
+
+    vectors = load_vectors(args)
+    k = min(args.k, len(vectors))
+    queries = make_queries(vectors, args.queries, args.seed)
+    truth = exact_topk(vectors, queries, k)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{k}")
+    rows = bench_local(vectors, queries, truth, k, args.nprobe)
+    if args.qdrant:
+        rows += bench_qdrant(vectors, queries, truth, k, args.ef, args.configs)
+    print(f"{'config':<32} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'RAM MiB':>9}")
+    for r in rows:
+        print(f"{r['config']:<32} {r['recall']:>7.3f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['ram_mib']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
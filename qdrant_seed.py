@@ -3,107 +3,62 @@
 Seed Qdrant with documents.
 
 Behavior:
-- If sentence-transformers is installed and importable, use it for embeddings (preferred).
-- Otherwise fall back to TF-IDF (scikit-learn) to produce dense vectors (approximate semantic).
-This avoids hard dependency failures when sentence-transformers / huggingface_hub have version issues.
+- Documents are embedded with `app.tools.embeddings` (sentence-transformers when
+  installed, else the hashing embedder), i.e. the same encoder used at query time.
+  Vectors are cached on disk by content hash per model (`EMBEDDING_CACHE_PATH`).
+- The same vectors also build the in-process IVF index (`VECTOR_INDEX_PATH`)
+  that serves knowledge lookups when Qdrant is disabled or unhealthy.
+- Lexical matching uses BM25 sparse vectors (hashed term ids -> weights): uploaded
+  to Qdrant as the named sparse vector `bm25`, and kept locally as an inverted
+  index (`SPARSE_INDEX_PATH`). Nothing is densified to vocabulary size.
+- Indexing is incremental (`app/tools/indexer.py`): only docs whose content hash
+  changed are embedded and upserted, removed docs are deleted, and full rebuilds
+  go to a new collection published by swapping the `QDRANT_COLLECTION` alias.
+- Docs are streamed as overlapping, token-bounded chunks, embedded in batches on
+  a worker pool and upserted with bounded in-flight requests; the run reports
+  docs/sec and chunks/sec.
 """
-import os
-from pathlib import Path
+import argparse
 import json
-import sys
-import time
-
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-COLLECTION = os.getenv("QDRANT_COLLECTION", "agent_docs")
-DOC_DIR = Path(__file__).resolve().parent.parent / "seed_data" / "docs"
+import os
 
-# Attempt semantic path
-USE_ST = False
-try:
-    from sentence_transformers import SentenceTransformer
-    USE_ST = True
-except Exception as e:
-    USE_ST = False
+from app.config import settings
+from app.tools.corpus import doc_dir
+from app.tools.indexer import reindex
 
-# TF-IDF fallback
-from sklearn.feature_extraction.text import TfidfVectorizer
+QDRANT_URL = os.getenv("QDRANT_URL", settings.qdrant_url)
+DOC_DIR = doc_dir()
 
-# Qdrant client
+# Qdrant client (optional: without it only the local indexes are built)
 try:
     from qdrant_client import QdrantClient
-    from qdrant_client.http.models import VectorParams, Distance
 except Exception as e:
-    print("ERROR: qdrant-client is not installed or cannot be imported:", e)
-    print("Install: pip install qdrant-client")
-    sys.exit(1)
+    QdrantClient = None
+    _QDRANT_IMPORT_ERROR = e
 
-def load_docs():
-    docs = []
-    titles = []
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--force", action="store_true", help="re-embed everything into a fresh collection")
+    args = parser.parse_args(argv)
     if not DOC_DIR.exists():
         print("No docs directory found at:", DOC_DIR)
-        return docs, titles
-    for p in sorted(DOC_DIR.glob("*.md")):
-        text = p.read_text(encoding="utf-8")
-        docs.append(text)
-        titles.append(p.name)
-    return docs, titles
-
-def create_or_replace_collection(client, dim):
-    cols = [c.name for c in client.get_collections().collections]
-    if COLLECTION in cols:
-        print(f"Recreating collection '{COLLECTION}' with dim={dim}")
-        client.recreate_collection(collection_name=COLLECTION, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
-    else:
-        print(f"Creating collection '{COLLECTION}' with dim={dim}")
-        client.recreate_collection(collection_name=COLLECTION, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
-
-def seed_with_st(client, docs, titles):
-    print("Seeding using sentence-transformers (semantic embeddings).")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    vectors = model.encode(docs, show_progress_bar=True)
-    dim = len(vectors[0])
-    create_or_replace_collection(client, dim)
-    points = []
-    for i, (v, t, txt) in enumerate(zip(vectors, titles, docs)):
-        points.append({"id": i, "vector": v.tolist() if hasattr(v, "tolist") else list(v), "payload": {"title": t, "text": txt}})
-    client.upsert(collection_name=COLLECTION, points=points)
-    print(f"Seeded {len(points)} points using sentence-transformers.")
-
-def seed_with_tfidf(client, docs, titles):
-    print("sentence-transformers not available — falling back to TF-IDF dense vectors.")
-    tf = TfidfVectorizer()
-    X = tf.fit_transform(docs)  # sparse
-    arr = X.toarray()
-    dim = arr.shape[1]
-    create_or_replace_collection(client, dim)
-    points = []
-    for i, (v, t, txt) in enumerate(zip(arr, titles, docs)):
-        points.append({"id": i, "vector": v.tolist(), "payload": {"title": t, "text": txt}})
-    client.upsert(collection_name=COLLECTION, points=points)
-    print(f"Seeded {len(points)} points using TF-IDF (dim={dim}).")
-
-def main():
-    docs, titles = load_docs()
-    if not docs:
-        print("No documents to seed. Please add .md files to seed_data/docs/")
-        return
-    client = QdrantClient(url=QDRANT_URL)
-    # quick connectivity check
-    try:
-        client.get_collections()
-    except Exception as e:
-        print("Could not connect to Qdrant at", QDRANT_URL, ":", e)
-        print("Start Qdrant with Docker (example): docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant")
         return
-    if USE_ST:
+    client = None
+    if QdrantClient is None:
+        print("qdrant-client is not installed or cannot be imported:", _QDRANT_IMPORT_ERROR)
+        print("Install: pip install qdrant-client  (building local indexes only)")
+    else:
+        client = QdrantClient(url=QDRANT_URL)
+        # quick connectivity check
         try:
-            seed_with_st(client, docs, titles)
-            return
+            client.get_collections()
         except Exception as e:
-            print("sentence-transformers seeding failed; falling back to TF-IDF. Error:", e)
-    # fallback
-    seed_with_tfidf(client, docs, titles)
+            print("Could not connect to Qdrant at", QDRANT_URL, ":", e)
+            print("Start Qdrant with Docker (example): docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant")
+            print("Building local indexes only.")
+            client = None
+    stats = reindex(DOC_DIR, client=client, force=args.force)
+    print(f"Indexed {DOC_DIR}: {json.dumps(stats)}")
 
 if __name__ == "__main__":
     main()
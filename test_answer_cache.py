@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.answer_cache import AnswerCache, make_key
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_answer_cache_ttl_and_stale_while_revalidate():
+    clock = _Clock()
+    pool = ThreadPoolExecutor(max_workers=1)
+    cache = AnswerCache({'metrics_lookup': 10.0}, stale_seconds=5.0, clock=clock, executor=pool)
+    calls = []
+
+    def compute():
+        calls.append(clock.now)
+        return {'answer': f'p95 #{len(calls)}', 'status': 'done'}
+
+    ents = {'service': 'Payments', 'window': '5m'}
+    first = cache.get_or_compute('metrics_lookup', ents, None, compute)
+    assert first['answer'] == 'p95 #1' and not first.get('cached')
+
+    clock.now = 3.0
+    hit = cache.get_or_compute('metrics_lookup', {'window': '5m', 'service': 'payments'}, None, compute)
+    assert hit['cached'] is True and hit['answer'] == 'p95 #1'
+    assert len(calls) == 1
+
+    # Expired but within the stale window: serve stale, refresh in background
+    clock.now = 12.0
+    stale = cache.get_or_compute('metrics_lookup', ents, None, compute)
+    assert stale['answer'] == 'p95 #1' and stale['cached'] is True
+    pool.shutdown(wait=True)
+    assert len(calls) == 2
+    assert cache.get_or_compute('metrics_lookup', ents, None, compute)['answer'] == 'p95 #2'
+
+
+def test_answer_cache_skips_clarify_and_uncached_intents():
+    cache = AnswerCache({'metrics_lookup': 10.0})
+    calls = []
+
+    def clarify():
+        calls.append(1)
+        return {'answer': 'Which service?', 'status': 'clarify'}
+
+    cache.get_or_compute('metrics_lookup', {}, None, clarify)
+    cache.get_or_compute('metrics_lookup', {}, None, clarify)
+    cache.get_or_compute('unknown', {}, None, clarify)
+    assert len(calls) == 3
+
+
+def test_make_key_includes_query_for_knowledge():
+    a = make_key('knowledge_lookup', {}, 'How to configure SAML?')
+    b = make_key('knowledge_lookup', {}, 'how to  configure saml?')
+    c = make_key('knowledge_lookup', {}, 'how to rotate keys?')
+    assert a == b and a != c
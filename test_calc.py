@@ -0,0 +1,26 @@
+import math
+
+import numpy as np
+
+from app.tools.util_tool import calc, calc_batch
+
+
+def test_calc_batch_vector_ops_and_aggregations():
+    p95 = np.array([250.0, 180.0, 90.0])
+    base = np.array([200.0, 200.0, 0.0])
+    assert calc_batch(p95, base, "-").tolist() == [50.0, -20.0, 90.0]
+    assert calc_batch(p95, base, "pct_change")[:2].tolist() == [25.0, -10.0]
+    assert math.isinf(calc_batch(p95, base, "ratio")[2])
+    assert calc_batch(p95, 200, ">").tolist() == [True, False, False]
+    assert calc_batch(p95, op="mean") == 520.0 / 3
+    assert calc_batch([1, 2, 3, 4], op="percentile", q=50) == 2.5
+
+
+def test_scalar_calc_wraps_batch():
+    assert calc(2, 3, "^") == 8.0
+    assert calc(4, 0, "/") == float("inf")
+    assert math.isnan(calc(-1, 0, "sqrt"))
+    assert math.isnan(calc(0, 10, "log")) and math.isnan(calc(5, 1, "log"))
+    assert calc(100, 10, "log") == 2.0
+    assert np.isnan(calc_batch([0.0, -1.0], 10, "log")).all()
+    assert math.isnan(calc(1, 2, "%"))
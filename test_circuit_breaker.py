@@ -0,0 +1,78 @@
+from app.circuit_breaker import CircuitBreaker, RetryBudget, CLOSED, OPEN, HALF_OPEN
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_half_opens_and_closes():
+    clock = _Clock()
+    br = CircuitBreaker('metrics_tool', failure_threshold=2, reset_timeout=10.0, clock=clock)
+    assert br.allow()
+    br.record_failure()
+    assert br.state == CLOSED
+    br.record_failure()
+    assert br.state == OPEN
+    assert not br.allow()
+
+    clock.now = 10.5
+    assert br.allow()           # single half-open probe
+    assert br.state == HALF_OPEN
+    assert not br.allow()       # further calls rejected while probing
+    br.record_success()
+    assert br.state == CLOSED and br.allow()
+
+
+def test_half_open_failure_reopens():
+    clock = _Clock()
+    br = CircuitBreaker('vector_tool', failure_threshold=1, reset_timeout=5.0, clock=clock)
+    br.record_failure()
+    clock.now = 6.0
+    assert br.allow()
+    br.record_failure()
+    assert br.state == OPEN and br.snapshot()['total_opens'] == 2
+
+
+def test_retry_budget_caps_retries():
+    clock = _Clock()
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0, capacity=2.0, clock=clock)
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_acquire()
+    assert budget.snapshot()['exhausted'] == 1
+
+
+def test_cancelled_half_open_probe_releases_its_slot(monkeypatch):
+    import asyncio
+
+    import httpx
+    import pytest
+
+    from app import tool_broker
+    from app.circuit_breaker import get_breaker
+    from app.tools.registry import ToolMeta
+
+    meta = ToolMeta(key='cancel_probe_tool', name='cancel_probe_tool', capabilities=[], retries=0,
+                    failure_threshold=1, reset_timeout_seconds=0.0)
+    breaker = get_breaker(meta)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    async def hang(self, *args, **kwargs):
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(httpx.AsyncClient, 'request', hang)
+
+    async def probe():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(tool_broker.execute_http_tool_async('http://probe.invalid/x', None, meta), 0.05)
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()              # the cancelled probe gave its slot back
+
+    asyncio.run(probe())
@@ -0,0 +1,64 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.tools.docs_index import DocsSearchIndex
+
+
+def _write(docs_dir, name, text, bump=0):
+    p = docs_dir / name
+    p.write_text(text, encoding='utf-8')
+    if bump:
+        st = p.stat()
+        os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + bump))
+
+
+def test_bm25_search_paginates_and_updates_incrementally(tmp_path):
+    docs_dir = tmp_path / 'docs'
+    docs_dir.mkdir()
+    _write(docs_dir, 'saml.md', 'SAML setup: identity provider metadata and SSO for the dashboard.')
+    _write(docs_dir, 'oncall.md', 'On-call handbook: paging, escalation, dashboard links.')
+    for i in range(5):
+        _write(docs_dir, f'note{i}.md', f'Release note {i} mentions the dashboard once.')
+    index = DocsSearchIndex(docs_dir)
+    assert index.refresh() == {'added': 7, 'updated': 0, 'removed': 0, 'docs': 7}
+
+    res = index.search('saml sso')
+    assert res['total'] == 1 and res['items'][0]['title'] == 'saml.md'
+    assert res['items'][0]['snippet'].startswith('SAML setup')
+
+    page1 = index.search('dashboard', limit=3)
+    page2 = index.search('dashboard', limit=3, offset=3)
+    page3 = index.search('dashboard', limit=3, offset=6)
+    assert page1['total'] == 7 and page1['next_offset'] == 3 and page3['next_offset'] is None
+    ids = [h['id'] for p in (page1, page2, page3) for h in p['items']]
+    assert len(ids) == len(set(ids)) == 7
+    scores = [h['score'] for p in (page1, page2, page3) for h in p['items']]
+    assert scores == sorted(scores, reverse=True)
+
+    _write(docs_dir, 'saml.md', 'Okta rotation checklist.', bump=10**9)
+    (docs_dir / 'note0.md').unlink()
+    _write(docs_dir, 'kafka.md', 'Kafka consumer lag runbook.')
+    assert index.refresh() == {'added': 1, 'updated': 1, 'removed': 1, 'docs': 7}
+    assert index.search('saml')['total'] == 0
+    assert index.search('okta')['items'][0]['id'] == 'saml.md'
+    assert index.search('kafka lag')['items'][0]['id'] == 'kafka.md'
+    assert 'note0.md' not in index.postings.get('release', {})
+
+
+def test_docs_service_search_endpoint(tmp_path, monkeypatch):
+    from app.tools import docs_mock
+
+    docs_dir = tmp_path / 'docs'
+    docs_dir.mkdir()
+    _write(docs_dir, 'payments_runbook.md', 'Payments rollback steps and latency alerts.')
+    monkeypatch.setattr(docs_mock, 'INDEX', DocsSearchIndex(docs_dir))
+    monkeypatch.setattr(settings, 'docs_index_refresh_seconds', 0.0)
+    with TestClient(docs_mock.app) as client:
+        body = client.get('/search', params={'q': 'payments rollback'}).json()
+        assert body['items'][0]['title'] == 'payments_runbook.md'
+        assert client.get('/search', params={'q': 'kubernetes'}).json()['items'] == []
+        assert client.get('/docs/payments_runbook.md').json()['text'].startswith('Payments rollback')
+        assert client.get('/docs/123').json()['title'] == 'Invoice 123'
+        assert client.get('/search').status_code == 422
@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import json
+
+from app.tools.metrics_ingest import IngestPipeline, NDJSONParser, ingest_stream
+from app.tools.metrics_store import MetricsStore
+
+
+def _ndjson(n, service='payments'):
+    return b''.join(json.dumps({'service': service, 'latency_ms': 100 + i % 50, 'ts': 1000.0 + i % 30}).encode() + b'\n'
+                    for i in range(n))
+
+
+async def _chunks(data, size=37):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_parser_handles_split_gzip_chunks():
+    body = _ndjson(200) + b'not json\n'
+    parser = NDJSONParser(gzipped=True)
+    packed = gzip.compress(body)
+    rows = []
+    for i in range(0, len(packed), 11):
+        rows.extend(parser.feed(packed[i:i + 11]))
+    rows.extend(parser.close())
+    assert len(rows) == 200 and parser.bad_lines == 1
+
+
+def test_ingest_stream_aggregates_into_store():
+    store = MetricsStore(tiers=[(60, 10)], clock=lambda: 1020.0)
+
+    async def run():
+        pipe = IngestPipeline(store, max_batches=4, batch_rows=64)
+        pipe.start()
+        res = await ingest_stream(pipe, _chunks(_ndjson(500) + b'{"service": "x"}\n'))
+        await pipe.stop()
+        return res, pipe.stats()
+
+    res, stats = asyncio.run(run())
+    assert res['accepted'] == 500 and res['rejected'] == 1 and not res['backpressure']
+    assert res['lines_consumed'] == 501
+    assert stats['rows_aggregated'] == 500
+    assert store.query('payments', 300, now=1020.0)['request_count'] == 500
+
+
+def test_ingest_stream_signals_backpressure():
+    store = MetricsStore()
+
+    async def run():
+        pipe = IngestPipeline(store, max_batches=1, batch_rows=10)   # no aggregator running
+        return await ingest_stream(pipe, _chunks(_ndjson(100)), put_timeout=0.01)
+
+    res = asyncio.run(run())
+    assert res['backpressure'] and res['accepted'] == 10 and res['lines_consumed'] == 10
+
+
+def test_lines_consumed_counts_blank_lines_and_string_booleans_parse():
+    store = MetricsStore(tiers=[(60, 10)], clock=lambda: 1020.0)
+    rows = [{'service': 'svc', 'latency_ms': 100, 'ts': 1000.0, 'error': e}
+            for e in ('false', 'true', 'FALSE', 0, True, 'maybe')]
+    body = b'\n'.join(json.dumps(r).encode() + b'\n' for r in rows)       # a blank line between rows
+
+    async def run():
+        pipe = IngestPipeline(store, max_batches=4, batch_rows=2)
+        pipe.start()
+        res = await ingest_stream(pipe, _chunks(body, size=16))
+        await pipe.stop()
+        return res
+
+    res = asyncio.run(run())
+    assert res['lines_consumed'] == 11
+    assert res['accepted'] == 5 and res['rejected'] == 1
+    assert store.query('svc', 300, now=1020.0)['error_rate'] == 40.0
+
+
+def test_non_finite_or_negative_latencies_are_rejected_not_fatal():
+    store = MetricsStore(tiers=[(60, 10)], clock=lambda: 1020.0)
+    body = (_ndjson(3) + b'{"service": "payments", "latency_ms": NaN, "ts": 1000.0}\n'
+            + b'{"service": "payments", "latency_ms": -5, "ts": 1000.0}\n'
+            + b'{"service": "payments", "latency_ms": 10, "ts": Infinity}\n' + _ndjson(3))
+
+    async def run():
+        pipe = IngestPipeline(store, max_batches=4, batch_rows=64)
+        pipe.start()
+        res = await ingest_stream(pipe, _chunks(body))
+        await pipe.stop()
+        return res, pipe.stats()
+
+    res, stats = asyncio.run(run())
+    assert res['accepted'] == 6 and res['rejected'] == 3
+    assert stats['rows_aggregated'] == 6 and stats['rows_rejected'] == 3
+    assert store.query('payments', 300, now=1020.0)['request_count'] == 6
+
+
+def test_single_sample_post_validates_like_bulk_ingest(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.tools import metrics_mock
+
+    store = MetricsStore(tiers=[(60, 10)])
+    monkeypatch.setattr(metrics_mock, 'STORE', store)
+    samples = [{'service': 'svc', 'latency_ms': 100, 'error': 'false'},
+               {'service': 'svc', 'latency_ms': 120, 'error': 'true'},
+               {'service': 'svc', 'latency_ms': 'slow'},
+               {'service': 'svc'}, 'junk']
+    body = json.dumps({'samples': samples + [{'service': 'svc', 'latency_ms': float('nan')}]})
+    res = TestClient(metrics_mock.app).post('/metrics', content=body, headers={'content-type': 'application/json'})
+    assert res.status_code == 200 and res.json() == {'status': 'received', 'recorded': 2, 'rejected': 4}
+    assert store.query('svc', 300)['error_rate'] == 50.0
@@ -0,0 +1,82 @@
+import numpy as np
+from app.tools.metrics_store import MetricsStore, SketchLayout, query_result
+from app.schemas import MetricsQuery
+
+
+def test_window_quantiles_merge_buckets():
+    now = 1_000_000.0
+    store = MetricsStore(tiers=[(60, 120)], clock=lambda: now)
+    rng = np.random.default_rng(7)
+    # Older traffic is slow, the last 5 minutes are fast
+    old = rng.uniform(900, 1000, 5000)
+    recent = rng.uniform(90, 110, 5000)
+    store.record_many('payments', old, timestamps=now - rng.uniform(600, 3000, old.size))
+    store.record_many('payments', recent, errors=np.arange(recent.size) % 50 == 0,
+                      timestamps=now - rng.uniform(0, 290, recent.size))
+
+    last5 = store.query('payments', 300, now=now)
+    assert abs(last5['p95_latency'] - np.percentile(recent, 95)) / np.percentile(recent, 95) < 0.03
+    assert last5['request_count'] == 5000
+    assert abs(last5['error_rate'] - 2.0) < 1e-6
+
+    hour = store.query('payments', 3600, now=now)
+    assert hour['request_count'] == 10000
+    assert hour['p95_latency'] > 900
+    assert store.query('orders', 300, now=now) is None
+
+
+def test_ring_is_bounded_and_drops_expired_samples():
+    now = 10_000.0
+    store = MetricsStore(tiers=[(10, 6)], clock=lambda: now)
+    store.record_many('svc', [100.0] * 3, timestamps=[now - 500] * 3)   # beyond retention after newer data
+    store.record_many('svc', [50.0] * 4, timestamps=[now - 5] * 4)
+    size = store.memory_bytes()
+    store.record_many('svc', [50.0] * 1000, timestamps=np.linspace(now - 45, now, 1000))
+    assert store.memory_bytes() == size
+    assert store.query('svc', 60, now=now)['request_count'] == 1004
+
+
+def test_query_result_uses_shared_schema():
+    now = 5_000.0
+    store = MetricsStore(clock=lambda: now, layout=SketchLayout(0.01))
+    store.record_many('orders', [200.0] * 10)
+    res = query_result(store, MetricsQuery(service='orders', window='5m', metric='p95_latency'))
+    assert res.success and abs(res.data.p95_latency - 200.0) <= 4.0
+    assert res.data.p99_latency is None
+
+
+def test_planner_uses_coarsest_tier_and_rollups_match_raw():
+    now = 86400.0 * 100 + 7 * 3600 + 17 * 60 + 30     # not aligned to any tier
+    store = MetricsStore(clock=lambda: now)
+    plan = store.plan(7 * 86400, now)
+    tiers_used = [store.tiers[t][0] for t, _, _ in plan]
+    assert 86400 in tiers_used
+    # Interior served by few coarse buckets; only edges come from finer tiers
+    assert sum(last - first + 1 for _, first, last in plan) < 200
+    # Plan covers the window contiguously without overlap
+    spans = sorted((first * store.tiers[t][0], (last + 1) * store.tiers[t][0]) for t, first, last in plan)
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+
+    rng = np.random.default_rng(3)
+    ts = now - rng.uniform(0, 6 * 3600, 20000)
+    lat = rng.lognormal(5, 0.5, ts.size)
+    store.record_many('payments', lat, timestamps=ts)
+    flat = MetricsStore(tiers=[(60, 1440)], clock=lambda: now)
+    flat.record_many('payments', lat, timestamps=ts)
+    for window in (300, 3600, 6 * 3600):
+        assert store.query('payments', window) == flat.query('payments', window)
+
+
+def test_planner_never_sends_edges_past_a_tier_retention():
+    t0 = 300 * 100_000
+    now = t0 + 3 * 3600 + 150                           # window start is 2 minutes into a 5m bucket
+    store = MetricsStore(tiers=[(60, 60), (300, 288)], clock=lambda: now)   # 1m kept for 1h only
+    store.record_many('svc', [100.0] * 260, timestamps=[t0 + 60 * k + 1 for k in range(-60, 200)])
+
+    plan = store.plan(3 * 3600, now)
+    for t, first, _ in plan:
+        res, n = store.tiers[t]
+        assert first >= now // res - n + 1
+    # The 3 minutes older than the 1m tier's retention come from their whole 5m bucket
+    assert plan[0][:2] == (1, t0 // 300)
+    assert store.query('svc', 3 * 3600)['request_count'] == 183
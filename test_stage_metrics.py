@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+from app import stage_metrics as sm
+
+
+def _count(hist, stage, name, intent='unknown', status='ok'):
+    series = hist.get((stage, name, intent, status))
+    return 0 if series is None else sum(series[:-1])
+
+
+def test_per_thread_shards_merge_into_prometheus_text():
+    sm.reset()
+
+    def work():
+        for _ in range(100):
+            sm.observe('tool', 'util_sql', 0.003)
+        sm.inc(sm.QUERIES, intent='calc_compare', status='done')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sm.observe('tool', 'util_sql', 99.0, status='error')
+
+    hist, counters = sm.collect()
+    assert _count(hist, 'tool', 'util_sql') == 400
+    text = sm.render_prometheus()
+    base = 'stage="tool",name="util_sql",intent="unknown",status="ok"'
+    assert f'agent_stage_duration_seconds_bucket{{{base},le="0.0025"}} 0' in text
+    assert f'agent_stage_duration_seconds_bucket{{{base},le="0.005"}} 400' in text
+    assert f'agent_stage_duration_seconds_count{{{base}}} 400' in text
+    err = 'stage="tool",name="util_sql",intent="unknown",status="error"'
+    assert f'agent_stage_duration_seconds_bucket{{{err},le="30.0"}} 0' in text
+    assert f'agent_stage_duration_seconds_bucket{{{err},le="+Inf"}} 1' in text
+    assert 'agent_queries_total{intent="calc_compare",status="done"} 4' in text
+
+
+def test_timed_labels_intent_and_status():
+    sm.reset()
+
+    @sm.timed('tool', 'metrics_tool', status_of=lambda ok: 'ok' if ok else 'error')
+    async def tool(ok):
+        return ok
+
+    @sm.timed('node', 'act')
+    def node():
+        raise ValueError('boom')
+
+    with sm.intent_scope():
+        sm.set_intent('metrics_lookup')
+        asyncio.run(tool(True))
+        asyncio.run(tool(False))
+        try:
+            node()
+        except ValueError:
+            pass
+        with sm.timed('http', 'metrics_tool') as t:
+            t.status = 'circuit_open'
+    assert sm.current_intent() == 'unknown'
+
+    hist, _ = sm.collect()
+    assert _count(hist, 'tool', 'metrics_tool', 'metrics_lookup', 'ok') == 1
+    assert _count(hist, 'tool', 'metrics_tool', 'metrics_lookup', 'error') == 1
+    assert _count(hist, 'node', 'act', 'metrics_lookup', 'error') == 1
+    assert _count(hist, 'http', 'metrics_tool', 'metrics_lookup', 'circuit_open') == 1
+
+
+def test_otel_spans_nest_under_stages(monkeypatch, tmp_path):
+    import pytest
+    pytest.importorskip('opentelemetry.sdk')
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from app import otel
+    from app.config import settings
+
+    monkeypatch.setattr(settings, 'enable_otel', True)
+    monkeypatch.setattr(settings, 'otel_file_path', str(tmp_path / 'spans.jsonl'))
+    exporter = InMemorySpanExporter()
+    assert otel.setup_tracing(exporter)
+    try:
+        @sm.timed('tool', 'util_sql', status_of=lambda rows: 'error' if not rows else 'ok')
+        def sql():
+            otel.set_attributes({'db.rows': 0})
+            return []
+
+        with sm.intent_scope(), sm.timed('request', 'query'):
+            sm.set_intent('calc_compare')
+            sql()
+    finally:
+        otel.shutdown_tracing()
+
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    tool, request = spans['tool.util_sql'], spans['request.query']
+    assert tool.parent.span_id == request.context.span_id
+    assert tool.attributes['tool.retries'] == 0 and tool.attributes['db.rows'] == 0
+    assert tool.attributes['agent.intent'] == 'calc_compare'
+    assert tool.attributes['agent.status'] == 'error' and not tool.status.is_ok
+    assert sm._span_hook is None
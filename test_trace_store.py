@@ -0,0 +1,110 @@
+from app.trace import TraceStore
+
+
+def _record(store, trace_id, payload='x', event='tool'):
+    store.record(event, 'tool', 'test', {'q': payload}, {'out': payload}, 0.5, None, None, trace_id)
+
+
+def test_ring_buffer_caps_entries_and_bytes():
+    store = TraceStore(max_entries=5, max_bytes=10_000, ttl_seconds=3600, max_field_bytes=512)
+    for i in range(12):
+        _record(store, f't{i % 3}', payload=str(i))
+    stats = store.stats()
+    assert stats['entries'] == 5 and stats['evicted_capacity'] == 7
+    kept = [e['inputs']['q'] for t in ('t0', 't1', 't2') for e in store.get(t)]
+    assert sorted(kept, key=int) == ['7', '8', '9', '10', '11']
+
+    small = TraceStore(max_entries=100, max_bytes=1_500, ttl_seconds=3600, max_field_bytes=512)
+    for i in range(20):
+        _record(small, 'big', payload='y' * 300)
+    assert small.stats()['bytes'] <= 1_500 and small.stats()['evicted_bytes'] > 0
+
+
+def test_large_fields_are_hashed_and_idle_traces_expire(monkeypatch):
+    import app.trace as trace_mod
+
+    store = TraceStore(max_entries=100, max_bytes=1_000_000, ttl_seconds=60, max_field_bytes=64)
+    now = [1000.0]
+    monkeypatch.setattr(trace_mod.time, 'time', lambda: now[0])
+    _record(store, 'old', payload='z' * 1000)
+    entry = store.get('old')[0]
+    assert entry['inputs']['_truncated'] and len(entry['inputs']['sha256']) == 64
+    assert len(entry['inputs']['preview']) == 64 and store.stats()['fields_truncated'] == 2
+
+    now[0] += 30
+    _record(store, 'fresh')
+    now[0] += 45
+    assert store.get('old') == [] and len(store.get('fresh')) == 1
+    stats = store.stats()
+    assert stats['traces_expired'] == 1 and stats['evicted_ttl'] == 1 and stats['entries'] == 1
+
+    store.clear('fresh')
+    assert store.stats()['entries'] == 0 and store.stats()['bytes'] == 0
+
+
+def test_bound_trace_id_is_picked_up_by_record_prov():
+    import asyncio
+    from app.trace import current_trace_id, get_trace, record_prov, trace_context, traced
+
+    @traced
+    def workflow():
+        record_prov('route', 'router', 'test', {}, {})
+        return current_trace_id()
+
+    async def tool_call():
+        record_prov('tool', 'tool', 'test', {}, {})
+
+    assert current_trace_id() is None
+    with trace_context() as trace_id:
+        assert workflow() == trace_id                   # nested workflows join the bound trace
+        asyncio.run(tool_call())                        # tasks inherit the context
+        record_prov('final', 'agent', 'test', {}, {})
+    assert current_trace_id() is None
+
+    events = [e['event_type'] for e in get_trace(trace_id)]
+    assert events == ['route', 'tool', 'final']
+    assert [e['event_type'] for e in get_trace(trace_id, last_n=2)] == ['tool', 'final']
+    assert workflow() != trace_id                       # standalone call starts its own trace
+
+
+def test_exporter_rotates_drops_and_reads_back_by_index(tmp_path):
+    from app.trace_export import INDEX_FILE, TraceExporter
+
+    def entry(trace_id, i):
+        return {'trace_id': trace_id, 'event_type': 'tool', 'inputs': {'i': i, 'pad': 'p' * 100}}
+
+    exp = TraceExporter(tmp_path, queue_size=8, batch_size=4, flush_seconds=60,
+                        max_file_bytes=1_000, max_files=2)
+    assert all(exp.submit(entry('a' if i % 2 else 'b', i)) for i in range(8))
+    assert not exp.submit(entry('a', 99)) and exp.counters['dropped'] == 1
+    exp.flush()
+    assert [e['inputs']['i'] for e in exp.read('a')] == [1, 3, 5, 7]
+
+    for i in range(8, 40):                              # fills and rotates several segments
+        exp.submit(entry('c', i)) or exp.flush()
+    exp.flush()
+    stats = exp.stats()
+    assert stats['segments'] == 2 and stats['rotations'] >= 2 and stats['segments_deleted'] >= 1
+    assert exp.read('a') == []                          # its segment was rotated away
+
+    reopened = TraceExporter(tmp_path)
+    reopened._load_index()
+    kept = [e['inputs']['i'] for e in reopened.read('c')]
+    assert kept == sorted(kept) and kept[-1] == 39
+    assert all('"a"' not in line for line in (tmp_path / INDEX_FILE).read_text().splitlines())
+
+
+def test_exporter_thread_flushes_record_prov(tmp_path, monkeypatch):
+    import app.trace as trace_mod
+    from app.trace_export import TraceExporter
+
+    exp = TraceExporter(tmp_path, flush_seconds=0.05)
+    monkeypatch.setattr(trace_mod, 'EXPORTER', exp)
+    exp.start()
+    try:
+        trace_id = trace_mod.record_prov('route', 'router', 'test', {'q': 1}, {}, 0.5)
+        trace_mod.clear_trace(trace_id)
+    finally:
+        exp.stop()
+    source, entries = trace_mod.load_trace(trace_id)
+    assert source == 'export' and entries[0]['inputs'] == {'q': 1}
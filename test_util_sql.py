@@ -0,0 +1,171 @@
+import sqlite3
+
+import pytest
+
+from app.config import settings
+from app.tools import util_tool
+from app.tools.util_tool import fetch_service_p95s, is_read_only, record_service_latencies, run_sql, sql_cache
+
+
+def _use_db(monkeypatch, path):
+    monkeypatch.setattr(settings, "local_db_path", str(path))
+
+
+def test_summary_table_tracks_latest_p95_per_service(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "svc.db")
+    record_service_latencies([
+        {"service": "payments", "p95_ms": 250.0, "ts": 100},
+        {"service": "orders", "p95_ms": 180.0, "ts": 100},
+        {"service": "auth", "p95_ms": 90.0, "ts": 100},
+    ])
+    record_service_latencies([{"service": "payments", "p95_ms": 310.0, "ts": 200},
+                              {"service": "orders", "p95_ms": 1.0, "ts": 50}])   # out-of-order, ignored
+    assert fetch_service_p95s(["payments", "orders", "missing"]) == {"payments": 310.0, "orders": 180.0}
+    plan = run_sql("EXPLAIN QUERY PLAN SELECT service, p95_ms FROM service_latency_summary WHERE service IN (?, ?)",
+                   ["payments", "orders"])
+    assert "PRIMARY KEY" in plan[0]["detail"]
+    assert {r["service"] for r in run_sql("SELECT * FROM services")} == {"payments", "orders", "auth"}
+
+
+def test_legacy_services_table_is_migrated(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE services (service TEXT, p95 REAL, p99 REAL)")
+    conn.execute("INSERT INTO services VALUES ('payments', 250, 400), ('orders', 180, NULL)")
+    conn.commit()
+    conn.close()
+    _use_db(monkeypatch, path)
+    # Reads never migrate (or drop) anything
+    assert fetch_service_p95s(["payments", "orders"]) == {}
+    assert len(run_sql("SELECT * FROM services")) == 2
+
+    assert util_tool.migrate_service_schema() == 2
+    assert fetch_service_p95s(["payments", "orders"]) == {"payments": 250.0, "orders": 180.0}
+    assert run_sql("SELECT p99 FROM services WHERE service = 'payments'") == [{"p99": 400.0}]
+    assert len(run_sql("SELECT * FROM services_legacy")) == 2
+    assert util_tool.migrate_service_schema() == 0
+
+
+def test_live_metrics_are_recorded_in_batches(tmp_path, monkeypatch):
+    import asyncio
+
+    from app.schemas import MetricsData, MetricsResult
+    from app.tools import metrics_client
+
+    _use_db(monkeypatch, tmp_path / "live.db")
+    monkeypatch.setattr(settings, "sql_record_live_metrics", True)
+    monkeypatch.setattr(settings, "sql_record_batch_rows", 3)
+    monkeypatch.setattr(settings, "sql_record_flush_seconds", 3600.0)
+    writes = []
+    real = util_tool.record_service_latencies
+    monkeypatch.setattr(util_tool, "record_service_latencies", lambda rows: writes.append(len(rows)) or real(rows))
+
+    def reading(service, p95):
+        return MetricsResult(success=True, data=MetricsData(service=service, window="5m", p95_latency=p95))
+
+    asyncio.run(metrics_client._remember([reading("payments", 300.0), reading("orders", 120.0)]))
+    assert writes == []
+    asyncio.run(metrics_client._remember([reading("auth", 80.0)]))
+    assert writes == [3]
+    asyncio.run(metrics_client._remember([reading("payments", 310.0)]))
+    assert metrics_client.flush_recorded_latencies() == 1
+    assert fetch_service_p95s(["payments", "auth"]) == {"payments": 310.0, "auth": 80.0}
+
+
+def test_reads_use_read_only_connection(tmp_path, monkeypatch):
+    _use_db(monkeypatch, tmp_path / "ro.db")
+    run_sql("CREATE TABLE t (x INTEGER)")
+    assert is_read_only("SELECT * FROM t") and not is_read_only("WITH x AS (SELECT 1) DELETE FROM t")
+    rows = run_sql("SELECT count(*) AS n FROM t")
+    assert rows == [{"n": 0}]
+    with pytest.raises(sqlite3.OperationalError):
+        util_tool.get_connection(readonly=True).execute("INSERT INTO t VALUES (1)")
+
+
+def test_result_cache_is_invalidated_by_table_writes(tmp_path, monkeypatch):
+    path = tmp_path / "cache.db"
+    _use_db(monkeypatch, path)
+    run_sql("CREATE TABLE t (x INTEGER)")
+    run_sql("CREATE TABLE other (y INTEGER)")
+    hits = sql_cache.hits
+    assert run_sql("SELECT count(*) AS n FROM t") == [{"n": 0}]
+    assert run_sql("select   COUNT(*) as n from t;") == [{"n": 0}]          # normalized to the same key
+    assert sql_cache.hits == hits + 1
+    run_sql("INSERT INTO other VALUES (1)")                                 # unrelated table
+    assert run_sql("SELECT count(*) AS n FROM t") == [{"n": 0}]
+    assert sql_cache.hits == hits + 2
+    conn = sqlite3.connect(path)                                            # writer outside run_sql
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    conn.close()
+    assert run_sql("SELECT count(*) AS n FROM t") == [{"n": 1}]
+    assert sql_cache.trace_info()["hit"] is False
+
+
+def test_concurrent_first_reads_never_run_ddl(tmp_path, monkeypatch):
+    import threading
+
+    path = tmp_path / "first.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE services_seen (service TEXT, p95 REAL)")       # made outside run_sql
+    conn.execute("INSERT INTO services_seen VALUES ('payments', 250)")
+    conn.commit()
+    conn.close()
+    _use_db(monkeypatch, path)
+    barrier, out = threading.Barrier(32), []
+
+    def reader(i):
+        barrier.wait()
+        if i % 8 == 0:
+            util_tool.install_sql_cache_triggers()                          # startup racing first reads
+        out.append(run_sql("SELECT p95 FROM services_seen WHERE service = ?", ["payments"]))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == [[{"p95": 250.0}]] * 32
+    hits = sql_cache.hits
+    assert run_sql("SELECT p95 FROM services_seen WHERE service = ?", ["payments"]) == [{"p95": 250.0}]
+    assert sql_cache.hits == hits + 1
+
+
+def test_failed_write_rolls_back_pooled_connection(tmp_path, monkeypatch):
+    import threading
+
+    _use_db(monkeypatch, tmp_path / "tx.db")
+    run_sql("CREATE TABLE u (k TEXT PRIMARY KEY)")
+    run_sql("INSERT INTO u VALUES ('a')")
+    assert "error" in run_sql("INSERT INTO u VALUES ('a')")[0]           # UNIQUE constraint
+    assert not util_tool.get_connection(readonly=False).in_transaction
+
+    out = []
+    t = threading.Thread(target=lambda: out.append(run_sql("INSERT INTO u VALUES ('b')")))
+    t.start()
+    t.join()
+    assert out == [[]]                                                   # not "database is locked"
+    assert run_sql("SELECT count(*) AS n FROM u") == [{"n": 2}]
+
+
+def test_close_connections_resets_every_thread(tmp_path, monkeypatch):
+    import threading
+
+    _use_db(monkeypatch, tmp_path / "close.db")
+    run_sql("CREATE TABLE c (x INTEGER)")
+    ready, closed, out = threading.Event(), threading.Event(), []
+
+    def worker():
+        run_sql("INSERT INTO c VALUES (1)")
+        ready.set()
+        closed.wait()
+        out.append(run_sql("INSERT INTO c VALUES (2)"))
+
+    t = threading.Thread(target=worker)
+    t.start()
+    ready.wait()
+    util_tool.close_connections()
+    closed.set()
+    t.join()
+    assert out == [[]]
+    assert run_sql("SELECT count(*) AS n FROM c") == [{"n": 2}]
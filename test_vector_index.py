@@ -0,0 +1,404 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from app.config import settings
+from app.tools import ann_index, embeddings
+from app.tools.ann_index import IVFFlatIndex, build_local_index
+from app.tools.embeddings import HashingEmbedder, embed_query
+from app.tools.vector_tool import call_vector
+
+DOCS = {
+    "saml_setup.md": "SAML configuration guide for the internal dashboard: identity provider, metadata, SSO login.",
+    "oncall.md": "On-call rotation handbook: paging policy, escalation and incident review.",
+    "payments_runbook.md": "Payments service runbook: latency alerts, p95 dashboards and rollback steps.",
+}
+
+
+def _corpus(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for name, text in DOCS.items():
+        (docs_dir / name).write_text(text, encoding="utf-8")
+    return docs_dir
+
+
+def test_ivf_index_roundtrips_through_mmap(tmp_path):
+    rng = np.random.default_rng(0)
+    vecs = embeddings.normalize(rng.normal(size=(400, 32)).astype(np.float32))
+    index = IVFFlatIndex.build(vecs, [{"i": i} for i in range(400)], "test", n_lists=16)
+    index.save(tmp_path / "idx")
+    loaded = IVFFlatIndex.load(tmp_path / "idx")
+    assert isinstance(loaded.vectors, np.memmap)
+    hits = loaded.search(vecs[123], k=3, nprobe=4)
+    assert hits[0][1] == 123 and abs(hits[0][0] - 1.0) < 1e-5
+    # exhaustive probing matches brute force
+    exact = np.argsort(-(vecs @ vecs[7]))[:5].tolist()
+    assert [i for _, i in loaded.search(vecs[7], k=5, nprobe=16)] == exact
+
+
+def test_call_vector_uses_local_index_without_qdrant(tmp_path, monkeypatch):
+    from app.tools import content_store, sparse_index, vector_tool
+    from app.tools.vector_tool import call_dense, min_score
+
+    docs_dir = _corpus(tmp_path)
+    monkeypatch.setattr(settings, "use_qdrant", False)
+    monkeypatch.setattr(settings, "seed_data_path", str(docs_dir))
+    monkeypatch.setattr(settings, "vector_index_path", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "sparse_index_path", str(tmp_path / "sparse"))
+    monkeypatch.setattr(settings, "embedding_cache_path", str(tmp_path / "emb_cache"))
+    monkeypatch.setattr(settings, "content_store_path", str(tmp_path / "content"))
+    monkeypatch.setattr(embeddings, "_embedder", HashingEmbedder(1024))
+    ann_index.reset_local_index()
+    sparse_index.reset_sparse_index()
+    content_store.reset_content_store()
+    # chunk-text reads for term coverage must stay off the event loop's thread
+    reader_threads = []
+
+    def fetch_text(pid):
+        reader_threads.append(threading.get_ident())
+        return content_store.fetch_text(pid)
+
+    monkeypatch.setattr(vector_tool, "fetch_text", fetch_text)
+    try:
+        dense = asyncio.run(call_dense("how to configure SAML for internal dashboard?"))
+        assert dense.success and dense.source == "local_ann"
+        assert dense.top.payload["title"] == "saml_setup.md"
+        assert (tmp_path / "index" / "vectors.npy").exists()
+
+        # Hybrid: BM25's top hit covers the query's keywords, so it clears the threshold
+        res = asyncio.run(call_vector("SAML"))
+        assert res.success and res.source == "hybrid"
+        assert res.top.payload["title"] == "saml_setup.md"
+        assert res.top.dense_score is not None and res.top.sparse_score is not None
+        assert res.score >= min_score()
+        assert len({h.payload["title"] for h in res.hits}) == len(res.hits)
+
+        # Off-topic: stopwords don't match, one shared word isn't enough coverage,
+        # and the reported score is the real (low) dense cosine
+        for query in ("what is the weather like in the city today", "weather review for the city today"):
+            off = asyncio.run(call_vector(query))
+            assert off.score < min_score()
+            assert off.score == (off.top.dense_score or 0.0 if off.hits else 0.0)
+        assert reader_threads and threading.get_ident() not in reader_threads
+    finally:
+        ann_index.reset_local_index()
+        sparse_index.reset_sparse_index()
+        content_store.reset_content_store()
+
+
+def test_rrf_fuse_rewards_agreement():
+    from app.tools.vector_tool import rrf_fuse
+
+    fused = rrf_fuse([["a", "b", "c"], ["c", "a", "d"]], k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b", "d"]
+    assert abs(fused[0][1] - (1 / 61 + 1 / 62)) < 1e-12
+    assert rrf_fuse([[], []]) == []
+    assert [key for key, _ in rrf_fuse([["a", "b"], ["b"]], weights=[1.0, 0.0])] == ["a", "b"]
+
+
+def test_sparse_index_scores_bm25_over_postings(tmp_path, monkeypatch):
+    from app.tools.sparse_index import SparseIndex, build_sparse_index
+    from app.tools.vector_tool import call_sparse
+
+    titles, docs = list(DOCS), list(DOCS.values())
+    index = build_sparse_index(docs, [{"title": t, "text": d} for t, d in zip(titles, docs)],
+                               path=tmp_path / "sparse")
+    assert index.nnz == sum(len(set(embeddings.tokenize(d))) for d in docs)
+    loaded = SparseIndex.load(tmp_path / "sparse")
+    hits = loaded.search("rollback the payments service", k=3)
+    assert loaded.payloads[hits[0][1]]["title"] == "payments_runbook.md"
+    assert loaded.search("kubernetes") == []
+
+    monkeypatch.setattr(settings, "use_qdrant", False)
+    monkeypatch.setattr(settings, "sparse_index_path", str(tmp_path / "sparse"))
+    from app.tools import sparse_index
+    sparse_index.reset_sparse_index()
+    try:
+        res = asyncio.run(call_sparse("escalation paging"))
+        assert res.source == "local_sparse" and res.top.payload["title"] == "oncall.md"
+    finally:
+        sparse_index.reset_sparse_index()
+
+
+def test_reindex_embeds_only_changed_docs(tmp_path, monkeypatch):
+    from app.tools import indexer, sparse_index
+
+    docs_dir = _corpus(tmp_path)
+    monkeypatch.setattr(settings, "seed_data_path", str(docs_dir))
+    monkeypatch.setattr(settings, "vector_index_path", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "sparse_index_path", str(tmp_path / "sparse"))
+    monkeypatch.setattr(settings, "index_manifest_path", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(settings, "content_store_path", str(tmp_path / "content"))
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(embeddings, "_embedder", HashingEmbedder(1024))
+    try:
+        first = indexer.reindex()
+        assert first["added"] == 3 and first["embedded"] == 3
+        assert first["docs"] == 3 and first["chunks"] == 3 and first["chunks_per_sec"] > 0
+        again = indexer.reindex()
+        assert again["unchanged"] == 3 and again["embedded"] == 0
+
+        (docs_dir / "oncall.md").write_text("On-call rotation: SAML certificate rotation checklist.", encoding="utf-8")
+        (docs_dir / "payments_runbook.md").unlink()
+        stats = indexer.reindex()
+        assert (stats["changed"], stats["removed"], stats["embedded"]) == (1, 1, 1)
+
+        index = ann_index.get_local_index()
+        assert sorted(p["title"] for p in index.payloads) == ["oncall.md", "saml_setup.md"]
+        top = index.search(embed_query("SAML certificate rotation checklist"), k=1)[0][1]
+        assert index.payloads[top]["title"] == "oncall.md"
+        assert sparse_index.get_sparse_index().search("rollback payments") == []
+
+        # New chunk boundaries: nothing can be reused, every doc is re-chunked and re-embedded
+        monkeypatch.setattr(settings, "chunk_max_tokens", 4)
+        monkeypatch.setattr(settings, "chunk_overlap_tokens", 1)
+        rechunked = indexer.reindex()
+        assert rechunked["added"] == 2 and rechunked["embedded"] == rechunked["chunks"] > 2
+        assert indexer.load_manifest()["chunking"] == {"max_tokens": 4, "overlap_tokens": 1}
+
+        # Another process mid-reindex holds the flock: a scheduled run skips instead of racing it
+        import fcntl
+        with open(str(tmp_path / "manifest.json") + ".lock", "a") as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            assert indexer.reindex(wait=False) is None
+            scheduler = indexer.ReindexScheduler(1.0)
+            assert asyncio.run(scheduler.run_once()) is None and scheduler.last_error is None
+        assert indexer.reindex(wait=False)["unchanged"] == 2
+    finally:
+        ann_index.reset_local_index()
+        sparse_index.reset_sparse_index()
+
+
+def test_qdrant_catches_up_after_local_only_reindex(tmp_path, monkeypatch):
+    from app.tools import indexer, sparse_index
+
+    class FakeSync:
+        runs = []
+
+        def __init__(self, client, dim, rebuild):
+            self.rebuild, self.titles, self.stale = rebuild, set(), None
+            FakeSync.runs.append(self)
+
+        def upsert(self, chunks, vectors, avgdl):
+            self.titles |= {c.title for c in chunks}
+
+        def finish(self, stale):
+            self.stale = list(stale)
+            return "docs_1"
+
+        def abort(self):
+            pass
+
+    docs_dir = _corpus(tmp_path)
+    monkeypatch.setattr(settings, "seed_data_path", str(docs_dir))
+    monkeypatch.setattr(settings, "vector_index_path", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "sparse_index_path", str(tmp_path / "sparse"))
+    monkeypatch.setattr(settings, "index_manifest_path", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(settings, "content_store_path", str(tmp_path / "content"))
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    monkeypatch.setattr(embeddings, "_embedder", HashingEmbedder(1024))
+    monkeypatch.setattr(indexer, "QdrantSync", FakeSync)
+    qdrant = object()
+    try:
+        assert indexer.reindex(client=qdrant)["collection"] == "docs_1"
+        assert FakeSync.runs[-1].rebuild and len(FakeSync.runs[-1].titles) == 3
+
+        # Qdrant is down for this run: only the local indexes move on
+        (docs_dir / "oncall.md").write_text("On-call rotation: SAML certificate rotation checklist.", encoding="utf-8")
+        (docs_dir / "payments_runbook.md").unlink()
+        assert indexer.reindex()["changed"] == 1 and len(FakeSync.runs) == 1
+
+        # Locally nothing changed since, but Qdrant still gets the edit and the deletion
+        stats = indexer.reindex(client=qdrant)
+        assert stats["unchanged"] == 2 and stats["embedded"] == 0
+        sync = FakeSync.runs[-1]
+        assert not sync.rebuild and sync.titles == {"oncall.md"}
+        assert len(sync.stale) == 1
+        assert indexer.load_manifest()["qdrant"]["docs"].keys() == {"oncall.md", "saml_setup.md"}
+        indexer.reindex(client=qdrant)
+        assert len(FakeSync.runs) == 2          # in sync: nothing to publish
+    finally:
+        ann_index.reset_local_index()
+        sparse_index.reset_sparse_index()
+
+
+def test_chunking_streams_overlapping_windows(tmp_path, monkeypatch):
+    from app.tools import indexer, sparse_index
+    from app.tools.corpus import chunk_text
+    from app.tools.pipeline import batched, embed_batches
+
+    words = [f"w{i}" for i in range(10)]
+    chunks = list(chunk_text(" ".join(words), max_tokens=4, overlap=1))
+    assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+    assert list(chunk_text("", max_tokens=4, overlap=1)) == []
+
+    out = list(embed_batches(batched(range(7), 3), lambda b: np.array(b) * 2, workers=3))
+    assert [b for b, _ in out] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert [v.tolist() for _, v in out] == [[0, 2, 4], [6, 8, 10], [12]]
+
+    docs_dir = _corpus(tmp_path)
+    monkeypatch.setattr(settings, "seed_data_path", str(docs_dir))
+    monkeypatch.setattr(settings, "vector_index_path", str(tmp_path / "index"))
+    monkeypatch.setattr(settings, "sparse_index_path", str(tmp_path / "sparse"))
+    monkeypatch.setattr(settings, "index_manifest_path", str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(settings, "content_store_path", str(tmp_path / "content"))
+    monkeypatch.setattr(settings, "embedding_cache_path", str(tmp_path / "emb_cache"))
+    monkeypatch.setattr(settings, "chunk_max_tokens", 5)
+    monkeypatch.setattr(settings, "chunk_overlap_tokens", 1)
+    monkeypatch.setattr(settings, "index_batch_size", 2)
+    monkeypatch.setattr(embeddings, "_embedder", HashingEmbedder(1024))
+    try:
+        stats = indexer.reindex()
+        index = ann_index.get_local_index()
+        assert stats["docs"] == 3 and stats["chunks"] == len(index) > 3
+        assert not (tmp_path / "index.spool").exists()
+        manifest = indexer.load_manifest()
+        assert sum(d["chunks"] for d in manifest["docs"].values()) == len(index)
+        top = index.search(embed_query("rollback steps"), k=1)[0][1]
+        assert index.payloads[top]["title"] == "payments_runbook.md" and index.payloads[top]["chunk"] > 0
+
+        # Payloads are slim; the full chunk text comes from the content store by point id
+        from app.tools.content_store import fetch_text
+        from app.tools.corpus import point_id
+        payload = index.payloads[top]
+        assert set(payload) == {"title", "chunk", "snippet"}
+        text = fetch_text(point_id(payload["title"], payload["chunk"]))
+        assert "rollback" in text and text.startswith(payload["snippet"])
+    finally:
+        from app.tools.content_store import reset_content_store
+        ann_index.reset_local_index()
+        sparse_index.reset_sparse_index()
+        reset_content_store()
+
+
+def test_embedding_cache_skips_encoding_seen_texts(tmp_path, monkeypatch):
+    from app.tools.embedding_cache import EmbeddingCache
+
+    monkeypatch.setattr(settings, "embedding_cache_path", str(tmp_path / "emb_cache"))
+    embedder = HashingEmbedder(256)
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return embedder.encode(texts)
+
+    cache = EmbeddingCache(tmp_path / "emb_cache", embedder.model_id, embedder.dim)
+    texts = list(DOCS.values())
+    first = cache.encode(texts, encode)
+    second = cache.encode(texts + ["a brand new query"], encode)
+    assert calls == [texts, ["a brand new query"]]
+    assert np.allclose(first, second[:3], atol=1e-3)
+    assert isinstance(cache._vectors, np.memmap) and cache._vectors.dtype == np.float16
+
+    # A second process (fresh instance) sees the rows; another model does not
+    reopened = EmbeddingCache(tmp_path / "emb_cache", embedder.model_id, embedder.dim)
+    assert len(reopened) == 4 and reopened.get_many([texts[0]])[0] is not None
+    other = EmbeddingCache(tmp_path / "emb_cache", "hashing-v1-512", 512)
+    assert other.get_many([texts[0]]) == [None]
+
+    # embed_texts / embed_query go through the cache for the active model
+    monkeypatch.setattr(embeddings, "_embedder", embedder)
+    q = embed_query(texts[1])
+    assert np.allclose(q, first[1], atol=1e-3)
+
+
+def test_embedding_cache_index_and_torn_tail(tmp_path):
+    from app.tools.embedding_cache import EmbeddingCache
+
+    embedder = HashingEmbedder(64)
+    cache = EmbeddingCache(tmp_path, embedder.model_id, embedder.dim)
+    texts = [f"text number {i}" for i in range(300)]
+    for batch in (texts[:100], texts[100:250], texts[250:]):
+        assert cache.put_many(batch, embedder.encode(batch)) == len(batch)
+    got = cache.get_many(texts[::7] + ["never stored"])
+    assert len(cache._prefix) == 300 and np.all(cache._prefix[1:] >= cache._prefix[:-1])
+    assert all(v is not None for v in got[:-1]) and got[-1] is None
+    assert np.allclose(got[1], embedder.encode([texts[7]])[0], atol=1e-3)
+    assert (cache.hits, cache.misses) == (len(texts[::7]), 1)
+
+    # A writer that died mid-append leaves a vector without its key and half a key
+    with open(cache.path / "vectors.bin", "ab") as f:
+        f.write(b"\0" * embedder.dim * 2 * 2)
+    with open(cache.path / "keys.bin", "ab") as f:
+        f.write(b"\1" * 5)
+    assert cache.put_many(["after the crash"], embedder.encode(["after the crash"])) == 1
+    assert (cache.path / "keys.bin").stat().st_size == 301 * 16
+    reopened = EmbeddingCache(tmp_path, embedder.model_id, embedder.dim)
+    assert len(reopened) == 301 and reopened.get_many(["after the crash", texts[0]])[1] is not None
+
+
+def test_qdrant_searches_go_out_as_one_batch(monkeypatch):
+    from app.tools import qdrant_store
+
+    sent = []
+
+    async def fake_http(url, params, meta, method="GET", json_body=None):
+        sent.append((url, json_body))
+        return {"result": [[{"id": "a", "score": 0.9, "payload": {"title": f"t{i}"}}]
+                           for i, _ in enumerate(json_body["searches"])]}
+
+    monkeypatch.setattr(qdrant_store, "execute_http_tool_async", fake_http)
+    monkeypatch.setattr(settings, "qdrant_prefer_grpc", False)
+    monkeypatch.setattr(settings, "qdrant_quantization", "scalar")
+    monkeypatch.setattr(settings, "qdrant_search_hnsw_ef", 64)
+    searches = [("dense", np.ones(3, np.float32), 5),
+                ("sparse", (np.array([7, 9]), np.ones(2, np.float32)), 5)]
+    results = asyncio.run(qdrant_store.search_batch(searches, "docs"))
+    assert len(sent) == 1 and sent[0][0].endswith("/collections/docs/points/search/batch")
+    dense, sparse = sent[0][1]["searches"]
+    assert dense["params"] == {"hnsw_ef": 64, "quantization": {"rescore": True, "oversampling": 2.0}}
+    assert sparse["vector"] == {"name": "bm25", "vector": {"indices": [7, 9], "values": [1.0, 1.0]}}
+    assert "params" not in sparse
+    assert dense["with_payload"] == ["title", "chunk", "snippet"]
+    assert [r[0].payload["title"] for r in results] == ["t0", "t1"]
+
+
+def test_make_snippet_cuts_at_word_boundary():
+    from app.tools.corpus import make_snippet
+
+    assert make_snippet("  alpha\n\nbeta   gamma ", 100) == "alpha beta gamma"
+    assert make_snippet("alpha beta gamma", 12) == "alpha beta"
+    assert make_snippet("abcdefghij", 4) == "abcd"
+
+
+def test_grpc_searches_go_through_the_vector_breaker(monkeypatch):
+    import pytest
+
+    from app import circuit_breaker
+    from app.circuit_breaker import CircuitOpenError
+    from app.tools import qdrant_store
+
+    calls = []
+
+    class DeadQdrant:
+        async def search_batch(self, collection_name, requests):
+            calls.append(collection_name)
+            raise ConnectionRefusedError("qdrant is down")
+
+    async def fake_client():
+        return DeadQdrant()
+
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(circuit_breaker, "_budgets", {})
+    monkeypatch.setattr(settings, "qdrant_prefer_grpc", True)
+    monkeypatch.setattr(settings, "http_backoff_base", 0.001)
+    monkeypatch.setattr(qdrant_store, "get_async_client", fake_client)
+    monkeypatch.setattr(qdrant_store, "_grpc_search", lambda *a: a)
+    searches = [("dense", np.ones(3, np.float32), 5)]
+
+    async def run():
+        threshold = qdrant_store.DEFAULT_TOOL_REGISTRY["vector_tool"].failure_threshold
+        for _ in range(threshold):
+            try:
+                await qdrant_store.search_batch(searches, "docs")
+            except (ConnectionRefusedError, CircuitOpenError):
+                pass
+        sent = len(calls)
+        with pytest.raises(CircuitOpenError):
+            await qdrant_store.search_batch(searches, "docs")
+        return sent
+
+    sent = asyncio.run(run())
+    assert sent == len(calls) >= 1       # the open breaker short-circuits without touching Qdrant